@@ -0,0 +1,282 @@
+""" Module for analysing the scraped corpus as NumPy arrays. """
+from datetime import datetime
+import json
+import logging
+import numpy as np
+import os
+import pg
+import shutil
+import struct
+import tempfile
+
+# Configuration variables
+cacheDir = "{0}/analytics".format(os.path.dirname(os.path.abspath(__file__)))
+
+# Rows stored up to this many seconds before the last one read are read
+# again on refresh, in case they were committed late
+refreshSlack = 3600
+
+# Cached columns per table, as (name, SQL expression, type in the binary
+# COPY format); NULLs are read as 0, and times as seconds since the epoch
+columns = {
+    'message': [
+        ('sid', "x.sid", '>i8'),
+        ('topic', "coalesce(x.topic, 0)", '>i4'),
+        ('topic_position', "coalesce(x.topic_position, 0)", '>i4'),
+        ('member', "coalesce(x.member, 0)", '>i4'),
+        ('post_time',
+         "coalesce(extract(epoch FROM x.post_time), 0)::int8", '>i8'),
+        ('stored',
+         "coalesce(extract(epoch FROM x.db_update_time), 0)::float8", '>f8')
+    ],
+    'topic': [
+        ('sid', "x.sid", '>i4'),
+        ('board', "coalesce(x.board, 0)", '>i4'),
+        ('stored',
+         "coalesce(extract(epoch FROM x.db_update_time), 0)::float8", '>f8')
+    ]
+}
+
+# Binary COPY files open with a signature, flags and the length of a header
+# extension, and close with a field count of -1
+copySignature = "PGCOPY\n\377\r\n\0"
+copyHeaderSize = len(copySignature) + 8
+copyTrailerSize = 2
+
+
+def _loadState():
+    """Load the cache generation and high-water mark of each table."""
+    statePath = "{0}/state.json".format(cacheDir)
+    if not os.path.exists(statePath):
+        return {}
+    f = open(statePath, 'r')
+    state = json.load(f)
+    f.close()
+    return state
+
+
+def _saveState(state):
+    """Save the cache generation and high-water mark of each table."""
+    """Written aside and swapped in, so that readers never see half of it."""
+    statePath = "{0}/state.json".format(cacheDir)
+    f = open("{0}.tmp".format(statePath), 'w')
+    json.dump(state, f, indent=2, sort_keys=True)
+    f.close()
+    os.rename("{0}.tmp".format(statePath), statePath)
+
+
+def _tableDir(tableLabel, generation):
+    """Directory of a generation of a table's cached columns."""
+    return "{0}/{1}.{2}".format(cacheDir, tableLabel, generation)
+
+
+def _rowType(tableLabel):
+    """Layout of a row of a table's columns in the binary COPY format."""
+    fields = [('count_fields', '>i2')]
+    for name, expression, columnType in columns[tableLabel]:
+        fields.append(("{0}_size".format(name), '>i4'))
+        fields.append((name, columnType))
+    return np.dtype(fields)
+
+
+def _read(tableLabel, since):
+    """Read the cached columns of the rows of a table stored after since
+    (in seconds since the epoch, or None for all)."""
+    """The rows are copied to a scratch file and taken apart in place, as
+    none of the columns can be NULL and so every row has the same layout."""
+    rowType = _rowType(tableLabel)
+    handle, path = tempfile.mkstemp(dir=cacheDir)
+    f = os.fdopen(handle, 'w+b')
+    try:
+        pg.copyRowsStoredSince(
+            tableLabel, [expression for name, expression, columnType
+                         in columns[tableLabel]], since, f)
+        size = f.tell()
+        f.seek(0)
+        header = f.read(copyHeaderSize)
+        if header[:len(copySignature)] != copySignature:
+            raise Exception("Unexpected COPY header for {0}".format(
+                tableLabel))
+        offset = copyHeaderSize + struct.unpack(">i", header[-4:])[0]
+    finally:
+        f.close()
+    try:
+        countRows = (size - offset - copyTrailerSize) // rowType.itemsize
+        data = {}
+        if countRows == 0:
+            for name, expression, columnType in columns[tableLabel]:
+                data[name] = np.empty(
+                    0, np.dtype(columnType).newbyteorder('='))
+            return data
+        rows = np.memmap(path, dtype=rowType, mode='r', offset=offset,
+                         shape=(countRows,))
+        if (rows['count_fields'] != len(columns[tableLabel])).any():
+            raise Exception("Unexpected COPY rows for {0}".format(tableLabel))
+        for name, expression, columnType in columns[tableLabel]:
+            data[name] = rows[name].astype(
+                np.dtype(columnType).newbyteorder('='))
+        del rows
+        return data
+    finally:
+        os.remove(path)
+
+
+def load(tableLabel):
+    """Map the cached columns of a table into memory, as a dictionary of
+    arrays sorted by sid."""
+    state = _loadState()
+    if tableLabel not in state:
+        raise Exception("No cached columns for {0}; refresh first".format(
+            tableLabel))
+    path = _tableDir(tableLabel, state[tableLabel]['generation'])
+    data = {}
+    for name, expression, columnType in columns[tableLabel]:
+        data[name] = np.load("{0}/{1}.npy".format(path, name), mmap_mode='r')
+    return data
+
+
+def refresh(tableLabel, full=False):
+    """Bring the cached columns of a table up to date with the DB. Returns
+    the number of rows added or changed."""
+    """Only rows stored since the last refresh are read, unless full is
+    passed. The columns are rewritten as a new generation, so that arrays
+    mapped from the last one stay valid. CAVEAT: Rows deleted from the DB
+    stay cached until a full refresh."""
+    if not os.path.exists(cacheDir):
+        os.makedirs(cacheDir)
+    state = _loadState()
+    tableState = state.get(tableLabel)
+    since = None
+    if tableState is not None and not full:
+        since = tableState['watermark'] - refreshSlack
+    data = _read(tableLabel, since)
+    generation = 1
+    if tableState is not None:
+        generation = tableState['generation'] + 1
+    if since is not None:
+        # Leave out rows read again unchanged
+        cached = load(tableLabel)
+        known = np.zeros(len(data['sid']), dtype=bool)
+        if len(cached['sid']) > 0:
+            index = np.searchsorted(cached['sid'], data['sid'])
+            index[index == len(cached['sid'])] = 0
+            known = ((cached['sid'][index] == data['sid']) &
+                     (cached['stored'][index] == data['stored']))
+        if known.all():
+            return 0
+        for name in data:
+            data[name] = data[name][~known]
+    countRows = len(data['sid'])
+    if since is not None:
+        # Changed rows replace their cached versions
+        keep = ~np.in1d(cached['sid'], data['sid'])
+        for name in data:
+            data[name] = np.concatenate([cached[name][keep], data[name]])
+        del cached
+    order = np.argsort(data['sid'], kind='mergesort')
+    path = _tableDir(tableLabel, generation)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    for name in data:
+        np.save("{0}/{1}.npy".format(path, name), data[name][order])
+    watermark = 0.0
+    if len(data['stored']) > 0:
+        watermark = float(data['stored'].max())
+    if tableState is not None:
+        watermark = max(watermark, tableState['watermark'])
+    state = _loadState()
+    state[tableLabel] = {'generation': generation, 'watermark': watermark}
+    _saveState(state)
+    if tableState is not None:
+        shutil.rmtree(_tableDir(tableLabel, tableState['generation']), True)
+    logging.info("Cached {0} rows of {1}.".format(len(order), tableLabel))
+    return countRows
+
+
+def refreshAll(full=False):
+    """Refresh the cached columns of every table. Returns rows added or
+    changed per table."""
+    counts = {}
+    for tableLabel in columns:
+        counts[tableLabel] = refresh(tableLabel, full)
+    return counts
+
+
+def _seconds(timestamp):
+    """Convert a naive timestamp to seconds since the epoch."""
+    return int((timestamp - datetime(1970, 1, 1)).total_seconds())
+
+
+def _postedWithin(messages, since, until):
+    """Mask of the messages posted from since up to until."""
+    mask = np.ones(len(messages['sid']), dtype=bool)
+    if since is not None:
+        mask &= messages['post_time'] >= _seconds(since)
+    if until is not None:
+        mask &= messages['post_time'] < _seconds(until)
+    return mask
+
+
+def countBy(keys):
+    """Count the occurrences of each integer key, as sorted arrays of the
+    distinct keys and their counts."""
+    """Keys spanning a range not much wider than their number are counted
+    into bins, otherwise sorted."""
+    if len(keys) == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    low = int(keys.min())
+    high = int(keys.max())
+    if high - low > 4 * len(keys) + 1024:
+        return np.unique(keys, return_counts=True)
+    counts = np.bincount(keys - low)
+    values = np.nonzero(counts)[0]
+    return values + low, counts[values]
+
+
+def postsPerMember(since=None, until=None):
+    """Count the posts of each member, posted from since up to until (naive
+    forum times). Returns arrays of member IDs and counts."""
+    messages = load('message')
+    mask = _postedWithin(messages, since, until) & (messages['member'] > 0)
+    return countBy(messages['member'][mask])
+
+
+def postsPerBoard(since=None, until=None):
+    """Count the posts on each board, posted from since up to until (naive
+    forum times). Returns arrays of board IDs and counts."""
+    """Messages of topics we haven't stored yet count towards board 0."""
+    messages = load('message')
+    topics = load('topic')
+    mask = _postedWithin(messages, since, until)
+    topicIds = messages['topic'][mask]
+    index = np.searchsorted(topics['sid'], topicIds)
+    index[index == len(topics['sid'])] = 0
+    boards = np.zeros(len(topicIds), np.int32)
+    if len(topics['sid']) > 0:
+        found = topics['sid'][index] == topicIds
+        boards[found] = topics['board'][index[found]]
+    return countBy(boards)
+
+
+def postsPerBucket(bucketSeconds=86400, since=None, until=None):
+    """Count the posts in each bucket of time, posted from since up to until
+    (naive forum times). Returns arrays of bucket start times (as
+    datetime64) and counts; empty buckets are left out."""
+    messages = load('message')
+    mask = _postedWithin(messages, since, until)
+    buckets, counts = countBy(messages['post_time'][mask] // bucketSeconds)
+    return (buckets * bucketSeconds).astype('datetime64[s]'), counts
+
+
+def replyIntervals(since=None, until=None):
+    """Seconds between each post and the one before it in its topic, for
+    posts from since up to until (naive forum times) following another."""
+    messages = load('message')
+    mask = _postedWithin(messages, since, until)
+    topicIds = messages['topic'][mask]
+    order = np.lexsort((messages['topic_position'][mask], topicIds))
+    topicIds = topicIds[order]
+    postTimes = messages['post_time'][mask][order]
+    following = topicIds[1:] == topicIds[:-1]
+    return (postTimes[1:] - postTimes[:-1])[following]
@@ -0,0 +1,289 @@
+""" Offline benchmarks of the crawl, parse, load and import paths. """
+import bitcointalk
+import codecs
+import logging
+import memoizer
+import multiprocessing
+import os
+import pg
+import replay_server
+import resource
+import shutil
+import subprocess
+import sys
+import synthetic
+import tempfile
+import time
+import traceback
+
+# Crawl configuration
+startTopicId = 1
+stopTopicId = 20
+maxPagesPerTopic = 5
+# Crawl through the staged pipeline of memoizer.crawlTopics
+usePipeline = False
+
+# Stand-in configuration; synthetic pages are shaped by the settings in
+# synthetic.py, otherwise the example pages are rewritten
+latency = 0.0
+errorRate = 0.0
+padding = 0
+useSynthetic = False
+
+# Parse and load benchmark configuration
+numParsePages = 50
+
+# Import benchmark configuration; the heavy modules are reported when an
+# import drags them in
+importModules = ['records', 'bitcointalk', 'memoizer', 'pg']
+heavyModules = ['psycopg2', 'requests', 'unittest']
+importRepeats = 5
+numWorkers = 8
+
+rootDir = os.path.dirname(os.path.abspath(__file__))
+
+
+def _serve(portQueue):
+    """Run the stand-in, reporting its port back to the parent."""
+    replay_server.latency = latency
+    replay_server.errorRate = errorRate
+    replay_server.padding = padding
+    if useSynthetic:
+        replay_server.pageSource = synthetic.page
+    server = replay_server.ReplayServer(
+        ("localhost", 0), replay_server.ReplayHandler)
+    portQueue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def startServer():
+    """Start the stand-in in its own process, so its CPU isn't counted."""
+    portQueue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(portQueue,))
+    process.daemon = True
+    process.start()
+    port = portQueue.get()
+    return process, "http://localhost:{0}/index.php".format(port)
+
+
+def _setUpTables():
+    """Swap in benchmark tables so that real data is left alone."""
+    tablesOriginal = pg.tables
+    pg.tables = {}
+    for key, table in tablesOriginal.iteritems():
+        pg.tables[key] = "{0}_bench".format(table)
+    cur = pg.cursor()
+    for key, table in pg.tables.iteritems():
+        cur.execute("""DROP TABLE IF EXISTS {0}""".format(table))
+        cur.execute("""CREATE TABLE {0} (LIKE {1} INCLUDING ALL)""".format(
+            table, tablesOriginal[key]))
+    cur.execute("""COMMIT""")
+    return tablesOriginal
+
+
+def _tearDownTables(tablesOriginal):
+    """Drop benchmark tables and restore the real ones."""
+    cur = pg.cursor()
+    for table in pg.tables.values():
+        cur.execute("""DROP TABLE IF EXISTS {0}""".format(table))
+    cur.execute("""COMMIT""")
+    pg.tables = tablesOriginal
+
+
+def crawl():
+    """Crawl topics through the memoizer as scrape_topics.py does."""
+    """Returns the number of messages stored."""
+    if usePipeline:
+        countMessages = memoizer.crawlTopics(
+            range(startTopicId, stopTopicId + 1), maxPagesPerTopic)
+        pg.flush()
+        return countMessages
+    countMessages = 0
+    for topicId in range(startTopicId, stopTopicId + 1):
+        try:
+            with pg.unitOfWork():
+                topic = memoizer.scrapeTopic(topicId)
+            memoizer.scrapeBoard(topic['board'])
+            numPages = min(topic['num_pages'], maxPagesPerTopic)
+            for pageNum in range(1, numPages + 1):
+                with pg.unitOfWork():
+                    messages = memoizer.scrapeMessages(topic['id'], pageNum)
+                    for message in messages:
+                        if message['member'] > 0:
+                            memoizer.scrapeMember(message['member'])
+                countMessages += len(messages)
+        except Exception as e:
+            logging.info("Failed crawling topic {0}: {1}".format(
+                topicId, traceback.format_exc().splitlines()[-1]))
+    pg.flush()
+    return countMessages
+
+
+def run():
+    """Run the crawl against the stand-in and a local PostgreSQL."""
+    """Returns requests/sec, messages/sec, CPU seconds per page and peak
+    RSS in kilobytes of the crawler process."""
+    process, url = startServer()
+    requestUrlOriginal = bitcointalk.requestUrl
+    interReqTimeOriginal = bitcointalk.interReqTime
+    dataDirOriginal = memoizer.dataDir
+    memoOriginal = memoizer.memo
+    bitcointalk.requestUrl = url
+    bitcointalk.interReqTime = 0
+    memoizer.dataDir = tempfile.mkdtemp()
+    memoizer.memo = {
+        'boards': set(),
+        'members': set(),
+        'topics': set()
+    }
+    tablesOriginal = _setUpTables()
+    try:
+        countRequestedStart = bitcointalk.countRequested
+        usageStart = resource.getrusage(resource.RUSAGE_SELF)
+        timeStart = time.time()
+        countMessages = crawl()
+        seconds = time.time() - timeStart
+        usageEnd = resource.getrusage(resource.RUSAGE_SELF)
+        countRequests = bitcointalk.countRequested - countRequestedStart
+    finally:
+        _tearDownTables(tablesOriginal)
+        shutil.rmtree(memoizer.dataDir)
+        bitcointalk.requestUrl = requestUrlOriginal
+        bitcointalk.interReqTime = interReqTimeOriginal
+        memoizer.dataDir = dataDirOriginal
+        memoizer.memo = memoOriginal
+        process.terminate()
+    cpuSeconds = (usageEnd.ru_utime - usageStart.ru_utime +
+                  usageEnd.ru_stime - usageStart.ru_stime)
+    return {
+        'requests': countRequests,
+        'messages': countMessages,
+        'seconds': seconds,
+        'requests_per_second': countRequests / seconds,
+        'messages_per_second': countMessages / seconds,
+        'cpu_seconds_per_page': cpuSeconds / max(countRequests, 1),
+        'peak_rss_kb': usageEnd.ru_maxrss
+    }
+
+
+def _syntheticPages():
+    """Generate synthetic topic pages and their expected parse."""
+    pages = []
+    numPages = synthetic._numPages(
+        synthetic.messagesPerTopic, synthetic.messagesPerPage)
+    topicId = 1
+    while len(pages) < numParsePages:
+        for pageNum in range(1, numPages + 1):
+            if len(pages) < numParsePages:
+                pages.append(synthetic.topicPage(topicId, pageNum))
+        topicId += 1
+    return pages
+
+
+def runParse():
+    """Parse synthetic topic pages, checking them against the oracle."""
+    """Returns pages/sec, messages/sec and any mismatches."""
+    pages = _syntheticPages()
+    countMessages = 0
+    countMismatches = 0
+    timeStart = time.time()
+    for html, expected in pages:
+        data = bitcointalk.parseTopicPage(html)
+        countMessages += len(data['messages'])
+        if data != expected:
+            countMismatches += 1
+    seconds = time.time() - timeStart
+    return {
+        'pages': len(pages),
+        'messages': countMessages,
+        'pages_per_second': len(pages) / seconds,
+        'messages_per_second': countMessages / seconds,
+        'mismatches': countMismatches
+    }
+
+
+def runLoad():
+    """Load parsed synthetic topic pages into a local PostgreSQL."""
+    """Returns pages/sec and messages/sec."""
+    parsed = [expected for html, expected in _syntheticPages()]
+    tablesOriginal = _setUpTables()
+    try:
+        countMessages = 0
+        timeStart = time.time()
+        for data in parsed:
+            data = dict(data)
+            countMessages += len(data['messages'])
+            with pg.unitOfWork():
+                memoizer._insertTopicPage(data)
+        pg.flush()
+        seconds = time.time() - timeStart
+    finally:
+        _tearDownTables(tablesOriginal)
+    return {
+        'pages': len(parsed),
+        'messages': countMessages,
+        'pages_per_second': len(parsed) / seconds,
+        'messages_per_second': countMessages / seconds
+    }
+
+
+def _timeImport(moduleName):
+    """Import a module in a fresh interpreter."""
+    """Returns the seconds taken and the heavy modules imported with it."""
+    script = "\n".join([
+        "import sys, time",
+        "timeStart = time.time()",
+        "import {0}".format(moduleName),
+        "print time.time() - timeStart",
+        "print ','.join([m for m in {0} if m in sys.modules])".format(
+            heavyModules)])
+    lines = subprocess.check_output(
+        [sys.executable, "-c", script], cwd=rootDir).splitlines()
+    return float(lines[0]), lines[1]
+
+
+def runImport():
+    """Time imports of the runtime modules in fresh interpreters, and a pool
+    of fresh parse workers each parsing a synthetic topic page."""
+    """Returns the best of several import times per module, the heavy modules
+    each pulls in and the seconds until every worker is done."""
+    results = {}
+    for moduleName in importModules:
+        seconds, loaded = min(
+            [_timeImport(moduleName) for i in range(importRepeats)])
+        results['{0}_import_seconds'.format(moduleName)] = seconds
+        results['{0}_heavy_modules'.format(moduleName)] = loaded
+
+    scratchDir = tempfile.mkdtemp()
+    try:
+        pagePath = "{0}/topic.html".format(scratchDir)
+        f = codecs.open(pagePath, 'w', 'utf-8')
+        f.write(synthetic.topicPage(1, 1)[0])
+        f.close()
+        script = "\n".join([
+            "import bitcointalk, codecs",
+            "f = codecs.open({0!r}, 'r', 'utf-8')".format(pagePath),
+            "bitcointalk.parseTopicPage(f.read())"])
+        timeStart = time.time()
+        workers = [subprocess.Popen([sys.executable, "-c", script],
+                                    cwd=rootDir)
+                   for i in range(numWorkers)]
+        for worker in workers:
+            worker.wait()
+        results['pool_seconds'] = time.time() - timeStart
+        results['pool_workers'] = numWorkers
+    finally:
+        shutil.rmtree(scratchDir)
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(levelname)s:%(message)s',
+        datefmt='%m/%d/%Y %I:%M:%S %p')
+    for name, benchmark in [('crawl', run), ('parse', runParse),
+                            ('load', runLoad), ('import', runImport)]:
+        results = benchmark()
+        for key in sorted(results.keys()):
+            logging.info("{0} {1}: {2}".format(name, key, results[key]))
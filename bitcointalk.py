@@ -1,28 +1,29 @@
 """ Module for requesting data from bitcointalk.org and parsing it. """
-import codecs
-from datetime import date
 from datetime import datetime
-from datetime import time as tm
-import HTMLParser
-import json
 import logging
+import lxml.etree
 import lxml.html
-import requests
-import os
 from random import random
 import re
-import sys
+import records
 import time
-import unittest
 
 baseUrl = "https://bitcointalk.org/index.php"
+# Where requests are sent; point at a mirror to crawl it instead
+requestUrl = baseUrl
 countRequested = 0
 interReqTime = 2
 lastReqTime = None
+# Characters of HTML fed to the streaming topic parser at a time
+feedSize = 16384
+# Links to a message within a topic
+messageLinkPattern = re.compile(r"[?;]topic=(\d+)\.msg(\d+)")
 
 
 def _request(payloadString):
     """Private method for requesting an arbitrary query string."""
+    # Imported here so that parsing alone doesn't pay for the HTTP stack
+    import requests
     global countRequested
     global lastReqTime
     if lastReqTime is not None and time.time() - lastReqTime < interReqTime:
@@ -32,7 +33,7 @@ def _request(payloadString):
         time.sleep(timeToSleep)
     logging.info("Issuing request for the following payload: {0}".format(
         payloadString))
-    r = requests.get("{0}?{1}".format(baseUrl, payloadString))
+    r = requests.get("{0}?{1}".format(requestUrl, payloadString))
     lastReqTime = time.time()
     countRequested += 1
     if r.status_code == requests.codes.ok:
@@ -52,6 +53,12 @@ def requestProfile(memberId):
     return _request("action=profile;u={0}".format(memberId))
 
 
+def requestRecentPosts(postOffset=0):
+    """Method for requesting the latest posts across the forum."""
+    """CAVEAT: Note that a single request will return only 10 posts."""
+    return _request("action=recent;start={0}".format(postOffset))
+
+
 def requestTopicPage(topicId, messageOffset=0):
     """Method for requesting a topic page."""
     """CAVEAT: Note that a single request will return only 20 messages."""
@@ -60,7 +67,7 @@ def requestTopicPage(topicId, messageOffset=0):
 
 def parseBoardPage(html):
     """Method for parsing board HTML. Will extract topic IDs."""
-    data = {}
+    data = records.Board()
 
     # Extract name
     docRoot = lxml.html.fromstring(html)
@@ -117,9 +124,68 @@ def parseBoardPage(html):
     return data
 
 
-def parseProfile(html, todaysDate=datetime.utcnow().date()):
+def _parseMessageLinks(links):
+    """Pull (topic ID, message ID) pairs out of links to messages, keeping
+    the latest message of each topic, in order of first appearance."""
+    latest = {}
+    topicIds = []
+    for link in links:
+        match = messageLinkPattern.search(link.attrib.get('href', ''))
+        if match is None:
+            continue
+        topicId = int(match.group(1))
+        messageId = long(match.group(2))
+        if topicId not in latest:
+            topicIds.append(topicId)
+            latest[topicId] = messageId
+        else:
+            latest[topicId] = max(latest[topicId], messageId)
+    return [(topicId, latest[topicId]) for topicId in topicIds]
+
+
+def parseBoardActivity(html):
+    """Method for parsing board HTML for the last post of each topic listed.
+    Will extract (topic ID, last message ID) pairs."""
+    """Topics without replies link their last post to the topic, so their
+    first message, which heads the topic's row, is taken instead."""
+    docRoot = lxml.html.fromstring(html)
+    activity = []
+    topics = docRoot.cssselect(
+        "#bodyarea>div.tborder>table.bordercolor>tr")
+    for topic in topics:
+        topicCells = topic.cssselect("td")
+        if len(topicCells) != 7:
+            continue
+        pairs = _parseMessageLinks(topicCells[6].cssselect("a"))
+        if len(pairs) == 0:
+            topicLinks = topicCells[2].cssselect("span>a")
+            if len(topicLinks) == 0:
+                continue
+            match = re.search(r"[?;]topic=(\d+)\.", topicLinks[0].attrib[
+                'href'])
+            spanId = topicLinks[0].getparent().attrib.get('id', '')
+            if match is None or spanId[:4] != 'msg_':
+                continue
+            pairs = [(int(match.group(1)), long(spanId[4:]))]
+        activity.extend(pairs)
+    return activity
+
+
+def parseRecentPosts(html):
+    """Method for parsing the latest posts across the forum. Will extract
+    (topic ID, message ID) pairs, with the latest message of each topic."""
+    """Only the links heading each post are read, not those quoted in it."""
+    docRoot = lxml.html.fromstring(html)
+    return _parseMessageLinks(docRoot.cssselect("#bodyarea tr.titlebg2 a"))
+
+
+def parseProfile(html, todaysDate=None):
     """Method for parsing profile HTML."""
-    data = {}
+    """Times given as "Today at" are read as on todaysDate, by default the
+    current UTC date."""
+    if todaysDate is None:
+        todaysDate = datetime.utcnow().date()
+    data = records.Member()
 
     docRoot = lxml.html.fromstring(html)
 
@@ -170,11 +236,31 @@ def parseProfile(html, todaysDate=datetime.utcnow().date()):
     return data
 
 
-def parseTopicPage(html, todaysDate=datetime.utcnow().date()):
-    """Method for parsing topic HTML. Will extract messages."""
-    data = {}
-    h = HTMLParser.HTMLParser()
-    docRoot = lxml.html.fromstring(html)
+def _parseQuoteHeader(quoteHeader, message, position):
+    """Build the quote edge for a top-level quote header of a message."""
+    quote = {
+        'message': message['id'],
+        'position': position,
+        'topic': message['topic'],
+        'member': message['member'],
+        'quoted_message': None,
+        'quoted_topic': None,
+        'quoted_member_name': None
+    }
+    headerText = quoteHeader.text_content().strip()
+    if headerText.startswith("Quote from: "):
+        quote['quoted_member_name'] = headerText[12:].rsplit(" on ", 1)[0]
+    quoteLinks = quoteHeader.cssselect("a")
+    if len(quoteLinks) > 0 and "#msg" in quoteLinks[0].attrib['href']:
+        linkPayload = quoteLinks[0].attrib['href'].split("?topic=")[-1]
+        quote['quoted_topic'] = int(linkPayload.split(".")[0])
+        quote['quoted_message'] = long(linkPayload.split("#msg")[-1])
+    return quote
+
+
+def _parseTopicHeader(docRoot):
+    """Parse the topic's name, board, ID, page count and read count."""
+    data = records.Topic()
 
     # Parse the topic name
     data['name'] = docRoot.cssselect("title")[0].text
@@ -209,250 +295,125 @@ def parseTopicPage(html, todaysDate=datetime.utcnow().date()):
     # Parse the read count
     tSubj = docRoot.cssselect("td#top_subject")[0].text.strip()
     data['count_read'] = int(tSubj.split("(Read ")[-1].split(" times)")[0])
+    return data
 
-    # Parse the messages
-    messages = []
+
+def _parseTopicPost(post, topicId, quotes, todaysDate):
+    """Parse a post row of a topic page into a message."""
+    """Quote edges of the message are appended to quotes."""
+    m = records.Message()
+    m['topic'] = topicId
+    countQuotesBefore = len(quotes)
+    innerPost = post.cssselect("td td.windowbg,td.windowbg2 tr")[0]
+
+    # Parse the member who's made the post
+    userInfoPossible = innerPost.cssselect("td.poster_info>b>a")
+    if len(userInfoPossible) > 0:
+        userInfo = innerPost.cssselect("td.poster_info>b>a")[0]
+        userUrlPrefix = "{0}?action=profile;u=".format(baseUrl)
+        m['member'] = int(userInfo.attrib["href"].split(
+            userUrlPrefix)[-1])
+    # If no links, then we have a guest
+    else:
+        m['member'] = 0
+
+    # Parse label information about the post
+    subj = innerPost.cssselect(
+        "td.td_headerandpost>table>tr>td>div.subject>a")[0]
+    m['subject'] = subj.text
+    m['link'] = subj.attrib['href']
+    m['id'] = long(m['link'].split('#msg')[-1])
+
+    # Parse the message post time
+    postTime = innerPost.cssselect(
+        "td.td_headerandpost>table>tr>td>div.smalltext")[0]
+    m['post_time'] = postTime.text_content().strip().replace(
+        "Today at", todaysDate.strftime("%B %d, %Y,"))
+    m['post_time'] = datetime.strptime(
+        m['post_time'], "%B %d, %Y, %I:%M:%S %p")
+
+    # Parse the topic position
+    messageNumber = innerPost.cssselect(
+        "td.td_headerandpost>table>tr>td>div>a.message_number")[0]
+    m['topic_position'] = int(messageNumber.text[1:])
+
+    # Extract the content
+    corePost = innerPost.cssselect("div.post")[0]
+    m['content'] = lxml.html.tostring(corePost).strip()[18:-6]
+    m['content_no_html'] = corePost.text_content()
+    for child in corePost.iterchildren():
+        if (child.tag == "div" and 'class' in child.attrib and
+            (child.attrib['class'] == 'quoteheader' or
+                child.attrib['class'] == 'quote')):
+            if child.attrib['class'] == 'quoteheader':
+                quotes.append(_parseQuoteHeader(
+                    child, m, len(quotes) - countQuotesBefore))
+            corePost.remove(child)
+    m['content_no_quote'] = lxml.html.tostring(corePost).strip()[18:-6]
+    m['content_no_quote_no_html'] = corePost.text_content()
+    return m
+
+
+def _iterElements(html):
+    """Feed HTML to a pull parser, yielding elements as they are closed."""
+    parser = lxml.etree.HTMLPullParser(events=('end',))
+    parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+    for offset in range(0, len(html), feedSize):
+        parser.feed(html[offset:offset + feedSize])
+        for event, element in parser.read_events():
+            yield element
+    parser.close()
+    for event, element in parser.read_events():
+        yield element
+
+
+def _isPostRow(element):
+    """Whether an element is a row of the table of posts."""
+    if element.tag != "tr":
+        return False
+    table = element.getparent()
+    if (table is None or table.tag != "table" or
+            "bordercolor" not in table.get("class", "").split()):
+        return False
+    form = table.getparent()
+    return (form is not None and form.tag == "form" and
+            form.get("id") == "quickModForm")
+
+
+def iterTopicPage(html, todaysDate=None):
+    """Generator parsing topic HTML. Yields the topic, then its messages."""
+    """The topic comes without messages, and its quotes fill in as messages
+    are yielded. Each post row is freed once parsed, so memory stays flat
+    however long the page is. "Today at" times are read as on todaysDate, by
+    default the current UTC date."""
+    if todaysDate is None:
+        todaysDate = datetime.utcnow().date()
+    data = None
     firstPostClass = None
-    posts = docRoot.cssselect(
-        "form#quickModForm>table.bordercolor>tr")
-    for post in posts:
-        if firstPostClass is None:
-            firstPostClass = post.attrib["class"]
-
-        if ("class" not in post.attrib or
-                post.attrib["class"] != firstPostClass):
-            continue
-        else:
-            m = {}
-            m['topic'] = data['id']
-            innerPost = post.cssselect("td td.windowbg,td.windowbg2 tr")[0]
-
-            # Parse the member who's made the post
-            userInfoPossible = innerPost.cssselect("td.poster_info>b>a")
-            if len(userInfoPossible) > 0:
-                userInfo = innerPost.cssselect("td.poster_info>b>a")[0]
-                userUrlPrefix = "{0}?action=profile;u=".format(baseUrl)
-                m['member'] = int(userInfo.attrib["href"].split(
-                    userUrlPrefix)[-1])
-            # If no links, then we have a guest
-            else:
-                m['member'] = 0
-
-            # Parse label information about the post
-            subj = innerPost.cssselect(
-                "td.td_headerandpost>table>tr>td>div.subject>a")[0]
-            m['subject'] = subj.text
-            m['link'] = subj.attrib['href']
-            m['id'] = long(m['link'].split('#msg')[-1])
-
-            # Parse the message post time
-            postTime = innerPost.cssselect(
-                "td.td_headerandpost>table>tr>td>div.smalltext")[0]
-            m['post_time'] = postTime.text_content().strip().replace(
-                "Today at", todaysDate.strftime("%B %d, %Y,"))
-            m['post_time'] = datetime.strptime(
-                m['post_time'], "%B %d, %Y, %I:%M:%S %p")
-
-            # Parse the topic position
-            messageNumber = innerPost.cssselect(
-                "td.td_headerandpost>table>tr>td>div>a.message_number")[0]
-            m['topic_position'] = int(messageNumber.text[1:])
-
-            # Extract the content
-            corePost = innerPost.cssselect("div.post")[0]
-            m['content'] = lxml.html.tostring(corePost).strip()[18:-6]
-            m['content_no_html'] = corePost.text_content()
-            for child in corePost.iterchildren():
-                if (child.tag == "div" and 'class' in child.attrib and
-                    (child.attrib['class'] == 'quoteheader' or
-                        child.attrib['class'] == 'quote')):
-                    corePost.remove(child)
-            m['content_no_quote'] = lxml.html.tostring(corePost).strip()[18:-6]
-            m['content_no_quote_no_html'] = corePost.text_content()
-
-            messages.append(m)
-
-    data['messages'] = messages
-    return data
+    for element in _iterElements(html):
+        if data is None:
+            if element.tag == "td" and element.get("id") == "top_subject":
+                data = _parseTopicHeader(element.getroottree().getroot())
+                data['quotes'] = []
+                yield data
+        elif _isPostRow(element):
+            if firstPostClass is None:
+                firstPostClass = element.get("class")
+            if element.get("class") == firstPostClass:
+                yield _parseTopicPost(
+                    element, data['id'], data['quotes'], todaysDate)
+            # Free the row along with any rows before it
+            element.clear()
+            table = element.getparent()
+            while element.getprevious() is not None:
+                del table[0]
+    if data is None:
+        raise Exception("Page does not have valid topic data.")
 
 
-class BitcointalkTest(unittest.TestCase):
-
-    """"Testing suite for bitcointalk module."""
-
-    def testRequestBoardPage(self):
-        """Method for testing requestBoardPate."""
-        html = requestBoardPage(74)
-        f = codecs.open("{0}/data/test_board_74.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'w', 'utf-8')
-        f.write(html)
-        f.close()
-        title = lxml.html.fromstring(html).cssselect("title")[0].text
-        errorMsg = "Got unexpected output for webpage title: {0}".format(title)
-        self.assertEqual(title, "Legal", errorMsg)
-
-        html = requestBoardPage(5, 600)
-        f = codecs.open("{0}/data/test_board_5.600.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'w', 'utf-8')
-        f.write(html)
-        f.close()
-
-    def testRequestProfile(self):
-        """Method for testing requestProfile."""
-        html = requestProfile(12)
-        f = codecs.open("{0}/data/test_profile_12.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'w', 'utf-8')
-        f.write(html)
-        f.close()
-        title = lxml.html.fromstring(html).cssselect("title")[0].text
-        errorMsg = "Got unexpected output for webpage title: {0}".format(title)
-        self.assertEqual(title, "View the profile of nanaimogold", errorMsg)
-
-    def testRequestTopicPage(self):
-        """Method for testing requestTopicPage."""
-        html = requestTopicPage(14)
-        f = codecs.open("{0}/data/test_topic_14.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'w', 'utf-8')
-        f.write(html)
-        f.close()
-        title = lxml.html.fromstring(html).cssselect("title")[0].text
-        errorMsg = "Got unexpected output for webpage title: {0}".format(title)
-        self.assertEqual(title, "Break on the supply's increase", errorMsg)
-
-        html = requestTopicPage(602041, 12400)
-        f = codecs.open("{0}/data/test_topic_602041.12400.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'w', 'utf-8')
-        f.write(html)
-        f.close()
-
-    def testParseBoardPage(self):
-        """Method for testing parseBoardPage."""
-        f = codecs.open("{0}/example/board_74.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'r', 'utf-8')
-        html = f.read()
-        f.close()
-        data = parseBoardPage(html)
-        topicIds = data.pop("topic_ids")
-        expectedData = {
-            'id': 74,
-            'name': 'Legal',
-            'container': 'Bitcoin',
-            'parent': 1,
-            'num_pages': 23,
-        }
-        self.assertEqual(data, expectedData)
-        self.assertEqual(len(topicIds), 40)
-        self.assertEqual(topicIds[0], 96118)
-        self.assertEqual(topicIds[-1], 684343)
-
-        f = codecs.open("{0}/example/board_5.600.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'r', 'utf-8')
-        html = f.read()
-        f.close()
-        data = parseBoardPage(html)
-        topicIds = data.pop("topic_ids")
-        expectedData = {
-            'id': 5,
-            'name': 'Marketplace',
-            'container': 'Economy',
-            'parent': None,
-            'num_pages': 128,
-        }
-        self.assertEqual(data, expectedData)
-        self.assertEqual(len(topicIds), 40)
-        self.assertEqual(topicIds[0], 423880)
-        self.assertEqual(topicIds[-1], 430401)
-
-    def testParseProfile(self):
-        """Method for testing parseProfile."""
-        f = codecs.open("{0}/example/profile_12.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'r', 'utf-8')
-        html = f.read()
-        f.close()
-        todaysDate = date(2014, 7, 29)
-        data = parseProfile(html, todaysDate)
-        expectedData = {
-            'id': 12,
-            'name': 'nanaimogold',
-            'position': 'Sr. Member',
-            'date_registered': datetime(2009, 12, 9, 19, 23, 55),
-            'last_active': datetime(2014, 7, 29, 0, 38, 1),
-            'email': 'hidden',
-            'website_name': 'Nanaimo Gold Digital Currency Exchange',
-            'website_link': 'https://www.nanaimogold.com/',
-            'bitcoin_address': None,
-            'other_contact_info': None,
-            'signature': '<a href="https://www.nanaimogold.com/" ' +
-            'target="_blank">https://www.nanaimogold.com/</a> ' +
-            '- World\'s first bitcoin exchange service'
-        }
-        self.assertEqual(data, expectedData)
-
-    def testParseTopicPage(self):
-        """Method for testing parseTopicPage."""
-        f = codecs.open("{0}/example/topic_14.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'r', 'utf-8')
-        html = f.read()
-        f.close()
-        data = parseTopicPage(html)
-        messages = data['messages']
-        del data['messages']
-        expectedData = {
-            'id': 14,
-            'name': 'Break on the supply\'s increase',
-            'board': 7,
-            'count_read': 3051,
-            'num_pages': 1
-        }
-        self.assertEqual(data, expectedData)
-
-        self.assertEqual(len(messages), 2)
-
-        firstMessage = messages[0]
-        firstMessageContent = {
-            'raw': firstMessage['content'],
-            'no_html': firstMessage['content_no_html'],
-            'no_quote': firstMessage['content_no_quote'],
-            'no_quote_no_html': firstMessage['content_no_quote_no_html']
-        }
-        del firstMessage['content']
-        del firstMessage['content_no_html']
-        del firstMessage['content_no_quote']
-        del firstMessage['content_no_quote_no_html']
-
-        expectedFirstMessage = {
-            'id': long(53),
-            'member': 16,
-            'subject': 'Break on the supply\'s increase',
-            'link': 'https://bitcointalk.org/index.php?topic=14.msg53#msg53',
-            'topic': 14,
-            'topic_position': 1,
-            'post_time': datetime(2009, 12, 12, 14, 11, 37)
-        }
-        self.assertEqual(firstMessage, expectedFirstMessage)
-
-        self.assertEqual(len(firstMessageContent['raw']), 1276)
-        self.assertEqual(len(firstMessageContent['no_html']), 1208)
-        self.assertEqual(len(firstMessageContent['no_quote']), 1276)
-        self.assertEqual(len(firstMessageContent['no_quote_no_html']), 1208)
-
-        f = codecs.open("{0}/example/topic_602041.12400.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'r', 'utf-8')
-        html = f.read()
-        f.close()
-        data = parseTopicPage(html)
-        self.assertEqual(data['num_pages'], 621)
-        self.assertEqual(
-            data['messages'][0]['post_time'],
-            datetime.combine(datetime.utcnow().date(), tm(21, 3, 11)))
-        # print "Content of Message 1"
-        # print data['messages'][0]['content']
-        # print "Content of Message 1, No HTML"
-        # print data['messages'][0]['content_no_html']
-        # print "Content of Message 1, No Quote"
-        # print data['messages'][0]['content_no_quote']
-        # print "Content of Message 1, No Quote, No HTML"
-        # print data['messages'][0]['content_no_quote_no_html']
-
-if __name__ == "__main__":
-    unittest.main()
+def parseTopicPage(html, todaysDate=None):
+    """Method for parsing topic HTML. Will extract messages."""
+    topicIterator = iterTopicPage(html, todaysDate)
+    data = next(topicIterator)
+    data['messages'] = list(topicIterator)
+    return data
@@ -0,0 +1,163 @@
+""" Module for Bloom filters of IDs, kept in memory-mapped files. """
+import contextlib
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+
+# Files hold a header of the magic string, number of bits, number of hashes,
+# capacity and number of keys added, followed by the bits
+magic = "BLM1"
+headerFormat = "<4sQQQQ"
+headerSize = struct.calcsize(headerFormat)
+countOffset = headerSize - 8
+
+
+def _size(capacity, errorRate):
+    """Number of bits and of hashes to hold capacity keys with the given
+    rate of false positives."""
+    numBits = int(math.ceil(-capacity * math.log(errorRate) /
+                            math.log(2) ** 2))
+    numHashes = max(1, int(round(float(numBits) / capacity * math.log(2))))
+    return numBits, numHashes
+
+
+def _positions(key, numBits, numHashes):
+    """Bit positions of an integer key."""
+    h1, h2 = struct.unpack(
+        "<QQ", hashlib.md5(struct.pack("<q", key)).digest())
+    return [(h1 + i * h2) % numBits for i in range(numHashes)]
+
+
+@contextlib.contextmanager
+def _lock(path):
+    """Hold the lock on the filter file at path for changing or replacing
+    it."""
+    lockFile = open("{0}.lock".format(path), 'a')
+    try:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        yield
+    finally:
+        lockFile.close()
+
+
+class BloomFilter(object):
+
+    """Set of integer keys which may answer that a key is in when it isn't,
+    but never that a key isn't in when it is."""
+    """The bits are mapped into memory from a file, so only the pages touched
+    are read, the filter outlives the process, and processes opening the same
+    file share it. Keys are added under a lock on the file, so processes
+    adding at once keep each other's bits, and a filter replaced by build()
+    is reopened before adding to it."""
+
+    def __init__(self, path, capacity=None, errorRate=0.01):
+        """Open the filter at path, creating an empty one for capacity keys if
+        there is none."""
+        if not os.path.exists(path):
+            if capacity is None:
+                raise Exception("No Bloom filter at {0}".format(path))
+            with _lock(path):
+                if not os.path.exists(path):
+                    _write(path, bytearray(), capacity, errorRate, 0)
+        self.path = path
+        self.lockFile = open("{0}.lock".format(path), 'a')
+        self.file = None
+        self.map = None
+        self._open()
+
+    def _open(self):
+        """Map the file."""
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+        self.file = open(self.path, 'r+b')
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        tag, self.numBits, self.numHashes, self.capacity, count = \
+            struct.unpack(headerFormat, self.map[:headerSize])
+        if tag != magic:
+            raise Exception("{0} is not a Bloom filter".format(self.path))
+
+    def _refresh(self):
+        """Reopen the file if it was replaced."""
+        if os.stat(self.path).st_ino != self.inode:
+            self._open()
+
+    def __contains__(self, key):
+        self._refresh()
+        for position in _positions(key, self.numBits, self.numHashes):
+            if not ord(self.map[headerSize + position // 8]) & (
+                    1 << (position % 8)):
+                return False
+        return True
+
+    def __len__(self):
+        return struct.unpack(
+            "<Q", self.map[countOffset:headerSize])[0]
+
+    def add(self, key):
+        """Add a key. Returns whether it may have been in already."""
+        fcntl.flock(self.lockFile, fcntl.LOCK_EX)
+        try:
+            self._refresh()
+            present = True
+            for position in _positions(key, self.numBits, self.numHashes):
+                index = headerSize + position // 8
+                byte = ord(self.map[index])
+                mask = 1 << (position % 8)
+                if not byte & mask:
+                    present = False
+                    self.map[index] = chr(byte | mask)
+            if not present:
+                self.map[countOffset:headerSize] = struct.pack(
+                    "<Q", len(self) + 1)
+        finally:
+            fcntl.flock(self.lockFile, fcntl.LOCK_UN)
+        return present
+
+    def flush(self):
+        """Write the bits changed so far out to the file."""
+        self.map.flush()
+
+    def close(self):
+        """Flush and unmap the filter."""
+        self.map.close()
+        self.file.close()
+        self.lockFile.close()
+
+
+def _write(path, bits, capacity, errorRate, count):
+    """Write a filter file, padding the bits given with zeros."""
+    numBits, numHashes = _size(capacity, errorRate)
+    f = open(path, 'wb')
+    f.write(struct.pack(
+        headerFormat, magic, numBits, numHashes, capacity, count))
+    f.write(bits)
+    f.truncate(headerSize + (numBits + 7) // 8)
+    f.close()
+
+
+def build(path, keys, capacity, errorRate=0.01):
+    """Write a filter holding the given distinct keys to path, replacing any
+    filter there. Returns the filter opened."""
+    """Bits are set in memory and the file swapped in once written, so those
+    with the old filter open keep a consistent view of it until they next
+    use it, when they reopen it. Keys are read and the file swapped under the
+    lock, so that no key is added to the old filter in between. CAVEAT: Keys
+    added before the build that the keys given miss, such as those of
+    messages not yet committed, are lost, so build while other processes
+    sharing the file are idle."""
+    numBits, numHashes = _size(capacity, errorRate)
+    bits = bytearray((numBits + 7) // 8)
+    count = 0
+    with _lock(path):
+        for key in keys:
+            for position in _positions(key, numBits, numHashes):
+                bits[position // 8] |= 1 << (position % 8)
+            count += 1
+        _write(path + ".tmp", bits, capacity, errorRate, count)
+        os.rename(path + ".tmp", path)
+    return BloomFilter(path)
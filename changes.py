@@ -0,0 +1,132 @@
+""" Module for feeds of the changes made to stored rows. """
+from datetime import datetime
+import fcntl
+import glob
+import gzip
+import json
+import os
+
+# Segments of a feed span this much time; a new one is started when the
+# time formatted this way moves on
+segmentFormat = "%Y%m%d%H"
+
+# Segments are named by the sequence number of their first change, padded
+# so that they sort in order, and by the time they span
+segmentPattern = "changes_{0:015d}_{1}.jsonl.gz"
+
+
+def _firstSequence(path):
+    """Sequence number of the first change in a segment, from its name."""
+    return int(os.path.basename(path).split("_")[1])
+
+
+def _segments(directory):
+    """Paths of the segments of a feed, in order."""
+    return sorted(glob.glob("{0}/changes_*.jsonl.gz".format(directory)))
+
+
+class ChangeFeed(object):
+
+    """Append-only log of rows added and changed, as gzipped JSON lines in
+    segment files, kept in a directory."""
+    """Changes are held back until flush(), which gives each the next
+    sequence number and appends them. Each line holds the sequence number
+    (seq), the time written (time), the table, the ID (sid), the operation
+    ('insert' or 'update') and the fields before (old, None for inserts) and
+    after (new); updates only carry the fields that changed. Processes
+    sharing a directory share the feed."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pending = []
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def add(self, table, sid, operation, old, new):
+        """Add a change, to be written by flush()."""
+        self.pending.append({
+            'table': table,
+            'sid': sid,
+            'operation': operation,
+            'old': old,
+            'new': new
+        })
+
+    def mark(self):
+        """Point to take the changes added back to with truncate()."""
+        return len(self.pending)
+
+    def truncate(self, mark):
+        """Take back the changes added since a mark()."""
+        del self.pending[mark:]
+
+    def flush(self):
+        """Write the changes added to the feed. Returns the first and last
+        sequence numbers given, or None if there were none."""
+        """The last sequence number is saved before the changes are written,
+        so a crash in between leaves a gap, but never reuses a number."""
+        if len(self.pending) == 0:
+            return None
+        lockFile = open("{0}/lock".format(self.directory), 'a')
+        try:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+            sequencePath = "{0}/sequence".format(self.directory)
+            last = 0
+            if os.path.exists(sequencePath):
+                f = open(sequencePath, 'r')
+                last = int(f.read())
+                f.close()
+            first = last + 1
+            last += len(self.pending)
+            f = open("{0}.tmp".format(sequencePath), 'w')
+            f.write(str(last))
+            f.close()
+            os.rename("{0}.tmp".format(sequencePath), sequencePath)
+
+            now = datetime.utcnow()
+            span = now.strftime(segmentFormat)
+            segments = _segments(self.directory)
+            if len(segments) > 0 and segments[-1].endswith(
+                    "_{0}.jsonl.gz".format(span)):
+                path = segments[-1]
+            else:
+                path = "{0}/{1}".format(
+                    self.directory, segmentPattern.format(first, span))
+            lines = []
+            for seq, change in enumerate(self.pending, first):
+                change['seq'] = seq
+                change['time'] = now.isoformat()
+                lines.append(json.dumps(change, sort_keys=True))
+            f = gzip.open(path, 'ab')
+            f.write("\n".join(lines) + "\n")
+            f.close()
+        finally:
+            lockFile.close()
+        self.pending = []
+        return first, last
+
+
+def iterChanges(directory, since=0):
+    """Yield the changes in a feed after sequence number since, in order."""
+    """Only the segments from the one holding the change after since are
+    read. CAVEAT: A segment being appended to may end in a change only
+    partly written, which is left for the next read."""
+    segments = _segments(directory)
+    start = 0
+    for index, path in enumerate(segments):
+        if _firstSequence(path) <= since + 1:
+            start = index
+    for index in range(start, len(segments)):
+        f = gzip.open(segments[index], 'rb')
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                change = json.loads(line)
+                if change['seq'] > since:
+                    yield change
+        except (IOError, EOFError):
+            if index < len(segments) - 1:
+                raise
+        finally:
+            f.close()
@@ -0,0 +1,194 @@
+""" Module for exporting scraped data from PostgreSQL to Parquet files. """
+from datetime import datetime
+import json
+import logging
+import os
+import pg
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Configuration variables
+exportDir = "{0}/export".format(os.path.dirname(os.path.abspath(__file__)))
+rowGroupSize = 50000
+
+# Rows stored up to this many seconds before the last one exported are read
+# again on an incremental export, in case they were committed late
+exportSlack = 3600
+
+# Exported columns per table, followed by the partitioning columns
+columns = {
+    'board': [
+        ('sid', pa.int32()),
+        ('name', pa.string()),
+        ('parent', pa.int32()),
+        ('container', pa.string()),
+        ('num_pages', pa.int32()),
+        ('db_update_time', pa.timestamp('us', tz='UTC'))
+    ],
+    'member': [
+        ('sid', pa.int32()),
+        ('name', pa.string()),
+        ('position', pa.string()),
+        ('date_registered', pa.timestamp('us')),
+        ('last_active', pa.timestamp('us')),
+        ('email', pa.string()),
+        ('website_name', pa.string()),
+        ('website_link', pa.string()),
+        ('bitcoin_address', pa.string()),
+        ('other_contact_info', pa.string()),
+        ('signature', pa.string()),
+        ('db_update_time', pa.timestamp('us', tz='UTC'))
+    ],
+    'message': [
+        ('sid', pa.int64()),
+        ('topic', pa.int32()),
+        ('topic_position', pa.int32()),
+        ('member', pa.int32()),
+        ('post_time', pa.timestamp('us')),
+        ('subject', pa.string()),
+        ('link', pa.string()),
+        ('content', pa.string()),
+        ('content_no_html', pa.string()),
+        ('content_no_quote', pa.string()),
+        ('content_no_quote_no_html', pa.string()),
+        ('db_update_time', pa.timestamp('us', tz='UTC'))
+    ],
+    'topic': [
+        ('sid', pa.int32()),
+        ('name', pa.string()),
+        ('num_pages', pa.int32()),
+        ('count_read', pa.int32()),
+        ('db_update_time', pa.timestamp('us', tz='UTC'))
+    ]
+}
+partitions = {
+    'board': [],
+    'member': [],
+    # Messages of topics we haven't stored yet land in board=0
+    'message': [
+        ('board', "COALESCE(t.board, 0)"),
+        ('month', "to_char(x.post_time, 'YYYY-MM')")
+    ],
+    'topic': [
+        ('board', "COALESCE(x.board, 0)")
+    ]
+}
+
+
+def _loadState():
+    """Load the high-water marks of previous exports."""
+    statePath = "{0}/state.json".format(exportDir)
+    if not os.path.exists(statePath):
+        return {}
+    f = open(statePath, 'r')
+    state = json.load(f)
+    f.close()
+    return state
+
+
+def _saveState(state):
+    """Save the high-water marks of the exports."""
+    f = open("{0}/state.json".format(exportDir), 'w')
+    json.dump(state, f, indent=2, sort_keys=True)
+    f.close()
+
+
+def _partitionPath(tableLabel, partitionValues):
+    """Directory of a partition, laid out hive-style."""
+    path = "{0}/{1}".format(exportDir, tableLabel)
+    for (name, expression), value in zip(
+            partitions[tableLabel], partitionValues):
+        path = "{0}/{1}={2}".format(path, name, value)
+    return path
+
+
+def _writeRowGroup(writer, buffers, schema):
+    """Write buffered columns as a single row group and reset buffers."""
+    arrays = [pa.array(buffers[i], type=schema[i].type)
+              for i in range(len(buffers))]
+    writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    for buf in buffers:
+        del buf[:]
+
+
+def exportTable(tableLabel, incremental=True):
+    """Export a table to partitioned Parquet files. Returns rows written."""
+    """CAVEAT: An incremental export writes re-scraped rows again, as well as
+    rows stored within exportSlack of the last one exported, so readers
+    should keep the latest db_update_time per sid."""
+    if not os.path.exists(exportDir):
+        os.makedirs(exportDir)
+    state = _loadState()
+    since = None
+    if incremental and tableLabel in state:
+        since = state[tableLabel]
+    tableColumns = columns[tableLabel]
+    tablePartitions = partitions[tableLabel]
+    schema = pa.schema([pa.field(name, dataType)
+                        for name, dataType in tableColumns])
+
+    # Stream rows sorted by partition, so only one file is open at a time
+    selectList = ["x.{0}".format(name) for name, dataType in tableColumns]
+    selectList.extend([expression for name, expression in tablePartitions])
+    query = "SELECT {0} FROM {1} x".format(
+        ",".join(selectList), pg.tables[tableLabel])
+    if tableLabel == 'message':
+        query += " LEFT JOIN {0} t ON t.sid = x.topic".format(
+            pg.tables['topic'])
+    params = None
+    if since is not None:
+        query += """ WHERE x.db_update_time >
+            %s::timestamptz - %s * interval '1 second'"""
+        params = (since, exportSlack)
+    if len(tablePartitions) > 0:
+        query += " ORDER BY {0}".format(",".join(
+            [str(len(tableColumns) + i + 1)
+             for i in range(len(tablePartitions))]))
+
+    runStamp = int((datetime.utcnow() - datetime(1970, 1, 1)).total_seconds())
+    updateIndex = len(tableColumns) - 1
+    countColumns = len(tableColumns)
+    buffers = [[] for column in tableColumns]
+    writer = None
+    currentPartition = None
+    countRows = 0
+    highWater = None
+    for row in pg._stream(query, params, False):
+        partitionValues = row[countColumns:]
+        if writer is None or partitionValues != currentPartition:
+            if writer is not None:
+                if len(buffers[0]) > 0:
+                    _writeRowGroup(writer, buffers, schema)
+                writer.close()
+            path = _partitionPath(tableLabel, partitionValues)
+            if not os.path.exists(path):
+                os.makedirs(path)
+            writer = pq.ParquetWriter(
+                "{0}/part-{1}.parquet".format(path, runStamp), schema)
+            currentPartition = partitionValues
+        for i in range(countColumns):
+            buffers[i].append(row[i])
+        if len(buffers[0]) >= rowGroupSize:
+            _writeRowGroup(writer, buffers, schema)
+        if highWater is None or row[updateIndex] > highWater:
+            highWater = row[updateIndex]
+        countRows += 1
+    if writer is not None:
+        if len(buffers[0]) > 0:
+            _writeRowGroup(writer, buffers, schema)
+        writer.close()
+
+    if highWater is not None:
+        state = _loadState()
+        state[tableLabel] = highWater.isoformat()
+        _saveState(state)
+    logging.info("Exported {0} rows from {1}.".format(countRows, tableLabel))
+    return countRows
+
+
+def exportAll(incremental=True):
+    """Export every scraped table. Returns rows written per table."""
+    counts = {}
+    for tableLabel in ['board', 'topic', 'member', 'message']:
+        counts[tableLabel] = exportTable(tableLabel, incremental)
+    return counts
@@ -0,0 +1,18 @@
+""" Export the scraped corpus to partitioned Parquet files. """
+import export
+import logging
+
+# Set to False to rewrite everything instead of only rows changed since
+# the previous export
+incremental = True
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s:%(message)s',
+    datefmt='%m/%d/%Y %I:%M:%S %p')
+
+logging.info("Beginning export to {0}...".format(export.exportDir))
+counts = export.exportAll(incremental)
+for tableLabel, count in sorted(counts.iteritems()):
+    logging.info("Exported {0} {1} rows.".format(count, tableLabel))
+logging.info("All done.")
@@ -1,11 +1,47 @@
 """ Module for loading parsed data from bitcointalk into PostgreSQL. """
 import bitcointalk
+import bloom
+import changes
 import codecs
+import contextlib
 from datetime import datetime
+import logging
 import os
 import pg
-import time
-import unittest
+import pipeline
+import sidindex
+import sys
+import traceback
+
+dataDir = "{0}/data".format(os.path.dirname(os.path.abspath(__file__)))
+
+# Sizing of the filter of stored message IDs kept in dataDir, which is
+# rebuilt twice as large once it holds more
+messageFilterCapacity = 10000000
+messageFilterErrorRate = 0.01
+
+# Entities stored up to this many seconds before the last one read are read
+# again when catching up with the DB, in case they were committed late
+reconcileSlack = 3600
+
+# Record the rows stored that are new or changed in a feed in dataDir (see
+# changes.py), for those downstream to follow
+recordChanges = True
+
+# Worker threads of the stages of crawlTopics that may run more than one;
+# requests are paced globally and writes share one connection, so there is
+# a single fetcher and a single loader
+archiveWorkers = 1
+parseWorkers = 2
+
+# Pages that fail are retried retryBackoff seconds later, doubling with each
+# further failure up to maxRetryBackoff, and given up on after maxAttempts.
+# Pages that fail to parse, or are given up on, are kept as dead letters.
+# A call of retryFailed makes at most retryRequests requests by default.
+retryBackoff = 60
+maxRetryBackoff = 86400
+maxAttempts = 8
+retryRequests = 100
 
 memo = {
     'boards': set(),
@@ -13,6 +49,41 @@ memo = {
     'topics': set()
 }
 
+# Entities (and topic pages) whose units of work were rolled back, as
+# (entity, ID, page) tuples, so that those rolled back by a failed commit of
+# the units pending, rather than by their own failure, are retried too
+rolledBack = []
+
+
+class ParseError(Exception):
+
+    """Raised when a page fails to parse, carrying its HTML."""
+
+    def __init__(self, message, html):
+        Exception.__init__(self, message)
+        self.html = html
+
+
+def _parse(parser, html):
+    """Parse a page, raising any failure as a ParseError."""
+    try:
+        return parser(html)
+    except Exception as e:
+        raise ParseError(str(e), html), None, sys.exc_info()[2]
+
+
+def _parsing(html, iterator):
+    """Pass on what a streaming parser of a page yields, raising any failure
+    as a ParseError."""
+    while True:
+        try:
+            datum = next(iterator)
+        except StopIteration:
+            return
+        except Exception as e:
+            raise ParseError(str(e), html), None, sys.exc_info()[2]
+        yield datum
+
 
 def _insertBoardPage(data):
     """Insert just the board."""
@@ -20,10 +91,29 @@ def _insertBoardPage(data):
     pg.insertBoard(data)
 
 
+def _insertMessages(messages, quotes):
+    """Insert messages along with the quote edges between them."""
+    """Messages may be streamed from the parser, which fills in quotes as it
+    goes. Returns the ID and member of each message inserted, so that the
+    messages themselves are let go of as they're loaded."""
+    inserted = []
+
+    def collect():
+        for message in messages:
+            inserted.append({'id': message['id'], 'member': message['member']})
+            yield message
+    pg.insertMessages(collect())
+    pg.insertQuotes(quotes, [message['id'] for message in inserted])
+    return inserted
+
+
 def _insertTopicPage(data):
     """Insert data as topic and messages and splice off messages."""
-    pg.insertMessages(data.pop('messages'))
+    # The topic goes first so that message rollups can find its board
+    messages = data.pop('messages')
+    quotes = data.pop('quotes')
     pg.insertTopic(data)
+    _insertMessages(messages, quotes)
 
 entityFunctions = {
     'board': {
@@ -49,45 +139,105 @@ entityFunctions = {
 
 def _saveToFile(html, fileType, fileDescriptor):
     """Save given entity to a file."""
-    f = codecs.open("{0}/data/{1}_{2}_{3}.html".format(
-        os.path.dirname(os.path.abspath(__file__)),
-        fileType, fileDescriptor,
+    f = codecs.open("{0}/{1}_{2}_{3}.html".format(
+        dataDir, fileType, fileDescriptor,
         int((datetime.utcnow() - datetime(1970, 1, 1)).total_seconds())),
         'w', 'utf-8')
     f.write(html)
     f.close()
 
 
+def _flushMemo():
+    """Write the IDs stored to the indexes of the memo."""
+    for key in memo.keys():
+        if isinstance(memo[key], sidindex.SidIndex):
+            memo[key].flush()
+
+
 def remember():
     """Remember what's already in the database to avoid re-scraping."""
+    """The IDs are kept in index files in dataDir, shared by the crawlers
+    using it, so only those stored since the last start are read from the DB.
+    IDs scraped are written to the index as their writes are committed, as
+    are the rows stored new or changed to a feed (if recordChanges is set)."""
     global memo
-    cursor = pg.cursor()
     for key in memo.keys():
-        cursor.execute("SELECT sid FROM {0}".format(pg.tables[key[:-1]]))
-        rows = cursor.fetchall()
-        for row in rows:
-            memo[key].add(row[0])
+        entity = key[:-1]
+        index = sidindex.SidIndex("{0}/{1}_ids.idx".format(
+            dataDir, pg.tables[entity]))
+        since = None
+        if index.watermark > 0:
+            since = index.watermark - reconcileSlack
+        watermark = index.watermark
+        for sid, storeTime in pg.iterSidsStoredSince(entity, since):
+            index.add(sid)
+            watermark = max(watermark, storeTime)
+        index.flush()
+        index.setWatermark(watermark)
+        memo[key] = index
+    if _flushMemo not in pg.commitHooks:
+        pg.commitHooks.append(_flushMemo)
+    rememberMessages()
+    if recordChanges:
+        pg.recordChanges(changes.ChangeFeed("{0}/{1}_changes".format(
+            dataDir, pg.tables['message'])))
     return True
 
 
-def _scrape(entity, entityId):
+def rememberMessages(rebuild=False):
+    """Load the filter of stored message IDs, so that messages never stored
+    before skip replacing stored ones."""
+    """The filter is built from the DB if there is none yet, or rebuild is
+    passed, and crawlers sharing dataDir switch to a rebuilt filter as they
+    next use theirs. CAVEAT: A message stored without the filter loaded (or
+    by a crawler using another data directory) is missing from it and would
+    be stored twice, so rebuild after storing messages that way, while no
+    other crawler is storing them."""
+    if pg.messageFilter is not None:
+        pg.messageFilter.close()
+        pg.messageFilter = None
+    path = "{0}/{1}_ids.bloom".format(dataDir, pg.tables['message'])
+    capacity = messageFilterCapacity
+    if os.path.exists(path) and not rebuild:
+        messageFilter = bloom.BloomFilter(path)
+        if len(messageFilter) <= messageFilter.capacity:
+            pg.messageFilter = messageFilter
+            return messageFilter
+        capacity = max(capacity, 2 * len(messageFilter))
+        messageFilter.close()
+    pg.messageFilter = bloom.build(
+        path, pg.iterSids('message'), capacity, messageFilterErrorRate)
+    return pg.messageFilter
+
+
+def _memoize(entity, entityId):
+    """Note an entity as stored."""
+    entityPlural = "{0}s".format(entity)
+    # Forget the entity again should its unit of work be rolled back
+    if entityId not in memo[entityPlural]:
+        memo[entityPlural].add(entityId)
+        pg.onRollback(lambda: memo[entityPlural].discard(entityId))
+
+
+def _scrape(entity, entityId, force=False):
     global memo
     global entityFunctions
     entityPlural = "{0}s".format(entity)
-    if entityId in memo[entityPlural]:
+    if entityId in memo[entityPlural] and not force:
         return entityFunctions[entity]['selector'](entityId)
     else:
         html = entityFunctions[entity]['requestor'](entityId)
         _saveToFile(html, entity, entityId)
-        datum = entityFunctions[entity]['parser'](html)
+        datum = _parse(entityFunctions[entity]['parser'], html)
         entityFunctions[entity]['inserter'](datum)
-        memo[entityPlural].add(entityId)
+        _memoize(entity, entityId)
         return datum
 
 
-def scrapeBoard(boardId):
+def scrapeBoard(boardId, force=False):
     """Scrape information on the specified board."""
-    return _scrape('board', boardId)
+    """Pass force=True to re-scrape a board that is already stored."""
+    return _scrape('board', boardId, force)
 
 
 def scrapeTopicIds(boardId, pageNum):
@@ -95,175 +245,318 @@ def scrapeTopicIds(boardId, pageNum):
     offset = (pageNum-1)*40
     html = bitcointalk.requestBoardPage(boardId, offset)
     _saveToFile(html, "boardpage", "{0}.{1}".format(boardId, offset))
-    data = bitcointalk.parseBoardPage(html)
+    data = _parse(bitcointalk.parseBoardPage, html)
     data = data['topic_ids']
     return data
 
 
-def scrapeMember(memberId):
+def scrapeBoardActivity(boardId):
+    """Scrape the first page of a board, storing the board. Returns
+    (topic ID, last message ID) pairs of the topics listed."""
+    html = bitcointalk.requestBoardPage(boardId)
+    _saveToFile(html, "board", boardId)
+    datum = _parse(bitcointalk.parseBoardPage, html)
+    activity = _parse(bitcointalk.parseBoardActivity, html)
+    _insertBoardPage(datum)
+    _memoize('board', boardId)
+    return activity
+
+
+def scrapeRecentPosts(pageNum=1):
+    """Scrape (topic ID, last message ID) pairs from a page of the latest
+    posts across the forum. Will not store values."""
+    offset = (pageNum-1)*10
+    html = bitcointalk.requestRecentPosts(offset)
+    _saveToFile(html, "recent", offset)
+    return _parse(bitcointalk.parseRecentPosts, html)
+
+
+def scrapeMember(memberId, force=False):
     """Scrape the profile of the specified member."""
-    return _scrape('member', memberId)
+    """Pass force=True to re-scrape a member that is already stored."""
+    return _scrape('member', memberId, force)
 
 
 def scrapeMessages(topicId, pageNum):
-    """Scrape all messages on the specified topic, page combination."""
+    """Scrape all messages on the specified topic, page combination. Returns
+    the ID and member of each."""
     """CAVEAT: Messages are not memoized."""
     offset = (pageNum-1)*20
     html = bitcointalk.requestTopicPage(topicId, offset)
     _saveToFile(html, "topicpage", "{0}.{1}".format(topicId, offset))
-    data = bitcointalk.parseTopicPage(html)
-    data = data['messages']
-    pg.insertMessages(data)
-    return data
+    # Messages are loaded as they are parsed
+    topicIterator = _parsing(html, bitcointalk.iterTopicPage(html))
+    data = next(topicIterator)
+    return _insertMessages(topicIterator, data['quotes'])
 
 
-def scrapeTopic(topicId):
+def scrapeTopic(topicId, force=False):
     """Scrape information on the specified topic."""
-    return _scrape('topic', topicId)
-
-
-class MemoizerTest(unittest.TestCase):
-
-    """"Testing suite for memoizer module."""
-
-    def setUp(self):
-        """Setup tables and memo for test."""
-        # Swap and sub tables
-        self.tablesOriginal = pg.tables
-        pg.tables = {}
-        for key, table in self.tablesOriginal.iteritems():
-            pg.tables[key] = "{0}_test".format(table)
-
-        # Create test tables
-        cur = pg.cursor()
-        for key, table in pg.tables.iteritems():
-            cur.execute("""CREATE TABLE IF NOT EXISTS
-                {0} (LIKE {1} INCLUDING ALL)""".format(
-                table, self.tablesOriginal[key]))
-        cur.execute("""COMMIT""")
-
-        # Reset memo
-        global memo
-        self.memoOriginal = memo
-        memo = {
-            'boards': set(),
-            'members': set(),
-            'topics': set()
-        }
-
-    def tearDown(self):
-        """Teardown tables for test and restore memo."""
-        # Drop test tables
-        cur = pg.cursor()
-        for table in pg.tables.values():
-            cur.execute("""DROP TABLE IF EXISTS
-                {0}""".format(table))
-        cur.execute("""COMMIT""")
-
-        # Undo swap / sub of tables
-        pg.tables = self.tablesOriginal
-
-        # Undo swap / sub of memo
-        global memo
-        memo = self.memoOriginal
-
-    def testScrapeBoard(self):
-        """Test scrapeBoard function."""
-        countRequestedStart = bitcointalk.countRequested
-        datumFirst = scrapeBoard(74)
-        datumSecond = scrapeBoard(74)
-        countRequestedEnd = bitcointalk.countRequested
-        self.assertEqual(countRequestedEnd - countRequestedStart, 1)
-        datumExpected = {
-            'id': 74,
-            'name': 'Legal',
-            'container': 'Bitcoin',
-            'parent': 1,
-            'num_pages': 23
-        }
-        self.assertEqual(datumExpected, datumFirst)
-        self.assertEqual(datumExpected, datumSecond)
-        self.assertEqual(datumFirst, datumSecond)
-
-    def testScrapeMember(self):
-        """Test scrapeMember function."""
-        countRequestedStart = bitcointalk.countRequested
-        datumFirst = scrapeMember(12)
-        datumSecond = scrapeMember(12)
-        countRequestedEnd = bitcointalk.countRequested
-        self.assertEqual(countRequestedEnd - countRequestedStart, 1)
-        datumExpected = {
-            'id': 12,
-            'name': 'nanaimogold',
-            'position': 'Sr. Member',
-            'date_registered': datetime(2009, 12, 9, 19, 23, 55),
-            'last_active': datetime(2014, 6, 3, 0, 38, 1),
-            'email': 'hidden',
-            'website_name': 'Nanaimo Gold Digital Currency Exchange',
-            'website_link': 'https://www.nanaimogold.com/',
-            'bitcoin_address': None,
-            'other_contact_info': None,
-            'signature': '<a href="https://www.nanaimogold.com/" ' +
-            'target="_blank">https://www.nanaimogold.com/</a> ' +
-            '- World\'s first bitcoin exchange service'
-        }
-        self.assertEqual(datumExpected, datumFirst)
-        self.assertEqual(datumExpected, datumSecond)
-        self.assertEqual(datumFirst, datumSecond)
-
-    def testScrapeTopic(self):
-        """Test scrapeTopic function."""
-        countRequestedStart = bitcointalk.countRequested
-        datumFirst = scrapeTopic(14)
-        datumSecond = scrapeTopic(14)
-        countRequestedEnd = bitcointalk.countRequested
-        self.assertEqual(countRequestedEnd - countRequestedStart, 1)
-        datumExpected = {
-            'id': 14,
-            'name': 'Break on the supply\'s increase',
-            'board': 7,
-            'num_pages': 1
-        }
-        self.assertEqual(datumFirst['count_read'], datumSecond['count_read'])
-        self.assertEqual(datumFirst.pop('count_read') > 3057, True)
-        self.assertEqual(datumSecond.pop('count_read') > 3057, True)
-        self.assertEqual(datumExpected, datumFirst)
-        self.assertEqual(datumExpected, datumSecond)
-        self.assertEqual(datumFirst, datumSecond)
-
-        # Make sure we can pull in the associated messages without error
-        pg.selectMessages([53, 56])
-
-    def testScrapeMessages(self):
-        """Test scrapeMessages function."""
-        countRequestedStart = bitcointalk.countRequested
-        data = scrapeMessages(14, 1)
-        countRequestedEnd = bitcointalk.countRequested
-        self.assertEqual(countRequestedEnd - countRequestedStart, 1)
-        self.assertEqual(len(data), 2)
-
-        # Make sure we can pull in the associated messages without error
-        pg.selectMessages([53, 56])
-
-    def testRemember(self):
-        """Test remember function."""
-        scrapeBoard(74)
-        scrapeMember(12)
-        scrapeTopic(14)
-        global memo
-        memo = {
-            'boards': set(),
-            'members': set(),
-            'topics': set()
-        }
-        remember()
-        expectedMemo = {
-            'boards': set([74]),
-            'members': set([12]),
-            'topics': set([14])
-        }
-        self.assertEqual(memo, expectedMemo)
-
-
-if __name__ == "__main__":
-    unittest.main()
+    """Pass force=True to re-scrape a topic that is already stored."""
+    return _scrape('topic', topicId, force)
+
+
+def _fail(entity, entityId, pageNum, failure, html=None):
+    """Queue a page that failed to be retried, keeping it as a dead letter
+    should it have failed to parse or be given up on."""
+    logging.info("Failed to scrape {0} ID {1} page {2}: {3}".format(
+        entity, entityId, pageNum, failure.splitlines()[-1]))
+    with pg.unitOfWork():
+        attempts = pg.insertRetry(entity, entityId, pageNum, failure,
+                                  retryBackoff, maxRetryBackoff)
+        if attempts >= maxAttempts:
+            logging.info("Giving up on {0} ID {1} page {2}.".format(
+                entity, entityId, pageNum))
+            pg.deleteRetry(entity, entityId, pageNum)
+        if html is not None or attempts >= maxAttempts:
+            pg.insertDeadLetter(entity, entityId, pageNum, attempts, html,
+                                failure)
+
+
+def _queueRolledBack(failed=None):
+    """Queue the entities (and pages) rolled back along with the units
+    pending to be retried, but for the one failed, which is up to _fail."""
+    keys = sorted(set(rolledBack) - set([failed]))
+    del rolledBack[:]
+    for entity, entityId, pageNum in keys:
+        logging.info("Rolled back {0} ID {1} page {2}.".format(
+            entity, entityId, pageNum))
+        pg.queueRetries(entity, entityId, [pageNum])
+
+
+@contextlib.contextmanager
+def isolated(entity, entityId, pageNum=0):
+    """Scrape an entity (or topic page) as a unit of work that, should it
+    fail, is rolled back and queued to be retried rather than raising."""
+    """Yields a dictionary whose 'failed' is set on a failure, so that a
+    failure costs that page alone. Pages are numbered from 1, and 0 stands
+    for the entity itself. Within another unit of work the failure is raised
+    to it, as units opened within one can't be rolled back on their own.
+    Should committing the units pending fail, all of them are rolled back,
+    and queued to be retried with the page that failed."""
+    outcome = {'failed': False}
+    if pg.unitDepth > 0:
+        yield outcome
+        return
+    key = (entity, entityId, pageNum)
+    # Committed ahead of the unit, so that a failure can't keep it from
+    # starting
+    try:
+        pg.flushIfDue()
+    except Exception:
+        logging.info("Failed to commit: {0}".format(
+            traceback.format_exc().splitlines()[-1]))
+        _queueRolledBack()
+    try:
+        with pg.unitOfWork():
+            pg.onRollback(lambda: rolledBack.append(key))
+            yield outcome
+    except Exception as e:
+        outcome['failed'] = True
+        _queueRolledBack(key)
+        _fail(entity, entityId, pageNum, traceback.format_exc(),
+              getattr(e, 'html', None))
+
+
+def _scrapeMembers(messages):
+    """Scrape the members posting messages, each on its own."""
+    for message in messages:
+        if message['member'] > 0:
+            with isolated('member', message['member']):
+                scrapeMember(message['member'])
+
+
+def scrapePage(topicId, pageNum):
+    """Scrape the messages on a topic page, then the members posting them.
+    Returns the messages, or None if the page failed."""
+    """A page or member that fails is queued to be retried (see
+    retryFailed), leaving the rest of the page and topic to go on."""
+    with isolated('messages', topicId, pageNum) as outcome:
+        messages = scrapeMessages(topicId, pageNum)
+    if outcome['failed']:
+        return None
+    _scrapeMembers(messages)
+    return messages
+
+
+def _retry(entity, entityId, pageNum):
+    """Scrape an entity (or page) queued to be retried, queueing what it
+    leads to that wasn't scraped for its failure. Returns any messages
+    scraped."""
+    if entity == 'messages':
+        return scrapeMessages(entityId, pageNum)
+    if entity == 'topics':
+        for topicId in scrapeTopicIds(entityId, pageNum):
+            if topicId not in memo['topics']:
+                pg.queueRetries('topic', topicId, [0])
+        return []
+    if entity == 'topic':
+        # Page 1 comes along with the topic itself, then the pages past
+        # those stored, from the one holding the last message
+        lastMessage = pg.selectLastMessages([entityId]).get(entityId)
+        startPage = 2
+        if lastMessage is not None:
+            startPage = max(
+                startPage, (lastMessage['topic_position'] - 1) // 20 + 1)
+        topic = scrapeTopic(entityId, force=True)
+        pg.queueRetries('messages', entityId,
+                        range(startPage, topic['num_pages'] + 1))
+        return []
+    _scrape(entity, entityId, force=True)
+    return []
+
+
+def retryFailed(limit=None):
+    """Retry the pages that failed and are due again, making at most limit
+    requests (retryRequests by default). Returns the number that
+    succeeded."""
+    """Retries are counted apart from the requests of the crawl, so that
+    they don't eat into its budget. A page failing again is put back with a
+    longer wait. Entities are queued as page 0, board pages listing topics
+    as 'topics' and topic pages as 'messages'; retrying a topic or board
+    page queues the pages or topics it leads to. CAVEAT: The members posting
+    on the last page retried may take the requests past the limit."""
+    if limit is None:
+        limit = retryRequests
+    countRequestedStart = bitcointalk.countRequested
+    countRetried = 0
+    while bitcointalk.countRequested - countRequestedStart < limit:
+        due = pg.selectDueRetries(limit)
+        if len(due) == 0:
+            break
+        for retry in due:
+            if bitcointalk.countRequested - countRequestedStart >= limit:
+                break
+            entity, entityId, pageNum = (
+                retry['entity'], retry['sid'], retry['page'])
+            logging.info(">Retrying {0} ID {1} page {2}...".format(
+                entity, entityId, pageNum))
+            with isolated(entity, entityId, pageNum) as outcome:
+                messages = _retry(entity, entityId, pageNum)
+                pg.deleteRetry(entity, entityId, pageNum)
+            if outcome['failed']:
+                continue
+            countRetried += 1
+            _scrapeMembers(messages)
+    return countRetried
+
+
+def _fetchItem(item):
+    """Request the page of a crawl item (see crawlTopics)."""
+    if item.get('known'):
+        return item
+    if item['entity'] == 'messages':
+        offset = (item['page'] - 1) * 20
+        item['html'] = bitcointalk.requestTopicPage(item['id'], offset)
+    else:
+        item['html'] = entityFunctions[item['entity']]['requestor'](
+            item['id'])
+    return item
+
+
+def _archiveItem(item):
+    """Save the page of a crawl item to a file."""
+    if item.get('known'):
+        return item
+    if item['entity'] == 'messages':
+        _saveToFile(item['html'], "topicpage", "{0}.{1}".format(
+            item['id'], (item['page'] - 1) * 20))
+    else:
+        _saveToFile(item['html'], item['entity'], item['id'])
+    return item
+
+
+def _parseItem(item):
+    """Parse the page of a crawl item, letting go of the HTML once parsed."""
+    if item.get('known'):
+        return item
+    if item['entity'] == 'messages':
+        item['datum'] = bitcointalk.parseTopicPage(item['html'])
+    else:
+        item['datum'] = entityFunctions[item['entity']]['parser'](
+            item['html'])
+    del item['html']
+    return item
+
+
+def crawlTopics(topicIds, maxPages=None):
+    """Scrape topics, with their boards, pages (up to maxPages of each) and
+    the members posting on them. Returns the number of messages stored."""
+    """Pages are fetched, archived, parsed and stored by separate stages of
+    a pipeline, each working on a later page while the one before works on
+    an earlier one, so the crawl goes at the pace of the slowest stage.
+    Each page is stored as a unit of work, as are members, who come after the
+    pages they're found on, and units pending are committed once due even
+    while the loader waits on pages. Pages that fail are queued to be
+    retried (see retryFailed), along with what they would have led to. CAVEAT:
+    Pages of topics already stored are scraped again, but page 1 of a new
+    topic only once, with the topic."""
+    queued = set()
+    counts = {'messages': 0}
+
+    def follow(entity, entityId, pageNum=None):
+        """Queue an entity (or topic page) unless stored or queued."""
+        if (entity, entityId, pageNum) in queued:
+            return
+        if entity != 'messages' and entityId in memo["{0}s".format(entity)]:
+            return
+        queued.add((entity, entityId, pageNum))
+        crawl.put({'entity': entity, 'id': entityId, 'page': pageNum})
+
+    def followMembers(messages):
+        for message in messages:
+            if message['member'] > 0:
+                follow('member', message['member'])
+
+    def load(item):
+        """Store the entity or page of a crawl item, queueing what it
+        leads to."""
+        entity = item['entity']
+        if entity == 'messages':
+            datum = item['datum']
+            with pg.unitOfWork():
+                messages = _insertMessages(datum['messages'], datum['quotes'])
+            counts['messages'] += len(messages)
+            followMembers(messages)
+            return None
+        if item.get('known'):
+            datum = entityFunctions[entity]['selector'](item['id'])
+            startPage = 1
+        else:
+            datum = item['datum']
+            messages = datum.get('messages', [])
+            with pg.unitOfWork():
+                entityFunctions[entity]['inserter'](datum)
+                _memoize(entity, item['id'])
+            counts['messages'] += len(messages)
+            followMembers(messages)
+            startPage = 2
+        if entity == 'topic':
+            follow('board', datum['board'])
+            numPages = datum['num_pages']
+            if maxPages is not None:
+                numPages = min(numPages, maxPages)
+            for pageNum in range(startPage, numPages + 1):
+                follow('messages', datum['id'], pageNum)
+        return None
+
+    crawl = pipeline.Pipeline([
+        pipeline.Stage('fetch', _fetchItem),
+        pipeline.Stage('archive', _archiveItem, archiveWorkers),
+        pipeline.Stage('parse', _parseItem, parseWorkers),
+        pipeline.Stage('load', load, idle=pg.flushIfDue)
+    ])
+    # Seeded before the stages start, as only the loader reads the memo after
+    for topicId in topicIds:
+        queued.add(('topic', topicId, None))
+        crawl.put({'entity': 'topic', 'id': topicId, 'page': None,
+                   'known': topicId in memo['topics']})
+    crawl.start()
+    crawl.join()
+    crawl.logStats()
+    for stageName, item, failure in crawl.failures:
+        html = None
+        if stageName == 'parse':
+            html = item.get('html')
+        _fail(item['entity'], item['id'], item['page'] or 0, failure, html)
+    return counts['messages']
@@ -1,40 +1,122 @@
 """ Module for loading parsed data from bitcointalk into PostgreSQL. """
-import bitcointalk
+import atexit
 import codecs
-from datetime import date
+import contextlib
 from datetime import datetime
-from datetime import time
-from decimal import Decimal
+from datetime import timedelta
+import gzip
+import itertools
+import json
 import os
-import psycopg2 as pg2
-import psycopg2.extras as pg2ext
 import random
-import unittest
+import records
+import select
+import time
 
 # Configuration variables
 tables = {
     "board": "board",
+    "board_day_activity": "board_day_activity",
+    "dead_letter": "dead_letter",
     "member": "member",
+    "member_activity": "member_activity",
+    "member_day_activity": "member_day_activity",
     "message": "message",
+    "observation": "observation",
+    "quote": "quote",
+    "retry": "retry",
     "topic": "topic"
 }
 
-# Pull in postgres configuration information
-dbcFile = open(
-    "{0}/.pgpass".format(os.path.dirname(os.path.abspath(__file__))),
-    'r')
-dbcRaw = dbcFile.readline().strip().split(':')
-dbcParams = {
-    'database': dbcRaw[2],
-    'user': dbcRaw[3],
-    'password': dbcRaw[4],
-    'host': dbcRaw[0],
-    'port': dbcRaw[1]
+# Number of rows pulled per round trip by server-side (named) cursors
+itersize = 2000
+
+# Maximum number of IDs sent to the DB in a single batched select
+selectChunkSize = 1000
+
+# Span of post times covered by each partition of a partitioned message
+# table, 'month' or 'year', and the suffix naming the partitions
+partitionUnit = 'month'
+partitionFormats = {
+    'month': "%Y_%m",
+    'year': "%Y"
 }
-dbcFile.close()
 
-# Connection variable
+# How far the post time of a re-scraped message may have moved, e.g. when a
+# "Today at" time was first read on another day
+partitionSlack = timedelta(days=2)
+
+# Units of work are committed together once commitUnits of them are pending
+# or the oldest has waited commitSeconds (None for no limit)
+commitUnits = 20
+commitSeconds = 30
+
+# Callables run after each commit, e.g. to record what was committed
+commitHooks = []
+
+# Set to False before connecting for bulk backfills, so that commits don't
+# wait on the disk; a crash may then lose the last few commits, though never
+# part of one
+synchronousCommit = True
+
+# Bloom filter of the IDs of stored messages (see bloom.py), with which
+# messages never seen before skip replacing stored ones; None to always
+# replace. Loaded by memoizer.rememberMessages
+messageFilter = None
+
+# Feed the rows added or changed by each write are recorded in (see
+# changes.py), and the channel listeners are notified on as changes are
+# committed; None to record nothing. Set with recordChanges
+changeFeed = None
+changeChannel = "changes"
+
+# Postgres driver and configuration, loaded on first connection
+pg2 = None
+pg2ext = None
+dbcParams = None
+
+# Connection variables
 conn = None
+readConn = None
+listenConn = None
+partitionConn = None
+countStreams = 0
+
+# Unit of work variables
+unitDepth = 0
+unitHooks = []
+pendingHooks = []
+countPendingUnits = 0
+pendingSince = None
+
+
+def _configure():
+    """Import the driver and read .pgpass. Returns connection parameters."""
+    """Deferred to first use, so that importing this module (and memoizer)
+    stays cheap and works without a DB."""
+    global pg2
+    global pg2ext
+    global dbcParams
+    if dbcParams is not None:
+        return dbcParams
+    import psycopg2
+    import psycopg2.extensions
+    import psycopg2.extras
+    pg2 = psycopg2
+    pg2ext = psycopg2.extras
+    dbcFile = open(
+        "{0}/.pgpass".format(os.path.dirname(os.path.abspath(__file__))),
+        'r')
+    dbcRaw = dbcFile.readline().strip().split(':')
+    dbcFile.close()
+    dbcParams = {
+        'database': dbcRaw[2],
+        'user': dbcRaw[3],
+        'password': dbcRaw[4],
+        'host': dbcRaw[0],
+        'port': dbcRaw[1]
+    }
+    return dbcParams
 
 
 def connect():
@@ -43,7 +125,11 @@ def connect():
     if conn is not None:
         return conn
     else:
-        conn = pg2.connect(**dbcParams)
+        params = _configure()
+        conn = pg2.connect(**params)
+        if not synchronousCommit:
+            conn.cursor().execute("SET synchronous_commit TO off")
+            conn.commit()
         return conn
 
 
@@ -57,32 +143,374 @@ def dictCursor():
     return connect().cursor(cursor_factory=pg2ext.RealDictCursor)
 
 
+def readConnect():
+    """Connect to the database for streaming reads."""
+    """CAVEAT: Named cursors only live as long as their transaction, so they
+    get a connection of their own where writes can't commit them away."""
+    global readConn
+    if readConn is not None:
+        return readConn
+    else:
+        params = _configure()
+        readConn = pg2.connect(**params)
+        return readConn
+
+
+def partitionConnect():
+    """Connect to the database for creating partitions."""
+    """CAVEAT: Partitions are committed as soon as they're created, apart
+    from the writes that need them, so that no lock on the partitioned table
+    is held until those writes are committed."""
+    global partitionConn
+    if partitionConn is not None:
+        return partitionConn
+    else:
+        params = _configure()
+        partitionConn = pg2.connect(**params)
+        return partitionConn
+
+
+def namedCursor(dictionary=True):
+    """Pull a named (server-side) cursor from the read connection."""
+    name = "stream_{0}".format(
+        str(int(pow(10, random.random()*10))).zfill(10))
+    if dictionary:
+        cursor = readConnect().cursor(
+            name, cursor_factory=pg2ext.RealDictCursor)
+    else:
+        cursor = readConnect().cursor(name)
+    cursor.itersize = itersize
+    return cursor
+
+
+def _stream(query, params, dictionary=True):
+    """Yield rows of a query through a server-side cursor."""
+    global countStreams
+    cursor = namedCursor(dictionary)
+    countStreams += 1
+    try:
+        cursor.execute(query, params)
+        for row in cursor:
+            yield row
+    finally:
+        cursor.close()
+        countStreams -= 1
+        # End the read transaction once no other stream depends on it
+        if countStreams == 0:
+            readConnect().commit()
+
+
+def _commit(cursor):
+    """Commit the writes made through a cursor."""
+    """Within a unit of work, they're left to be committed with the unit.
+    Outside, any units pending are committed along with them."""
+    if unitDepth == 0:
+        _commitPending(cursor)
+
+
+def _runHooks(hooks):
+    """Call rollback hooks, latest first."""
+    for hook in reversed(hooks):
+        hook()
+
+
+@contextlib.contextmanager
+def unitOfWork():
+    """Group the writes made within into one unit of work, such as a topic
+    page with its topic row and the members newly found on it."""
+    """Units are committed together, once commitUnits are pending or the
+    oldest has waited commitSeconds, and by flush(). The wait is checked as
+    units open as well as close, so units pending aren't held by a unit that
+    waits on a request. A unit that raises is rolled back on its own,
+    leaving those pending to be committed. Units opened within a unit are
+    part of it."""
+    global unitDepth
+    global unitHooks
+    global countPendingUnits
+    global pendingSince
+    if unitDepth > 0:
+        unitDepth += 1
+        try:
+            yield
+        finally:
+            unitDepth -= 1
+        return
+    flushIfDue()
+    # A literal COMMIT leaves the driver thinking its transaction is open
+    connection = connect()
+    if (connection.status != pg2.extensions.STATUS_READY and
+            connection.get_transaction_status() ==
+            pg2.extensions.TRANSACTION_STATUS_IDLE):
+        connection.cursor().execute("BEGIN")
+    connection.cursor().execute("SAVEPOINT unit_of_work")
+    unitDepth = 1
+    unitHooks = []
+    try:
+        yield
+    except BaseException:
+        unitDepth = 0
+        connection.cursor().execute("ROLLBACK TO SAVEPOINT unit_of_work")
+        _runHooks(unitHooks)
+        raise
+    unitDepth = 0
+    connection.cursor().execute("RELEASE SAVEPOINT unit_of_work")
+    pendingHooks.extend(unitHooks)
+    countPendingUnits += 1
+    if pendingSince is None:
+        pendingSince = time.time()
+    if countPendingUnits >= commitUnits:
+        flush()
+    else:
+        flushIfDue()
+
+
+def onRollback(hook):
+    """Call hook should the writes of the current unit of work be rolled
+    back, e.g. to forget what the unit stored."""
+    """Outside a unit, writes are committed as they're made, so the hook is
+    dropped."""
+    if unitDepth > 0:
+        unitHooks.append(hook)
+
+
+def _commitPending(cursor):
+    """Commit the transaction, and with it the units of work pending."""
+    """If the commit fails, the rollback hooks of every pending unit are
+    called before the error is raised."""
+    global pendingHooks
+    global countPendingUnits
+    global pendingSince
+    hooks = pendingHooks
+    pendingHooks = []
+    countPendingUnits = 0
+    pendingSince = None
+    try:
+        cursor.connection.commit()
+    except Exception:
+        _runHooks(hooks)
+        raise
+    for hook in commitHooks:
+        hook()
+
+
+def flush():
+    """Commit the units of work pending."""
+    if unitDepth > 0:
+        raise Exception("Cannot flush within a unit of work")
+    if countPendingUnits > 0:
+        _commitPending(cursor())
+
+
+def flushIfDue():
+    """Commit the units of work pending if the oldest has waited
+    commitSeconds."""
+    """Within a unit of work nothing is committed, to be checked again as
+    the unit closes."""
+    if (unitDepth == 0 and pendingSince is not None and
+            commitSeconds is not None and
+            time.time() - pendingSince >= commitSeconds):
+        flush()
+
+# Units completed before the interpreter exits are kept, even if it exits on
+# an error
+atexit.register(flush)
+
+
+def _fields(datum):
+    """Fields to load from a datum."""
+    """Records give the columns they have set, dicts all of their keys."""
+    if isinstance(datum, records.Record):
+        return [field for field in datum.columns if field in datum]
+    else:
+        return datum.keys()
+
+
+def _row(datum, fields):
+    """Tuple of a datum's values for the given fields."""
+    if isinstance(datum, records.Record):
+        return datum.row(fields)
+    else:
+        return tuple([datum[field] for field in fields])
+
+
+def _copyValue(value):
+    """Format a value for the text format of COPY."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    elif not isinstance(value, str):
+        value = str(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace(
+        "\n", "\\n").replace("\r", "\\r")
+
+
+class _CopyStream(object):
+
+    """File-like view of rows in COPY text format, formatted as read."""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ""
+
+    def read(self, size=-1):
+        """Read up to size bytes, pulling in rows as needed."""
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                break
+            line = "\t".join([_copyValue(value) for value in row]) + "\n"
+            chunks.append(line)
+            length += len(line)
+        data = "".join(chunks)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def recordChanges(feed):
+    """Record the rows written from now on that are new or changed in a feed
+    (see changes.py), or stop recording with None."""
+    """Changes are written to the feed once committed, and listeners are
+    then notified on changeChannel. CAVEAT: Changes committed just before a
+    crash may miss the feed."""
+    global changeFeed
+    changeFeed = feed
+    if feed is not None and _flushChanges not in commitHooks:
+        commitHooks.append(_flushChanges)
+
+
+def _jsonObject(alias, fields):
+    """Expression building a JSON object of fields of a table alias."""
+    return "json_build_object({0})".format(",".join(
+        ["'{0}', {1}.{0}".format(field, alias) for field in fields]))
+
+
+def _recordChanges(tableLabel, rows):
+    """Add the changes among (ID, old fields, new fields) tuples of a table to
+    the feed, with old fields None for new rows."""
+    """Changes are taken back should the unit of work be rolled back."""
+    mark = changeFeed.mark()
+    for sid, old, new in rows:
+        if old is None:
+            changeFeed.add(tableLabel, sid, 'insert', None, new)
+            continue
+        changed = [field for field in sorted(new)
+                   if new[field] != old.get(field)]
+        if len(changed) > 0:
+            changeFeed.add(
+                tableLabel, sid, 'update',
+                dict((field, old.get(field)) for field in changed),
+                dict((field, new[field]) for field in changed))
+    feed = changeFeed
+    onRollback(lambda: feed.truncate(mark))
+
+
+def _flushChanges():
+    """Write the changes committed to the feed and notify listeners."""
+    if changeFeed is None:
+        return
+    sequences = changeFeed.flush()
+    if sequences is None or changeChannel is None:
+        return
+    cursor = connect().cursor()
+    cursor.execute("SELECT pg_notify(%s, %s)", (changeChannel, json.dumps(
+        {'first': sequences[0], 'last': sequences[1]})))
+    cursor.connection.commit()
+
+
+def listenChanges(timeout=None):
+    """Wait up to timeout seconds (None for as long as it takes) for changes
+    to be committed. Returns (first, last) pairs of the sequence numbers of
+    the changes notified, if any."""
+    """Listening starts with the first call, on a connection of its own, so
+    read the feed (changes.iterChanges) from the last change seen after the
+    first call and after each one returning changes."""
+    global listenConn
+    if listenConn is None:
+        params = _configure()
+        listenConn = pg2.connect(**params)
+        listenConn.autocommit = True
+        listenConn.cursor().execute("LISTEN {0}".format(changeChannel))
+    if len(listenConn.notifies) == 0:
+        select.select([listenConn], [], [], timeout)
+    listenConn.poll()
+    notified = []
+    for notify in listenConn.notifies:
+        sequences = json.loads(notify.payload)
+        notified.append((sequences['first'], sequences['last']))
+    del listenConn.notifies[:]
+    return notified
+
+
 def _insertSingle(datum, tableLabel):
     """Load a single row in to the database."""
     table = tables[tableLabel]
     cursor = dictCursor()
-    dataFields = datum.keys()
+    dataFields = _fields(datum)
     tableFields = []
     for dataField in dataFields:
         if dataField == "id":
             tableFields.append('sid')
         else:
             tableFields.append(dataField)
+    recording = changeFeed is not None
+    if recording:
+        selectRow = """SELECT {0} AS fields
+            FROM {1} t
+            WHERE sid = %s""".format(_jsonObject('t', tableFields), table)
+        cursor.execute(selectRow, (datum['id'],))
+        old = cursor.fetchone()
+    if tableLabel == 'topic':
+        # Messages stored before their topic count towards board 0
+        cursor.execute("""
+            SELECT COALESCE(board, 0) AS board
+            FROM {0}
+            WHERE sid = %s""".format(table), (datum['id'],))
+        row = cursor.fetchone()
+        oldBoard = 0 if row is None else row['board']
     cursor.execute("""
         DELETE FROM {0}
         WHERE sid = {1}""".format(table, datum['id']))
     cursor.execute("""INSERT INTO {0} ({1}) VALUES ({2})""".format(
         table,
         ",".join(tableFields),
-        ",".join(["%({0})s".format(field) for field in dataFields])), datum)
-    cursor.execute("COMMIT")
+        ",".join(["%s" for field in dataFields])), _row(datum, dataFields))
+    if recording:
+        cursor.execute(selectRow, (datum['id'],))
+        if old is not None:
+            old = old['fields']
+        _recordChanges(
+            tableLabel, [(datum['id'], old, cursor.fetchone()['fields'])])
+    if tableLabel == 'topic' and (datum.get('board') or 0) != oldBoard:
+        _moveBoardActivity(
+            cursor, datum['id'], oldBoard, datum.get('board') or 0)
+
+    # Keep a history of growth for crawl scheduling
+    if tableLabel in ['board', 'topic']:
+        cursor.execute("""
+            INSERT INTO {0} (entity, sid, num_pages, count_read)
+            VALUES (%s, %s, %s, %s)""".format(tables['observation']),
+            (tableLabel, datum['id'], datum['num_pages'],
+             datum.get('count_read')))
+    _commit(cursor)
 
 
 def _insertBatch(data, tableLabel):
     """Load a batch of rows to the database."""
+    """Data may be any iterable, such as a generator of messages being parsed,
+    and is streamed to the DB as it's read."""
     table = tables[tableLabel]
     cursor = dictCursor()
-    dataFields = data[0].keys()
+    iterator = iter(data)
+    first = next(iterator, None)
+    if first is None:
+        return
+    dataFields = _fields(first)
     tableFields = []
     for dataField in dataFields:
         if dataField == "id":
@@ -94,19 +522,115 @@ def _insertBatch(data, tableLabel):
     stagingTable = "{0}_{1}".format(
         table, str(int(pow(10, random.random()*10))).zfill(10))
     cursor.execute("""CREATE TABLE {0} (LIKE {1}
-        )""".format(stagingTable, table))
+        INCLUDING DEFAULTS)""".format(stagingTable, table))
 
-    # Move data into staging table
-    cursor.executemany("""INSERT INTO {0} ({1}) VALUES ({2})""".format(
-        stagingTable,
-        ",".join(tableFields),
-        ",".join(["%({0})s".format(field) for field in dataFields])), data)
+    # Stream data into staging table, noting which rows the message filter
+    # has seen before
+    filtered = tableLabel == 'message' and messageFilter is not None
+    maybeStored = []
 
-    # Delete old data from original table
-    cursor.execute("""
-        DELETE FROM {0} t
-        USING {1} s
-        WHERE t.sid = s.sid""".format(table, stagingTable))
+    def rows():
+        for datum in itertools.chain([first], iterator):
+            if filtered and messageFilter.add(datum['id']):
+                maybeStored.append(datum['id'])
+            yield _row(datum, dataFields)
+    cursor.copy_expert("""COPY {0} ({1}) FROM STDIN
+        WITH (ENCODING 'UTF8')""".format(
+        stagingTable, ",".join(tableFields)), _CopyStream(rows()))
+
+    # Rows are replaced by ID. On a partitioned table, a window around the
+    # batch's post times lets the DB skip the partitions it can't touch,
+    # unless a row that may be stored isn't found within it, having moved
+    # further than partitionSlack
+    replaced = "t.sid = s.sid"
+    if tableLabel == 'message' and _isPartitioned(cursor, table):
+        _ensurePartitions(cursor, table, stagingTable)
+        cursor.execute("""
+            SELECT min(post_time) AS first, max(post_time) AS last
+            FROM {0}""".format(stagingTable))
+        bounds = cursor.fetchone()
+        if bounds['first'] is not None:
+            windowed = cursor.mogrify(
+                replaced + " AND t.post_time BETWEEN %s AND %s",
+                (bounds['first'] - partitionSlack,
+                 bounds['last'] + partitionSlack))
+            candidates = maybeStored
+            if not filtered:
+                cursor.execute("SELECT sid FROM {0}".format(stagingTable))
+                candidates = [row['sid'] for row in cursor.fetchall()]
+            cursor.execute("""
+                SELECT DISTINCT t.sid
+                FROM {0} t
+                JOIN {1} s ON {2}""".format(table, stagingTable, windowed))
+            missing = set(candidates) - set(
+                row['sid'] for row in cursor.fetchall())
+            movedFound = False
+            if len(missing) > 0:
+                cursor.execute("""
+                    SELECT 1
+                    FROM {0}
+                    WHERE sid = ANY(%s)
+                    LIMIT 1""".format(table), (list(missing),))
+                movedFound = cursor.fetchone() is not None
+            if movedFound:
+                replaced = cursor.mogrify(
+                    replaced + " AND t.sid = ANY(%s)", (list(candidates),))
+            else:
+                replaced = windowed
+
+    # Rows the filter has never seen are new, and are simply appended.
+    # Those it may have seen are dropped if they're stored unchanged, and
+    # only what's left replaces stored rows
+    replacing = True
+    if filtered:
+        replacing = False
+        if len(maybeStored) > 0:
+            cursor.execute("""
+                DELETE FROM {0} s
+                USING {1} t
+                WHERE {2}
+                AND ({3}) IS NOT DISTINCT FROM ({4})""".format(
+                stagingTable, table, replaced,
+                ",".join(["s.{0}".format(field) for field in tableFields]),
+                ",".join(["t.{0}".format(field) for field in tableFields])))
+            replacing = cursor.rowcount < len(maybeStored)
+
+    # Note the rows that are new or differ from those stored
+    if changeFeed is not None:
+        changedRows = """
+            SELECT s.sid, NULL::json AS old, {0} AS new
+            FROM {1} s""".format(_jsonObject('s', tableFields), stagingTable)
+        if replacing:
+            changedRows = """
+                SELECT s.sid,
+                    CASE WHEN t.sid IS NULL THEN NULL ELSE {0} END AS old,
+                    {1} AS new
+                FROM {2} s
+                LEFT JOIN {3} t ON {4}
+                WHERE t.sid IS NULL
+                OR ({5}) IS DISTINCT FROM ({6})""".format(
+                _jsonObject('t', tableFields), _jsonObject('s', tableFields),
+                stagingTable, table, replaced,
+                ",".join(["s.{0}".format(field) for field in tableFields]),
+                ",".join(["t.{0}".format(field) for field in tableFields]))
+        cursor.execute(changedRows)
+        _recordChanges(tableLabel, [(row['sid'], row['old'], row['new'])
+                                    for row in cursor.fetchall()])
+
+    if replacing:
+        # Take the rows about to be replaced out of the rollups
+        if tableLabel == 'message':
+            _adjustMessageRollups(cursor, """
+                SELECT t.*
+                FROM {0} t
+                JOIN {1} s ON {2}""".format(table, stagingTable, replaced),
+                -1)
+
+        # Delete old data from original table
+        cursor.execute("""
+            DELETE FROM {0} t
+            USING {1} s
+            WHERE {2}""".format(table, stagingTable, replaced))
 
     # Insert the new data into the target table
     cursor.execute("""
@@ -114,12 +638,178 @@ def _insertBatch(data, tableLabel):
         (SELECT *
         FROM {1})""".format(table, stagingTable))
 
+    # Count the new rows into the rollups
+    if tableLabel == 'message':
+        _adjustMessageRollups(cursor, """
+            SELECT *
+            FROM {0}""".format(stagingTable), 1)
+
     # Drop the staging table
     cursor.execute("""
         DROP TABLE {0}""".format(stagingTable))
 
     # Commit the transaction
-    cursor.execute("COMMIT")
+    _commit(cursor)
+
+
+def _isPartitioned(cursor, table):
+    """Whether a table is partitioned, rather than a plain table."""
+    cursor.execute("""
+        SELECT count(*) AS count
+        FROM pg_partitioned_table
+        WHERE partrelid = to_regclass(%s)""", (table,))
+    return cursor.fetchone()['count'] > 0
+
+
+def _partitionName(table, start):
+    """Name of the partition of a table starting at the given time."""
+    return "{0}_{1}".format(table, start.strftime(
+        partitionFormats[partitionUnit]))
+
+
+def _partitionRange(table, partition):
+    """Start and stop of the post times a partition takes, from its name."""
+    start = datetime.strptime(
+        partition[len(table) + 1:], partitionFormats[partitionUnit])
+    if partitionUnit == 'year':
+        return start, datetime(start.year + 1, 1, 1)
+    else:
+        return start, datetime(
+            start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def _ensurePartitions(cursor, table, stagingTable):
+    """Create the partitions the rows of a staging table will land in."""
+    """Each is created on a connection of its own and committed right away.
+    Created apart and then attached, it only takes a lock on the partitioned
+    table that writes to it don't conflict with (on PostgreSQL 12 or later),
+    so it doesn't wait on the writes pending here or on other crawlers, and
+    the crawlers creating the same partition take turns on an advisory
+    lock."""
+    cursor.execute("""
+        SELECT DISTINCT date_trunc(%s, post_time) AS start
+        FROM {0}
+        WHERE post_time IS NOT NULL""".format(stagingTable), (partitionUnit,))
+    partitions = [_partitionName(table, row['start'])
+                  for row in cursor.fetchall()]
+    connection = partitionConnect()
+    partitionCursor = connection.cursor()
+    try:
+        for partition in partitions:
+            partitionCursor.execute("""
+                SELECT pg_advisory_xact_lock(hashtext(%s))""", (table,))
+            partitionCursor.execute("""
+                SELECT to_regclass(%s)""", (partition,))
+            if partitionCursor.fetchone()[0] is None:
+                partitionCursor.execute("""
+                    CREATE TABLE {0}
+                    (LIKE {1} INCLUDING ALL)""".format(partition, table))
+                partitionCursor.execute("""
+                    ALTER TABLE {0}
+                    ATTACH PARTITION {1}
+                    FOR VALUES FROM (%s) TO (%s)""".format(table, partition),
+                    _partitionRange(table, partition))
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        partitionCursor.close()
+
+
+def _adjustMessageRollups(cursor, messageQuery, sign):
+    """Add (sign 1) or remove (sign -1) messages from the activity rollups."""
+    """Board volume is attributed through the topic table, so messages
+    stored before their topic count towards board 0 until it's stored, and
+    move with the topic should it move board (see _moveBoardActivity)."""
+    cursor.execute("""
+        INSERT INTO {0} AS a (member, day, num_posts)
+        SELECT r.member, r.post_time::date, {1}*count(*)
+        FROM ({2}) r
+        GROUP BY 1, 2
+        ON CONFLICT (member, day) DO UPDATE
+        SET num_posts = a.num_posts + EXCLUDED.num_posts""".format(
+        tables['member_day_activity'], sign, messageQuery))
+    cursor.execute("""
+        INSERT INTO {0} AS a (board, day, num_posts)
+        SELECT COALESCE(t.board, 0), r.post_time::date, {1}*count(*)
+        FROM ({2}) r
+        LEFT JOIN {3} t ON t.sid = r.topic
+        GROUP BY 1, 2
+        ON CONFLICT (board, day) DO UPDATE
+        SET num_posts = a.num_posts + EXCLUDED.num_posts""".format(
+        tables['board_day_activity'], sign, messageQuery, tables['topic']))
+    if sign > 0:
+        timeColumns = "min(r.post_time), max(r.post_time)"
+    else:
+        timeColumns = "NULL::timestamp, NULL::timestamp"
+    cursor.execute("""
+        INSERT INTO {0} AS a (member, num_posts, first_post_time,
+            last_post_time)
+        SELECT r.member, {1}*count(*), {2}
+        FROM ({3}) r
+        GROUP BY 1
+        ON CONFLICT (member) DO UPDATE
+        SET num_posts = a.num_posts + EXCLUDED.num_posts,
+            first_post_time = LEAST(a.first_post_time,
+                EXCLUDED.first_post_time),
+            last_post_time = GREATEST(a.last_post_time,
+                EXCLUDED.last_post_time)""".format(
+        tables['member_activity'], sign, timeColumns, messageQuery))
+    if sign < 0:
+        # Post times of a re-inserted message may have moved, so the first
+        # and last post times of its member are found again without it
+        cursor.execute("""
+            WITH r AS ({0})
+            UPDATE {1} a
+            SET first_post_time = (
+                    SELECT m.post_time
+                    FROM {2} m
+                    WHERE m.member = a.member
+                    AND m.post_time IS NOT NULL
+                    AND NOT EXISTS (SELECT 1 FROM r WHERE r.sid = m.sid)
+                    ORDER BY m.post_time
+                    LIMIT 1),
+                last_post_time = (
+                    SELECT m.post_time
+                    FROM {2} m
+                    WHERE m.member = a.member
+                    AND m.post_time IS NOT NULL
+                    AND NOT EXISTS (SELECT 1 FROM r WHERE r.sid = m.sid)
+                    ORDER BY m.post_time DESC
+                    LIMIT 1)
+            WHERE a.member IN (SELECT member FROM r)""".format(
+            messageQuery, tables['member_activity'], tables['message']))
+
+
+def _moveBoardActivity(cursor, topicId, oldBoard, newBoard):
+    """Move the daily post counts of a topic's messages from the board it
+    was on to the one it moved to."""
+    cursor.execute("""
+        INSERT INTO {0} AS a (board, day, num_posts)
+        SELECT b.board, m.day, b.sign * m.num_posts
+        FROM (
+            SELECT post_time::date AS day, count(*) AS num_posts
+            FROM {1}
+            WHERE topic = %s
+            GROUP BY 1) m
+        CROSS JOIN (VALUES (%s, -1), (%s, 1)) AS b(board, sign)
+        ON CONFLICT (board, day) DO UPDATE
+        SET num_posts = a.num_posts + EXCLUDED.num_posts""".format(
+        tables['board_day_activity'], tables['message']),
+        (topicId, oldBoard, newBoard))
+
+
+def rebuildRollups():
+    """Recompute the activity rollups from the whole message table."""
+    cursor = dictCursor()
+    for tableLabel in ['board_day_activity', 'member_activity',
+                       'member_day_activity']:
+        cursor.execute("DELETE FROM {0}".format(tables[tableLabel]))
+    _adjustMessageRollups(cursor, """
+        SELECT *
+        FROM {0}""".format(tables['message']), 1)
+    _commit(cursor)
 
 
 def insertBoard(datum):
@@ -137,11 +827,144 @@ def insertMessages(data):
     _insertBatch(data, 'message')
 
 
+def insertQuotes(data, messageIds):
+    """Load the quote edges parsed from a batch of messages."""
+    """CAVEAT: All edges of the given messages are replaced, so pass the IDs
+    of every message parsed, including those without quotes."""
+    table = tables['quote']
+    cursor = dictCursor()
+    cursor.execute("""
+        DELETE FROM {0}
+        WHERE message = ANY(%s)""".format(table), (list(messageIds),))
+
+    # Resolve the quoted member from the quoted message where we have it
+    if len(data) > 0:
+        pg2ext.execute_values(cursor, """
+            INSERT INTO {0} (message, position, topic, member,
+                quoted_message, quoted_topic, quoted_member,
+                quoted_member_name)
+            SELECT q.message, q.position, q.topic, q.member,
+                q.quoted_message, q.quoted_topic, m.member,
+                q.quoted_member_name
+            FROM (VALUES %s) AS q (message, position, topic, member,
+                quoted_message, quoted_topic, quoted_member_name)
+            LEFT JOIN {1} m ON m.sid = q.quoted_message""".format(
+            table, tables['message']), data,
+            template="""(%(message)s::bigint, %(position)s::integer,
+                %(topic)s::integer, %(member)s::integer,
+                %(quoted_message)s::bigint, %(quoted_topic)s::integer,
+                %(quoted_member_name)s::varchar)""")
+
+    # Resolve earlier edges which quoted these messages before we had them
+    cursor.execute("""
+        UPDATE {0} q
+        SET quoted_member = m.member
+        FROM {1} m
+        WHERE q.quoted_member IS NULL
+        AND q.quoted_message = m.sid
+        AND m.sid = ANY(%s)""".format(table, tables['message']),
+        (list(messageIds),))
+    _commit(cursor)
+
+
 def insertTopic(datum):
     """Load a single topic."""
     _insertSingle(datum, 'topic')
 
 
+def insertRetry(entity, entityId, pageNum, error, backoff, maxBackoff):
+    """Queue a failed page to be retried, or count another failure of a
+    page queued. Returns the failures counted."""
+    """The page is next due backoff seconds after the first failure,
+    doubling with each further failure up to maxBackoff."""
+    cursor = dictCursor()
+    cursor.execute("""
+        INSERT INTO {0} AS r (entity, sid, page, attempts, next_attempt_time,
+            error)
+        VALUES (%s, %s, %s, 1, current_timestamp + %s * interval '1 second',
+            %s)
+        ON CONFLICT (entity, sid, page) DO UPDATE
+        SET attempts = r.attempts + 1,
+            next_attempt_time = current_timestamp +
+                least(%s * 2 ^ r.attempts, %s) * interval '1 second',
+            error = EXCLUDED.error,
+            db_update_time = current_timestamp
+        RETURNING attempts""".format(tables['retry']),
+        (entity, entityId, pageNum, backoff, error, backoff, maxBackoff))
+    attempts = cursor.fetchone()['attempts']
+    _commit(cursor)
+    return attempts
+
+
+def queueRetries(entity, entityId, pageNums):
+    """Queue pages to be retried straight away, e.g. those not scraped as an
+    earlier page failed. Pages already queued are left as they are."""
+    cursor = dictCursor()
+    cursor.execute("""
+        INSERT INTO {0} (entity, sid, page, attempts, next_attempt_time)
+        SELECT %s, %s, page, 0, current_timestamp
+        FROM unnest(%s::integer[]) AS page
+        ON CONFLICT (entity, sid, page) DO NOTHING""".format(
+        tables['retry']), (entity, entityId, list(pageNums)))
+    _commit(cursor)
+
+
+def deleteRetry(entity, entityId, pageNum):
+    """Take a page off the queue of those to retry."""
+    cursor = dictCursor()
+    cursor.execute("""
+        DELETE FROM {0}
+        WHERE entity = %s
+        AND sid = %s
+        AND page = %s""".format(tables['retry']),
+        (entity, entityId, pageNum))
+    _commit(cursor)
+
+
+def selectDueRetries(limit):
+    """Pull up to limit pages due to be retried, longest due first."""
+    cursor = dictCursor()
+    cursor.execute("""
+        SELECT entity, sid, page, attempts, next_attempt_time, error
+        FROM {0}
+        WHERE next_attempt_time <= current_timestamp
+        ORDER BY next_attempt_time
+        LIMIT %s""".format(tables['retry']), (limit,))
+    return cursor.fetchall()
+
+
+def insertDeadLetter(entity, entityId, pageNum, attempts, html, failure):
+    """Keep a failed page, with its HTML (None if there was none) and the
+    traceback of the failure, replacing any kept before."""
+    """HTML kept before is held on to when there is none this time."""
+    cursor = dictCursor()
+    cursor.execute("""
+        INSERT INTO {0} AS d (entity, sid, page, attempts, html, traceback)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (entity, sid, page) DO UPDATE
+        SET attempts = EXCLUDED.attempts,
+            html = coalesce(EXCLUDED.html, d.html),
+            traceback = EXCLUDED.traceback,
+            db_update_time = current_timestamp""".format(
+        tables['dead_letter']),
+        (entity, entityId, pageNum, attempts, html, failure))
+    _commit(cursor)
+
+
+def selectDeadLetters(entity=None):
+    """Pull the failed pages kept, of some entity or all."""
+    cursor = dictCursor()
+    query = """SELECT entity, sid, page, attempts, html, traceback,
+            db_update_time
+        FROM {0}""".format(tables['dead_letter'])
+    params = None
+    if entity is not None:
+        query += " WHERE entity = %s"
+        params = (entity,)
+    cursor.execute(query + " ORDER BY entity, sid, page", params)
+    return cursor.fetchall()
+
+
 def _selectSingle(datumId, tableLabel):
     """Pull a single datum from the DB."""
     cursor = dictCursor()
@@ -167,15 +990,18 @@ def _selectBatch(dataIds, tableLabel):
     """Pull batch of data from the DB."""
     cursor = dictCursor()
     table = tables[tableLabel]
-    cursor.execute("""SELECT *
-        FROM {0}
-        WHERE sid IN ({1})
-        ORDER BY sid""".format(
-        table, ",".join([str(datumId) for datumId in dataIds])))
-    rows = cursor.fetchall()
+    sortedIds = sorted(dataIds)
+    rows = []
+    for offset in range(0, len(sortedIds), selectChunkSize):
+        cursor.execute("""SELECT *
+            FROM {0}
+            WHERE sid = ANY(%s)
+            ORDER BY sid""".format(table),
+            (sortedIds[offset:offset+selectChunkSize],))
+        rows.extend(cursor.fetchall())
     if len(rows) != len(dataIds):
-        raise Exception("Found {0} entries, but passed {1} IDs").format(
-            len(rows), len(dataIds))
+        raise Exception("Found {0} entries, but passed {1} IDs".format(
+            len(rows), len(dataIds)))
     else:
         for datum in rows:
             del datum['db_update_time']
@@ -183,6 +1009,129 @@ def _selectBatch(dataIds, tableLabel):
         return rows
 
 
+def _iterSelect(tableLabel, condition, params, order):
+    """Yield data matching a condition from the DB, a chunk at a time."""
+    query = """SELECT *
+        FROM {0}
+        WHERE {1}
+        ORDER BY {2}""".format(tables[tableLabel], condition, order)
+    for datum in _stream(query, params):
+        del datum['db_update_time']
+        datum['id'] = datum.pop('sid')
+        yield datum
+
+
+def _selectDailyActivity(tableLabel, column, datumId, startDay, stopDay):
+    """Pull daily post counts in [startDay, stopDay) from a rollup."""
+    cursor = dictCursor()
+    condition = ""
+    params = [datumId]
+    if startDay is not None:
+        condition += " AND day >= %s"
+        params.append(startDay)
+    if stopDay is not None:
+        condition += " AND day < %s"
+        params.append(stopDay)
+    cursor.execute("""SELECT day, num_posts
+        FROM {0}
+        WHERE {1} = %s
+        AND num_posts > 0{2}
+        ORDER BY day""".format(tables[tableLabel], column, condition),
+        params)
+    return cursor.fetchall()
+
+
+def selectBoardDailyActivity(boardId, startDay=None, stopDay=None):
+    """Pull the number of posts per day on a board."""
+    return _selectDailyActivity(
+        'board_day_activity', 'board', boardId, startDay, stopDay)
+
+
+def selectMemberDailyActivity(memberId, startDay=None, stopDay=None):
+    """Pull the number of posts per day by a member."""
+    return _selectDailyActivity(
+        'member_day_activity', 'member', memberId, startDay, stopDay)
+
+
+def selectMemberActivity(memberId):
+    """Pull the post count and first and last post times of a member."""
+    cursor = dictCursor()
+    cursor.execute("""SELECT num_posts, first_post_time, last_post_time
+        FROM {0}
+        WHERE member = %s""".format(tables['member_activity']), (memberId,))
+    rows = cursor.fetchall()
+    if len(rows) == 0:
+        raise Exception("Found 0 entries in DB for member ID {0}".format(
+            memberId))
+    return rows[0]
+
+
+def iterCrawlCandidates(entity):
+    """Yield stored boards, topics or members with their last scrape time."""
+    """Boards and topics also carry the observation preceding the last
+    scrape, as previous_num_pages, previous_count_read and
+    previous_observe_time, all None if there is no earlier observation."""
+    if entity == 'member':
+        query = """SELECT sid, db_update_time
+            FROM {0}""".format(tables['member'])
+        return _stream(query, None)
+    if entity == 'board':
+        columns = "x.sid AS board, NULL::integer AS count_read"
+    else:
+        columns = "x.board, x.count_read"
+    query = """SELECT x.sid, x.num_pages, x.db_update_time, {0},
+            o.num_pages AS previous_num_pages,
+            o.count_read AS previous_count_read,
+            o.observe_time AS previous_observe_time
+        FROM {1} x
+        LEFT JOIN LATERAL (
+            SELECT num_pages, count_read, observe_time
+            FROM {2}
+            WHERE entity = %s
+            AND sid = x.sid
+            AND observe_time < x.db_update_time
+            ORDER BY observe_time DESC
+            LIMIT 1) o ON true""".format(
+        columns, tables[entity], tables['observation'])
+    return _stream(query, (entity,))
+
+
+def iterStaleMembers(ttlDays, defaultTtlDays, settleHours, now):
+    """Yield stored members whose profiles are due a refresh, with their
+    last scrape time and whether they posted after the last activity it
+    showed (changed)."""
+    """A profile is due once it has changed and the member's last post is
+    settleHours before now (UTC), so that members posting a while are
+    scraped once they stop, or once it was scraped longer ago than the time
+    to live for its position, in days (ttlDays, a dictionary keyed by
+    position, or else defaultTtlDays)."""
+    positions = sorted(ttlDays)
+    query = """SELECT x.sid, x.db_update_time,
+            coalesce(a.last_post_time > x.last_active, false) AS changed
+        FROM {0} x
+        LEFT JOIN {1} a ON a.member = x.sid
+        LEFT JOIN unnest(%s::text[], %s::float8[]) AS t(position, ttl)
+            ON t.position = x.position
+        WHERE (a.last_post_time > x.last_active
+            AND a.last_post_time <= %s::timestamp - %s * interval '1 hour')
+        OR x.db_update_time <= %s::timestamp AT TIME ZONE 'UTC' -
+            coalesce(t.ttl, %s) * interval '1 day'""".format(
+        tables['member'], tables['member_activity'])
+    return _stream(query, (
+        positions, [ttlDays[position] for position in positions],
+        now, settleHours, now, defaultTtlDays))
+
+
+def iterObservations(entity, stopTime):
+    """Yield observations of boards or topics made before stopTime (UTC)."""
+    query = """SELECT sid, num_pages, count_read, observe_time
+        FROM {0}
+        WHERE entity = %s
+        AND observe_time < %s::timestamp AT TIME ZONE 'UTC'
+        ORDER BY observe_time""".format(tables['observation'])
+    return _stream(query, (entity, stopTime))
+
+
 def selectBoard(datumId):
     """Pull a single board."""
     return _selectSingle(datumId, 'board')
@@ -193,123 +1142,187 @@ def selectMember(datumId):
     return _selectSingle(datumId, 'member')
 
 
+def _decodeMessage(datum):
+    """Decode the text fields of a message pulled from the DB."""
+    # psycopg2 will not auto-decode UTF-8 strings to Unicode objects
+    datum['content_no_html'] = codecs.decode(
+        datum['content_no_html'], 'utf-8')
+    datum['content_no_quote_no_html'] = codecs.decode(
+        datum['content_no_quote_no_html'], 'utf-8')
+    return datum
+
+
 def selectMessages(dataIds):
     """Pull multiple messages."""
     data = _selectBatch(dataIds, "message")
-    # psycopg2 will not auto-decode UTF-8 strings to Unicode objects
     for datum in data:
-        datum['content_no_html'] = codecs.decode(
-            datum['content_no_html'], 'utf-8')
-        datum['content_no_quote_no_html'] = codecs.decode(
-            datum['content_no_quote_no_html'], 'utf-8')
+        _decodeMessage(datum)
     return data
 
 
-def selectTopic(datumId):
-    """Pull a single topic."""
-    return _selectSingle(datumId, 'topic')
+def selectLastMessages(topicIds):
+    """Pull the ID and topic position of the last message stored of each of
+    the given topics. Returns a dict by topic ID."""
+    cursor = dictCursor()
+    sortedIds = sorted(topicIds)
+    lastMessages = {}
+    for offset in range(0, len(sortedIds), selectChunkSize):
+        cursor.execute("""SELECT DISTINCT ON (topic) topic, sid,
+                topic_position
+            FROM {0}
+            WHERE topic = ANY(%s)
+            ORDER BY topic, topic_position DESC""".format(tables['message']),
+            (sortedIds[offset:offset+selectChunkSize],))
+        for row in cursor.fetchall():
+            lastMessages[row['topic']] = row
+    return lastMessages
 
 
-class PgTest(unittest.TestCase):
-
-    """"Testing suite for pg module."""
-
-    def setUp(self):
-        """Setup tables for test."""
-        # Swap and sub configuration variables
-        global tables
-        self.tablesOriginal = tables
-        tables = {}
-        for key, table in self.tablesOriginal.iteritems():
-            tables[key] = "{0}_test".format(table)
-
-        # Create test tables
-        cur = cursor()
-        for key, table in tables.iteritems():
-            cur.execute("""CREATE TABLE IF NOT EXISTS
-                {0} (LIKE {1} INCLUDING ALL)""".format(
-                table, self.tablesOriginal[key]))
-        cur.execute("""COMMIT""")
-
-    def tearDown(self):
-        """Teardown tables for test."""
-        # Drop test tables
-        global tables
-        cur = cursor()
-        for table in tables.values():
-            cur.execute("""DROP TABLE IF EXISTS
-                {0}""".format(table))
-        cur.execute("""COMMIT""")
-
-        # Undo swap / sub
-        tables = self.tablesOriginal
-
-    def testBoard(self):
-        """Test insert and select board functions."""
-        f = codecs.open("{0}/example/board_74.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'r', 'utf-8')
-        html = f.read()
-        f.close()
-        datum = bitcointalk.parseBoardPage(html)
-        del datum["topic_ids"]
-        insertBoard(datum)
-        # Make sure a second insert doesn't cause problems
-        insertBoard(datum)
-        selectDatum = selectBoard(74)
-        self.assertEqual(datum, selectDatum)
-
-    def testMember(self):
-        """Test insert and select member functions."""
-        f = codecs.open("{0}/example/profile_12.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'r', 'utf-8')
-        html = f.read()
-        f.close()
-        todaysDate = date(2014, 7, 29)
-        datum = bitcointalk.parseProfile(html, todaysDate)
-        insertMember(datum)
-        # Make sure a second insert doesn't cause problems
-        insertMember(datum)
-        selectDatum = selectMember(12)
-        self.assertEqual(datum, selectDatum)
-
-    def testMessages(self):
-        """Test insert and select messages functions."""
-        f = codecs.open("{0}/example/topic_602041.12400.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'r', 'utf-8')
-        html = f.read()
-        f.close()
-        data = bitcointalk.parseTopicPage(html)
-        data = data['messages']
-        insertMessages(data)
-        # Make sure a second insert doesn't cause problems
-        insertMessages(data)
-        selectData = selectMessages(
-            [
-                8125509,
-                8125667,
-                8125970,
-                8126348,
-                8126542,
-                8126615,
-                8126655,
-                8126666
-            ])
-        datum = data[0]
-        self.assertEqual(data, selectData)
-
-    def testTopic(self):
-        """Test insert and select topic functions."""
-        f = codecs.open("{0}/example/topic_14.html".format(
-            os.path.dirname(os.path.abspath(__file__))), 'r', 'utf-8')
-        html = f.read()
+def _iterMessages(condition, params, order):
+    """Yield messages matching a condition."""
+    for datum in _iterSelect('message', condition, params, order):
+        yield _decodeMessage(datum)
+
+
+def iterMessagesByTopic(topicId):
+    """Yield all messages in a topic, in topic order."""
+    return _iterMessages("topic = %s", (topicId,), "topic_position")
+
+
+def iterMessagesByMember(memberId):
+    """Yield all messages posted by a member, oldest first."""
+    return _iterMessages("member = %s", (memberId,), "post_time, sid")
+
+
+def iterMessagesByTime(startTime, stopTime):
+    """Yield messages posted in [startTime, stopTime), oldest first."""
+    return _iterMessages(
+        "post_time >= %s AND post_time < %s", (startTime, stopTime),
+        "post_time, sid")
+
+
+def selectMessagePartitions():
+    """Pull the names of the partitions of the message table, oldest first."""
+    cursor = dictCursor()
+    cursor.execute("""
+        SELECT c.relname AS name
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY 1""", (tables['message'],))
+    partitions = [row['name'] for row in cursor.fetchall()]
+    _commit(cursor)
+    return partitions
+
+
+def detachMessagePartitions(stopTime):
+    """Detach partitions of messages posted before stopTime, leaving each a
+    table of its own. Returns the names of the tables detached."""
+    """CAVEAT: Detached messages still count in the activity rollups, and are
+    stored again if re-scraped, so only detach what won't be re-scraped."""
+    table = tables['message']
+    detached = []
+    for partition in selectMessagePartitions():
+        start, stop = _partitionRange(table, partition)
+        if stop <= stopTime:
+            detached.append(partition)
+    cursor = dictCursor()
+    for partition in detached:
+        cursor.execute("""
+            ALTER TABLE {0}
+            DETACH PARTITION {1}""".format(table, partition))
+    _commit(cursor)
+    return detached
+
+
+def archiveMessagePartitions(stopTime, directory):
+    """Detach partitions of messages posted before stopTime, then write each
+    to a gzipped COPY file in directory and drop it. Returns the paths."""
+    """Restore a file with COPY ... FROM into a table like message."""
+    paths = []
+    cursor = dictCursor()
+    for partition in detachMessagePartitions(stopTime):
+        path = "{0}/{1}.tsv.gz".format(directory, partition)
+        f = gzip.open(path, 'wb')
+        cursor.copy_expert("""COPY {0} TO STDOUT
+            WITH (ENCODING 'UTF8')""".format(partition), f)
         f.close()
-        datum = bitcointalk.parseTopicPage(html)
-        del datum['messages']
-        insertTopic(datum)
-        # Make sure a second insert doesn't cause problems
-        insertTopic(datum)
-        selectDatum = selectTopic(14)
-        self.assertEqual(datum, selectDatum)
-
-if __name__ == "__main__":
-    unittest.main()
+        cursor.execute("DROP TABLE {0}".format(partition))
+        _commit(cursor)
+        paths.append(path)
+    return paths
+
+
+def copyRowsStoredSince(tableLabel, expressions, since, f):
+    """Write expressions over the rows of a table stored after since (in
+    seconds since the epoch, or None for all) to a file, in the binary COPY
+    format."""
+    """Expressions refer to the table as x. The rows are read through the
+    read connection, as a stream is."""
+    query = "SELECT {0} FROM {1} x".format(
+        ",".join(expressions), tables[tableLabel])
+    cursor = readConnect().cursor()
+    if since is not None:
+        query += cursor.mogrify(
+            " WHERE x.db_update_time > to_timestamp(%s)", (since,))
+    try:
+        cursor.copy_expert("""COPY ({0}) TO STDOUT
+            WITH (FORMAT binary)""".format(query), f)
+    finally:
+        cursor.close()
+        if countStreams == 0:
+            readConnect().commit()
+
+
+def iterSids(tableLabel):
+    """Yield every ID stored in the given table."""
+    query = "SELECT sid FROM {0}".format(tables[tableLabel])
+    for row in _stream(query, None, False):
+        yield row[0]
+
+
+def iterSidsStoredSince(tableLabel, since):
+    """Yield each ID stored in the given table after since (in seconds since
+    the epoch, or None for all), along with when it was stored."""
+    query = """SELECT sid, extract(epoch FROM db_update_time)::float8
+        FROM {0}""".format(tables[tableLabel])
+    params = None
+    if since is not None:
+        query += " WHERE db_update_time > to_timestamp(%s)"
+        params = (since,)
+    for row in _stream(query, params, False):
+        yield row[0], row[1]
+
+
+def _selectQuotes(column, value):
+    """Pull the quote edges with the given value in an indexed column."""
+    cursor = dictCursor()
+    cursor.execute("""SELECT *
+        FROM {0}
+        WHERE {1} = %s
+        ORDER BY message, position""".format(tables['quote'], column),
+        (value,))
+    rows = cursor.fetchall()
+    for datum in rows:
+        del datum['db_update_time']
+    return rows
+
+
+def selectQuotesOfMessage(messageId):
+    """Pull the edges of every message quoting the given message."""
+    return _selectQuotes('quoted_message', messageId)
+
+
+def selectQuotesOfMember(memberId):
+    """Pull the edges of every message quoting the given member."""
+    return _selectQuotes('quoted_member', memberId)
+
+
+def selectQuotesByMember(memberId):
+    """Pull the edges of every quote the given member has made."""
+    return _selectQuotes('member', memberId)
+
+
+def selectTopic(datumId):
+    """Pull a single topic."""
+    return _selectSingle(datumId, 'topic')
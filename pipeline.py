@@ -0,0 +1,191 @@
+""" Module for running work through stages connected by bounded queues. """
+import logging
+import Queue
+import threading
+import time
+import traceback
+
+# Items a stage's queue holds before the stage feeding it waits on it
+queueSize = 16
+
+# Seconds between checks for an interrupt while waiting on a pipeline
+waitSeconds = 1.0
+
+# Put on a queue for each of its workers to stop them
+_stop = object()
+
+
+class Stage(object):
+
+    """A step of a pipeline, run by worker threads taking items from its
+    queue."""
+    """The function given is called on each item and returns what to pass on
+    to the next stage, or None to drop the item there. Workers waiting on a
+    full queue downstream hold their item, so a slow stage holds back the
+    ones before it rather than letting items pile up. If given, idle is
+    called by a worker every waitSeconds it waits on an empty queue, e.g. to
+    commit the work done so far while the stages before are slow."""
+
+    def __init__(self, name, function, workers=1, queueSize=queueSize,
+                 idle=None):
+        self.name = name
+        self.function = function
+        self.idle = idle
+        self.workers = workers
+        self.queueSize = queueSize
+        self.queue = None
+        self.lock = threading.Lock()
+        self.countProcessed = 0
+        self.countFailed = 0
+        self.busySeconds = 0.0
+        self.blockedSeconds = 0.0
+        self.maxDepth = 0
+        self.totalDepth = 0
+
+    def stats(self):
+        """Items processed and failed, seconds spent on them and waiting to
+        pass them on, and the greatest and mean depth of the queue seen by
+        the workers."""
+        with self.lock:
+            meanDepth = 0.0
+            if self.countProcessed + self.countFailed > 0:
+                meanDepth = float(self.totalDepth) / (
+                    self.countProcessed + self.countFailed)
+            return {
+                'name': self.name,
+                'workers': self.workers,
+                'processed': self.countProcessed,
+                'failed': self.countFailed,
+                'busy_seconds': self.busySeconds,
+                'blocked_seconds': self.blockedSeconds,
+                'max_depth': self.maxDepth,
+                'mean_depth': meanDepth
+            }
+
+
+class Pipeline(object):
+
+    """Stages run at once, each taking the items the previous one passed
+    on."""
+    """Items are put on the first stage's queue, which isn't bounded: it's
+    the list of work to do, which stages may add to as they go (with put())
+    without waiting on each other. Failures are logged and kept in failures,
+    as (stage name, item, traceback) tuples, and the item is dropped."""
+
+    def __init__(self, stages):
+        self.stages = stages
+        for index, stage in enumerate(stages):
+            size = stage.queueSize
+            if index == 0:
+                size = 0
+            stage.queue = Queue.Queue(size)
+        self.condition = threading.Condition()
+        self.countPending = 0
+        self.failures = []
+        self.threads = []
+
+    def put(self, item):
+        """Add an item of work."""
+        with self.condition:
+            self.countPending += 1
+        self.stages[0].queue.put(item)
+
+    def _finish(self):
+        """Note an item as done with."""
+        with self.condition:
+            self.countPending -= 1
+            if self.countPending == 0:
+                self.condition.notify_all()
+
+    def _work(self, index):
+        """Process items of a stage until told to stop."""
+        stage = self.stages[index]
+        while True:
+            if stage.idle is None:
+                item = stage.queue.get()
+            else:
+                try:
+                    item = stage.queue.get(True, waitSeconds)
+                except Queue.Empty:
+                    try:
+                        stage.idle()
+                    except Exception:
+                        logging.info("Failed idling in stage {0}: {1}".format(
+                            stage.name,
+                            traceback.format_exc().splitlines()[-1]))
+                    continue
+            if item is _stop:
+                return
+            depth = stage.queue.qsize()
+            start = time.time()
+            failed = False
+            try:
+                result = stage.function(item)
+            except Exception:
+                failed = True
+                result = None
+                failure = traceback.format_exc()
+                logging.info("Failed in stage {0}: {1}".format(
+                    stage.name, failure.splitlines()[-1]))
+                with self.condition:
+                    self.failures.append((stage.name, item, failure))
+            seconds = time.time() - start
+            with stage.lock:
+                if failed:
+                    stage.countFailed += 1
+                else:
+                    stage.countProcessed += 1
+                stage.busySeconds += seconds
+                stage.maxDepth = max(stage.maxDepth, depth)
+                stage.totalDepth += depth
+            if result is None or index == len(self.stages) - 1:
+                self._finish()
+                continue
+            start = time.time()
+            self.stages[index + 1].queue.put(result)
+            with stage.lock:
+                stage.blockedSeconds += time.time() - start
+
+    def start(self):
+        """Start the workers of every stage."""
+        for index, stage in enumerate(self.stages):
+            for i in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work, args=(index,),
+                    name="{0}-{1}".format(stage.name, i))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def join(self):
+        """Wait for every item to be done with, then stop the workers."""
+        with self.condition:
+            while self.countPending > 0:
+                # Waiting with a timeout leaves the wait open to interrupts
+                self.condition.wait(waitSeconds)
+        for stage in self.stages:
+            for i in range(stage.workers):
+                stage.queue.put(_stop)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def run(self, items):
+        """Put items through the pipeline and wait for them."""
+        for item in items:
+            self.put(item)
+        self.start()
+        self.join()
+
+    def stats(self):
+        """Stats of each stage (see Stage.stats)."""
+        return [stage.stats() for stage in self.stages]
+
+    def logStats(self):
+        """Log the stats of each stage."""
+        for stats in self.stats():
+            logging.info(
+                "Stage {name} ({workers} workers): {processed} processed, "
+                "{failed} failed, {busy_seconds:.1f}s busy, "
+                "{blocked_seconds:.1f}s blocked, queue depth "
+                "{mean_depth:.1f} mean, {max_depth} max".format(**stats))
@@ -0,0 +1,146 @@
+""" Module for the record types of parsed bitcointalk entities. """
+
+
+class Record(object):
+
+    """Slotted record with a dict-compatible view of its fields."""
+    """Fields stored as table columns come first, followed by those the parser
+    hands along with them. Deleted or popped fields are left unset, so they
+    drop out of the view just as they would from a dict."""
+
+    __slots__ = ()
+    columns = ()
+    extras = ()
+    __hash__ = None
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.iteritems():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        delattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.asDict() == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__, repr(self.asDict()))
+
+    def keys(self):
+        """Names of the fields that are set."""
+        return [key for key in self.__slots__ if hasattr(self, key)]
+
+    def values(self):
+        """Values of the fields that are set."""
+        return [getattr(self, key) for key in self.keys()]
+
+    def items(self):
+        """Name, value pairs of the fields that are set."""
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def iteritems(self):
+        """Iterate over name, value pairs of the fields that are set."""
+        for key in self.keys():
+            yield key, getattr(self, key)
+
+    def get(self, key, default=None):
+        """Value of a field, or the default if it isn't set."""
+        if key in self.__slots__:
+            return getattr(self, key, default)
+        return default
+
+    def pop(self, key, *default):
+        """Unset a field and return its value."""
+        if key in self:
+            value = getattr(self, key)
+            delattr(self, key)
+            return value
+        elif len(default) > 0:
+            return default[0]
+        raise KeyError(key)
+
+    def update(self, other):
+        """Set fields from a dict or another record."""
+        for key, value in other.items():
+            self[key] = value
+
+    def asDict(self):
+        """Copy the fields that are set to a plain dict."""
+        return dict(self.items())
+
+    def row(self, fields=None):
+        """Tuple of column values, in the order of fields if given."""
+        """Unset fields come back as None."""
+        if fields is None:
+            fields = self.columns
+        return tuple([getattr(self, field, None) for field in fields])
+
+
+class Board(Record):
+
+    """Board parsed from a board page."""
+
+    columns = ('id', 'name', 'container', 'parent', 'num_pages')
+    extras = ('topic_ids',)
+    __slots__ = columns + extras
+
+
+class Member(Record):
+
+    """Member parsed from a profile page."""
+
+    columns = ('id', 'name', 'position', 'date_registered', 'last_active',
+               'email', 'website_name', 'website_link', 'bitcoin_address',
+               'other_contact_info', 'signature')
+    __slots__ = columns
+
+
+class Message(Record):
+
+    """Message parsed from a topic page."""
+
+    columns = ('id', 'topic', 'topic_position', 'member', 'post_time',
+               'subject', 'link', 'content', 'content_no_html',
+               'content_no_quote', 'content_no_quote_no_html')
+    __slots__ = columns
+
+
+class Topic(Record):
+
+    """Topic parsed from a topic page, with the messages on that page."""
+
+    columns = ('id', 'name', 'board', 'num_pages', 'count_read')
+    extras = ('messages', 'quotes')
+    __slots__ = columns + extras
@@ -0,0 +1,138 @@
+""" Module for serving a local stand-in of bitcointalk.org. """
+import BaseHTTPServer
+import codecs
+import logging
+import os
+from random import random
+import re
+import SocketServer
+import threading
+import time
+import urlparse
+
+# Configuration variables
+latency = 0.0
+errorRate = 0.0
+padding = 0
+
+exampleDir = "{0}/example".format(os.path.dirname(os.path.abspath(__file__)))
+
+# Requests answered with the example pages as they were saved
+examples = {
+    "board=5.600": "board_5.600.html",
+    "board=74.0": "board_74.html",
+    "action=profile;u=12": "profile_12.html",
+    "topic=14.0": "topic_14.html",
+    "topic=602041.12400": "topic_602041.12400.html"
+}
+
+# Example pages rewritten to stand in for any other ID
+templates = {
+    "board": ("board_74.html", re.compile(r"board=74\b"), "board={0}"),
+    "member": ("profile_12.html", re.compile(r"u=12\b"), "u={0}"),
+    "topic": ("topic_602041.12400.html", re.compile(r"topic=602041\b"),
+              "topic={0}")
+}
+
+payloadPatterns = {
+    "board": re.compile(r"^board=(\d+)\.(\d+)$"),
+    "member": re.compile(r"^action=profile;u=(\d+)$"),
+    "topic": re.compile(r"^topic=(\d+)\.(\d+)$")
+}
+
+countServed = 0
+_pageCache = {}
+
+
+def _readExample(fileName):
+    """Read an example page, caching it for later requests."""
+    if fileName not in _pageCache:
+        f = codecs.open("{0}/{1}".format(exampleDir, fileName), 'r', 'utf-8')
+        _pageCache[fileName] = f.read()
+        f.close()
+    return _pageCache[fileName]
+
+
+def _renumberMessages(html, topicId, offset):
+    """Give the messages of a rewritten topic page IDs of their own."""
+    newIds = {}
+
+    def renumber(match):
+        if match.group(1) not in newIds:
+            newIds[match.group(1)] = topicId * 100000 + offset + len(newIds)
+        return "msg{0}".format(newIds[match.group(1)])
+    return re.sub(r"msg(\d+)", renumber, html)
+
+
+def examplePage(payload):
+    """Build the page for a request from the example pages, or None."""
+    if payload in examples:
+        return _readExample(examples[payload])
+    for entity, pattern in payloadPatterns.iteritems():
+        match = pattern.match(payload)
+        if match is None:
+            continue
+        entityId = int(match.group(1))
+        fileName, idPattern, replacement = templates[entity]
+        html = idPattern.sub(
+            replacement.format(entityId), _readExample(fileName))
+        if entity == "topic":
+            html = _renumberMessages(html, entityId, int(match.group(2)))
+        return html
+    return None
+
+# Function building the page for a request payload, None when not found
+pageSource = examplePage
+
+
+class ReplayHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """Request handler answering bitcointalk.org style queries."""
+
+    def do_GET(self):
+        """Answer a query with a page after the configured latency."""
+        global countServed
+        if latency > 0:
+            time.sleep(random()*latency*2)
+        payload = urlparse.urlparse(self.path).query
+        html = None
+        if random() >= errorRate:
+            html = pageSource(payload)
+            status = 404 if html is None else 200
+        else:
+            status = 503
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+        if html is not None:
+            self.wfile.write(html.encode('utf-8'))
+            if padding > 0:
+                self.wfile.write("<!--{0}-->".format(" "*padding))
+        countServed += 1
+
+    def log_message(self, format, *args):
+        """Log requests at debug level rather than to stderr."""
+        logging.debug(format, *args)
+
+
+class ReplayServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    """Threaded HTTP server for the stand-in."""
+
+    daemon_threads = True
+
+
+def start(port=0):
+    """Serve in a background thread. Returns the server's request URL."""
+    server = ReplayServer(("localhost", port), ReplayHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "http://localhost:{0}/index.php".format(
+        server.server_address[1])
+
+
+def serve(port):
+    """Serve in the foreground until interrupted."""
+    server = ReplayServer(("localhost", port), ReplayHandler)
+    server.serve_forever()
@@ -0,0 +1,397 @@
+""" Module for ordering crawl work by staleness and activity. """
+import bitcointalk
+from datetime import datetime
+from datetime import timedelta
+import heapq
+import logging
+import memoizer
+import pg
+import time
+import traceback
+
+# Weights of the priority function. A candidate scores
+#   entity weight * board weight * hours since its last scrape *
+#   (stalenessWeight + pageGrowthWeight * pages gained per hour +
+#    readGrowthWeight * reads gained per hour)
+# where growth is measured between its last two observations.
+stalenessWeight = 1.0
+pageGrowthWeight = 50.0
+readGrowthWeight = 0.05
+entityWeights = {
+    'board': 1.0,
+    'member': 0.2,
+    'topic': 1.0
+}
+boardWeights = {}
+
+# Member profiles are only refreshed once they're due: when the member has
+# posted after the last activity their stored profile shows and then not
+# for memberSettleHours, or when it was scraped longer ago than the days to
+# live for their position (positions rise with activity, so the lower ones
+# go stale sooner). Changed profiles score
+# changedMemberWeight times higher, and at most memberBudgetShare of each
+# round's requests go to profiles.
+memberTtlDays = {
+    'Brand new': 7,
+    'Newbie': 14,
+    'Jr. Member': 14,
+    'Member': 30,
+    'Full Member': 30,
+    'Sr. Member': 60,
+    'Hero Member': 60,
+    'Legendary': 120
+}
+defaultMemberTtlDays = 90
+memberSettleHours = 1.0
+changedMemberWeight = 5.0
+memberBudgetShare = 0.25
+
+# Topics found on refreshed boards that aren't stored yet
+discovered = []
+
+# Stored topics with posts newer than the last message stored, as (topic
+# ID, page of that message) pairs
+changed = []
+
+# Seconds between polls of the latest posts across the forum, and the most
+# pages of them read per poll; pages are read on while every topic listed
+# has changed
+pollSeconds = 60
+maxRecentPages = 5
+lastPollTime = None
+
+
+def _utc(timestamp):
+    """Convert a timestamp to naive UTC."""
+    if timestamp.tzinfo is None:
+        return timestamp
+    return (timestamp - timestamp.utcoffset()).replace(tzinfo=None)
+
+
+def _hours(delta):
+    """Convert a timedelta to hours."""
+    return delta.total_seconds() / 3600.0
+
+
+def _growth(candidate):
+    """Pages and reads gained per hour between the last two observations."""
+    if candidate.get('previous_observe_time') is None:
+        return 0.0, 0.0
+    hours = _hours(_utc(candidate['db_update_time']) -
+                   _utc(candidate['previous_observe_time']))
+    if hours <= 0:
+        return 0.0, 0.0
+    pageRate = max(
+        0, candidate['num_pages'] - candidate['previous_num_pages']) / hours
+    readRate = 0.0
+    if (candidate.get('count_read') is not None and
+            candidate.get('previous_count_read') is not None):
+        readRate = max(0, candidate['count_read'] -
+                       candidate['previous_count_read']) / hours
+    return pageRate, readRate
+
+
+def score(entity, candidate, now=None):
+    """Priority of re-scraping a stored board, topic or member."""
+    if now is None:
+        now = datetime.utcnow()
+    hours = max(0.0, _hours(now - _utc(candidate['db_update_time'])))
+    pageRate, readRate = _growth(candidate)
+    weight = entityWeights[entity] * boardWeights.get(
+        candidate.get('board'), 1.0)
+    if candidate.get('changed'):
+        weight *= changedMemberWeight
+    return weight * hours * (stalenessWeight +
+                             pageGrowthWeight * pageRate +
+                             readGrowthWeight * readRate)
+
+
+def _iterCandidates(entity, now):
+    """Yield the stored boards, topics or members which may be refreshed."""
+    if entity == 'member':
+        return pg.iterStaleMembers(memberTtlDays, defaultMemberTtlDays,
+                                   memberSettleHours, now)
+    return pg.iterCrawlCandidates(entity)
+
+
+def prioritize(entities=('board', 'topic', 'member'), limit=100, now=None):
+    """Pick the highest priority work as (score, entity, ID, pages) tuples."""
+    """Members are only picked once their profiles are due a refresh.
+    CAVEAT: Only the top few candidates are held in memory at a time."""
+    if now is None:
+        now = datetime.utcnow()
+    heap = []
+    for entity in entities:
+        for candidate in _iterCandidates(entity, now):
+            item = (score(entity, candidate, now), entity, candidate['sid'],
+                    candidate.get('num_pages'))
+            if len(heap) < limit:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    return sorted(heap, reverse=True)
+
+
+def requestBudget(seconds):
+    """Number of requests the global rate allows within some seconds."""
+    return int(seconds / bitcointalk.interReqTime)
+
+
+def _remaining(countRequestedStart, budget):
+    """Requests left of a budget."""
+    return budget - (bitcointalk.countRequested - countRequestedStart)
+
+
+def _scrapePages(topicId, startPage, stopPage, countRequestedStart, budget):
+    """Scrape topic pages and their posters while the budget allows."""
+    for pageNum in range(startPage, stopPage + 1):
+        if _remaining(countRequestedStart, budget) <= 0:
+            return
+        # Each page is stored, then the members found on it; a page or
+        # member that fails is queued to be retried
+        with memoizer.isolated('messages', topicId, pageNum) as outcome:
+            messages = memoizer.scrapeMessages(topicId, pageNum)
+        if outcome['failed']:
+            continue
+        for message in messages:
+            if _remaining(countRequestedStart, budget) <= 0:
+                return
+            if message['member'] > 0:
+                with memoizer.isolated('member', message['member']):
+                    memoizer.scrapeMember(message['member'])
+
+
+def _refreshTopic(topicId, knownPages, countRequestedStart, budget):
+    """Re-scrape a topic and the pages it gained since last time."""
+    # Page 1 comes along with the topic itself
+    with memoizer.isolated('topic', topicId) as outcome:
+        topic = memoizer.scrapeTopic(topicId, force=knownPages is not None)
+    if outcome['failed']:
+        return
+    startPage = 2
+    if knownPages is not None:
+        startPage = max(startPage, knownPages)
+    _scrapePages(topicId, startPage, topic['num_pages'],
+                 countRequestedStart, budget)
+
+
+def _refreshBoard(boardId, countRequestedStart, budget):
+    """Re-scrape a board and queue the topics on its first page with posts
+    we don't have."""
+    with memoizer.isolated('board', boardId) as outcome:
+        activity = memoizer.scrapeBoardActivity(boardId)
+    if not outcome['failed']:
+        discover(activity)
+
+
+def discover(activity):
+    """Queue the topics of (topic ID, latest message ID) pairs whose latest
+    message isn't stored. Returns how many of them that is."""
+    lastMessages = pg.selectLastMessages(
+        [topicId for topicId, messageId in activity])
+    queued = dict(changed)
+    countChanged = 0
+    for topicId, messageId in activity:
+        lastMessage = lastMessages.get(topicId)
+        if lastMessage is not None and lastMessage['sid'] >= messageId:
+            continue
+        countChanged += 1
+        if topicId not in memoizer.memo['topics']:
+            if topicId not in discovered:
+                discovered.append(topicId)
+        elif topicId not in queued:
+            knownPages = 1
+            if lastMessage is not None:
+                knownPages = (lastMessage['topic_position'] - 1) // 20 + 1
+            changed.append((topicId, knownPages))
+            queued[topicId] = knownPages
+    return countChanged
+
+
+def _poll(countRequestedStart, budget):
+    """Queue topics with activity in the latest posts across the forum."""
+    for pageNum in range(1, maxRecentPages + 1):
+        if _remaining(countRequestedStart, budget) <= 0:
+            return
+        try:
+            activity = memoizer.scrapeRecentPosts(pageNum)
+        except Exception as e:
+            # Polled again come the next poll, so there's nothing to retry,
+            # but pages that fail to parse are kept as dead letters
+            failure = traceback.format_exc()
+            logging.info("Could not poll the latest posts: {0}".format(
+                failure.splitlines()[-1]))
+            if isinstance(e, memoizer.ParseError):
+                pg.insertDeadLetter('recent', 0, pageNum, 1, e.html, failure)
+            return
+        # Stop at the first page that lists posts we have
+        if discover(activity) < len(activity):
+            return
+
+
+def _catchUp(countRequestedStart, budget, refreshed):
+    """Poll for activity when it's time to, then scrape the topics found
+    new or changed, adding their IDs to refreshed."""
+    global lastPollTime
+    if lastPollTime is None or time.time() - lastPollTime >= pollSeconds:
+        lastPollTime = time.time()
+        _poll(countRequestedStart, budget)
+    while len(discovered) > 0 and _remaining(countRequestedStart, budget) > 0:
+        topicId = discovered.pop(0)
+        logging.info(">Scraping discovered topic ID {0}...".format(topicId))
+        _refreshTopic(topicId, None, countRequestedStart, budget)
+        refreshed.add(topicId)
+    while len(changed) > 0 and _remaining(countRequestedStart, budget) > 0:
+        topicId, knownPages = changed.pop(0)
+        logging.info(">Scraping new posts in topic ID {0}...".format(topicId))
+        _refreshTopic(topicId, knownPages, countRequestedStart, budget)
+        refreshed.add(topicId)
+
+
+def run(budget, entities=('board', 'topic', 'member'), now=None):
+    """Spend a request budget on the highest priority work."""
+    """New topics and topics with new posts go first, and are looked for
+    again every pollSeconds, and member profiles get at most
+    memberBudgetShare of the budget. Pages that failed and are due again are
+    then retried (see memoizer.retryFailed), apart from the budget. Returns
+    the requests made."""
+    countRequestedStart = bitcointalk.countRequested
+    refreshed = set()
+    memberBudget = int(budget * memberBudgetShare)
+    _catchUp(countRequestedStart, budget, refreshed)
+    if _remaining(countRequestedStart, budget) > 0:
+        work = prioritize(
+            entities, _remaining(countRequestedStart, budget), now)
+        for priority, entity, entityId, numPages in work:
+            if _remaining(countRequestedStart, budget) <= 0:
+                break
+            if entity == 'topic' and entityId in refreshed:
+                continue
+            if entity == 'member':
+                if memberBudget <= 0:
+                    continue
+                memberBudget -= 1
+            logging.info(">Refreshing {0} ID {1} (priority {2:.1f})...".format(
+                entity, entityId, priority))
+            if entity == 'topic':
+                _refreshTopic(entityId, numPages, countRequestedStart, budget)
+            elif entity == 'board':
+                _refreshBoard(entityId, countRequestedStart, budget)
+            else:
+                with memoizer.isolated('member', entityId):
+                    memoizer.scrapeMember(entityId, force=True)
+            _catchUp(countRequestedStart, budget, refreshed)
+    # Retries have requests of their own, on top of the budget
+    memoizer.retryFailed()
+    # Leave the round's work visible to the next round's priorities
+    pg.flush()
+    return bitcointalk.countRequested - countRequestedStart
+
+
+def simulate(startTime, stopTime, requestsPerHour, prioritized=True):
+    """Replay stored topic observations to measure freshness per request."""
+    """Topics are refreshed either by priority or in plain ID order, as the
+    drivers do. A refresh costs one request plus one per page gained, and
+    may overrun an hour's budget at the expense of the next. Times
+    are UTC; board weights are not applied since observations carry no
+    board."""
+    truth = {}
+    seen = {}
+    stats = {
+        'requests': 0,
+        'pages_gained': 0,
+        'reads_gained': 0
+    }
+    observations = pg.iterObservations('topic', stopTime)
+    pending = next(observations, None)
+    sequentialIds = []
+    sequentialNext = 0
+    available = 0
+    now = startTime
+    while now < stopTime:
+        # Let the forum move on to the present
+        while (pending is not None and
+                _utc(pending['observe_time']) <= now):
+            observation = {
+                'num_pages': pending['num_pages'],
+                'count_read': pending['count_read'],
+                'observe_time': _utc(pending['observe_time'])
+            }
+            truth[pending['sid']] = observation
+            # Topics before the start, or new ones, are known to the crawler
+            if (pending['sid'] not in seen or
+                    observation['observe_time'] < startTime):
+                if pending['sid'] not in seen:
+                    sequentialIds.append(pending['sid'])
+                seen[pending['sid']] = {
+                    'current': observation,
+                    'previous': seen.get(pending['sid'], {}).get('current')
+                }
+            pending = next(observations, None)
+
+        # Pick the work for this hour
+        if prioritized:
+            scores = []
+            for topicId, state in seen.iteritems():
+                candidate = {
+                    'num_pages': state['current']['num_pages'],
+                    'count_read': state['current']['count_read'],
+                    'db_update_time': state['current']['observe_time'],
+                    'previous_observe_time': None
+                }
+                if state['previous'] is not None:
+                    candidate['previous_num_pages'] = (
+                        state['previous']['num_pages'])
+                    candidate['previous_count_read'] = (
+                        state['previous']['count_read'])
+                    candidate['previous_observe_time'] = (
+                        state['previous']['observe_time'])
+                scores.append((score('topic', candidate, now), topicId))
+            work = [topicId for priority, topicId in
+                    heapq.nlargest(requestsPerHour, scores)]
+        else:
+            sequentialIds.sort()
+            work = []
+            for i in range(min(requestsPerHour, len(sequentialIds))):
+                work.append(
+                    sequentialIds[(sequentialNext + i) % len(sequentialIds)])
+
+        # Refresh topics while the hour's budget lasts, with any overrun
+        # taken out of the next hour
+        available += requestsPerHour
+        for topicId in work:
+            if available <= 0:
+                break
+            state = seen[topicId]
+            pagesGained = max(0, truth[topicId]['num_pages'] -
+                              state['current']['num_pages'])
+            available -= 1 + pagesGained
+            stats['requests'] += 1 + pagesGained
+            if not prioritized:
+                sequentialNext += 1
+            stats['pages_gained'] += pagesGained
+            if (truth[topicId]['count_read'] is not None and
+                    state['current']['count_read'] is not None):
+                stats['reads_gained'] += max(
+                    0, truth[topicId]['count_read'] -
+                    state['current']['count_read'])
+            observation = dict(truth[topicId])
+            observation['observe_time'] = now
+            seen[topicId] = {
+                'current': observation,
+                'previous': state['current']
+            }
+        now += timedelta(hours=1)
+    observations.close()
+
+    # What is still missing at the end
+    stats['pages_stale'] = 0
+    for topicId, observation in truth.iteritems():
+        stats['pages_stale'] += max(0, observation['num_pages'] -
+                                    seen[topicId]['current']['num_pages'])
+    if stats['requests'] > 0:
+        stats['pages_per_request'] = (
+            float(stats['pages_gained']) / stats['requests'])
+    else:
+        stats['pages_per_request'] = 0.0
+    return stats
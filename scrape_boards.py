@@ -3,8 +3,8 @@ import bitcointalk
 import logging
 import memoizer
 import os
+import pg
 import sys
-import traceback
 
 boardId = 74
 
@@ -22,30 +22,29 @@ logging.info("Found {0} topic pages in board...".format(
     board['num_pages']))
 for boardPageNum in range(1, board['num_pages'] + 1):
     logging.info(">Scraping page {0}...".format(boardPageNum))
-    topicIds = memoizer.scrapeTopicIds(boardId, boardPageNum)
+    with memoizer.isolated('topics', boardId, boardPageNum) as outcome:
+        topicIds = memoizer.scrapeTopicIds(boardId, boardPageNum)
+    if outcome['failed']:
+        continue
     for topicId in topicIds:
         logging.info(">>Starting scrape of topic ID {0}...".format(topicId))
-        try:
+        # A topic or page that fails is queued to be retried at the end
+        with memoizer.isolated('topic', topicId) as outcome:
             topic = memoizer.scrapeTopic(topicId)
-        except Exception as e:
-            print '-'*60
-            print "Could not request URL for topic {0}:".format(topicId)
-            print traceback.format_exc()
-            print '-'*60
-            logging.info(">>Could not request URL for topic {0}:".format(
-                topicId))
+        if outcome['failed']:
             continue
         logging.info(">>Found {0} message pages in topic...".format(
             topic['num_pages']))
         for topicPageNum in range(1, topic['num_pages'] + 1):
             logging.info(">>>Scraping page {0}...".format(topicPageNum))
-            messages = memoizer.scrapeMessages(topic['id'], topicPageNum)
-            for message in messages:
-                if message['member'] > 0:
-                    memoizer.scrapeMember(message['member'])
+            # Each page is stored, then the members found on it
+            memoizer.scrapePage(topic['id'], topicPageNum)
             logging.info(">>>Done with page {0}.".format(topicPageNum))
         logging.info(">>Done scraping topic ID {0}.".format(topicId))
     logging.info(">Done with page {0}.".format(boardPageNum))
 
+logging.info("Retrying pages that failed...")
+memoizer.retryFailed()
+pg.flush()
 logging.info("All done.")
 logging.info("Made {0} requests in total.".format(bitcointalk.countRequested))
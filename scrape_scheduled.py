@@ -0,0 +1,38 @@
+""" Crawler that keeps stored data fresh in priority order. """
+import bitcointalk
+from datetime import datetime
+from datetime import timedelta
+import logging
+import memoizer
+import scheduler
+
+# Seconds of requests handed out per round of scheduling
+roundSeconds = 3600
+
+# Set to True to replay the stored history instead of crawling
+simulation = False
+simulationDays = 7
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s:%(message)s',
+    datefmt='%m/%d/%Y %I:%M:%S %p')
+
+if simulation:
+    stopTime = datetime.utcnow()
+    startTime = stopTime - timedelta(days=simulationDays)
+    requestsPerHour = scheduler.requestBudget(3600)
+    for prioritized in [False, True]:
+        stats = scheduler.simulate(
+            startTime, stopTime, requestsPerHour, prioritized)
+        logging.info("{0}: {1}".format(
+            "Priority order" if prioritized else "ID order", stats))
+else:
+    # Make sure we don't rescrape information already in the DB
+    memoizer.remember()
+    while True:
+        budget = scheduler.requestBudget(roundSeconds)
+        logging.info("Beginning round of {0} requests...".format(budget))
+        scheduler.run(budget)
+        logging.info("Made {0} requests in total.".format(
+            bitcointalk.countRequested))
@@ -3,11 +3,13 @@ import bitcointalk
 import logging
 import memoizer
 import os
+import pg
 import sys
-import traceback
 
 startTopicId = 1
 stopTopicId = 50
+# Fetch, archive, parse and store pages at once (see memoizer.crawlTopics)
+pipelined = True
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,29 +19,30 @@ logging.basicConfig(
 # Make sure we don't rescrape information already in the DB
 memoizer.remember()
 
-for topicId in range(startTopicId, stopTopicId+1):
-    logging.info(">Starting scrape of topic ID {0}...".format(topicId))
-    try:
-        topic = memoizer.scrapeTopic(topicId)
-    except Exception as e:
-        print '-'*60
-        print "Could not request URL for topic {0}:".format(topicId)
-        print traceback.format_exc()
-        print '-'*60
-        logging.info(">Could not request URL for topic {0}:".format(topicId))
-        continue
-    logging.info(">Scraping related board...")
-    memoizer.scrapeBoard(topic['board'])
-    logging.info(">Found {0} message pages...".format(
-        topic['num_pages'] - 1))
-    for pageNum in range(1, topic['num_pages'] + 1):
-        logging.info(">>Scraping page {0}...".format(pageNum))
-        messages = memoizer.scrapeMessages(topic['id'], pageNum)
-        for message in messages:
-            if message['member'] > 0:
-                memoizer.scrapeMember(message['member'])
-        logging.info(">>Done with page {0}.".format(pageNum))
-    logging.info(">Done scraping topic ID {0}.".format(topicId))
+if pipelined:
+    memoizer.crawlTopics(range(startTopicId, stopTopicId+1))
+else:
+    for topicId in range(startTopicId, stopTopicId+1):
+        logging.info(">Starting scrape of topic ID {0}...".format(topicId))
+        # A topic or page that fails is queued to be retried at the end
+        with memoizer.isolated('topic', topicId) as outcome:
+            topic = memoizer.scrapeTopic(topicId)
+        if outcome['failed']:
+            continue
+        logging.info(">Scraping related board...")
+        with memoizer.isolated('board', topic['board']):
+            memoizer.scrapeBoard(topic['board'])
+        logging.info(">Found {0} message pages...".format(
+            topic['num_pages'] - 1))
+        for pageNum in range(1, topic['num_pages'] + 1):
+            logging.info(">>Scraping page {0}...".format(pageNum))
+            # Each page is stored, then the members found on it
+            memoizer.scrapePage(topic['id'], pageNum)
+            logging.info(">>Done with page {0}.".format(pageNum))
+        logging.info(">Done scraping topic ID {0}.".format(topicId))
 
+logging.info("Retrying pages that failed...")
+memoizer.retryFailed()
+pg.flush()
 logging.info("All done.")
 logging.info("Made {0} requests in total.".format(bitcointalk.countRequested))
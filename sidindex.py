@@ -0,0 +1,217 @@
+""" Module for indexes of stored IDs, kept in memory-mapped files. """
+import contextlib
+import fcntl
+import heapq
+import mmap
+import os
+import struct
+
+# Files hold a header of the magic string, the number of sorted IDs and the
+# time (in seconds since the epoch) the DB was last read up to, followed by
+# the sorted IDs and then by those appended since, unsorted
+magic = "SID1"
+headerFormat = "<4sQd"
+headerSize = struct.calcsize(headerFormat)
+watermarkOffset = headerSize - 8
+idSize = 8
+
+# Appended IDs are merged into the sorted ones once there are this many
+compactSize = 10000
+
+# Number of IDs packed per write when rewriting a file
+writeChunkSize = 65536
+
+
+def _pack(sids):
+    """Pack IDs for a file."""
+    return struct.pack("<{0}q".format(len(sids)), *sids)
+
+
+class SidIndex(object):
+
+    """Set of IDs kept in a file, looked up in place through a memory map,
+    so that processes opening the same file share one copy."""
+    """IDs added are held back until flush() appends them to the file.
+    Other processes pick them up when they look for an ID they don't have.
+    Once enough are appended, the file is rewritten with them sorted in."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = set()
+        self.file = None
+        self.map = None
+        with self._lock():
+            if not os.path.exists(path):
+                f = open(path, 'wb')
+                f.write(struct.pack(headerFormat, magic, 0, 0.0))
+                f.close()
+        self._open()
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """Hold the lock on the file for appending or rewriting it."""
+        lockFile = open("{0}.lock".format(self.path), 'a')
+        try:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+            yield
+        finally:
+            lockFile.close()
+
+    def _open(self):
+        """Map the file and read in the IDs appended to it."""
+        self.close()
+        self.file = open(self.path, 'rb')
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        tag, self.numSorted, self.watermark = struct.unpack(
+            headerFormat, self.file.read(headerSize))
+        if tag != magic:
+            raise Exception("{0} is not an ID index".format(self.path))
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.appended = set()
+        self.offset = headerSize + self.numSorted * idSize
+        self._readAppended()
+
+    def _readAppended(self):
+        """Read the IDs appended to the file since last read."""
+        self.file.seek(self.offset)
+        data = self.file.read()
+        count = len(data) // idSize
+        self.appended.update(struct.unpack(
+            "<{0}q".format(count), data[:count * idSize]))
+        self.offset += count * idSize
+
+    def _refresh(self):
+        """Catch up with the file, reopening it if it was rewritten."""
+        if os.stat(self.path).st_ino != self.inode:
+            self._open()
+        else:
+            self._readAppended()
+
+    def _search(self, sid):
+        """Whether an ID is among the sorted ones."""
+        low = 0
+        high = self.numSorted
+        while low < high:
+            middle = (low + high) // 2
+            value = struct.unpack_from(
+                "<q", self.map, headerSize + middle * idSize)[0]
+            if value < sid:
+                low = middle + 1
+            elif value > sid:
+                high = middle
+            else:
+                return True
+        return False
+
+    def _iterSorted(self):
+        """Yield the sorted IDs."""
+        for offset in range(0, self.numSorted, writeChunkSize):
+            count = min(writeChunkSize, self.numSorted - offset)
+            for sid in struct.unpack_from(
+                    "<{0}q".format(count), self.map,
+                    headerSize + offset * idSize):
+                yield sid
+
+    def __contains__(self, sid):
+        if sid in self.pending or sid in self.appended or self._search(sid):
+            return True
+        self._refresh()
+        return sid in self.appended or self._search(sid)
+
+    def __iter__(self):
+        self._refresh()
+        unsorted = self.appended | self.pending
+        for sid in self._iterSorted():
+            unsorted.discard(sid)
+            yield sid
+        for sid in sorted(unsorted):
+            yield sid
+
+    def __len__(self):
+        return sum(1 for sid in self)
+
+    def add(self, sid):
+        """Add an ID, to be written out by flush()."""
+        self.pending.add(sid)
+
+    def discard(self, sid):
+        """Take back an ID added since the last flush()."""
+        self.pending.discard(sid)
+
+    def _unknown(self, sids):
+        """Those of the given sorted IDs not in the file."""
+        # Many IDs are cheaper to merge with the sorted ones than to search
+        if len(sids) * 32 < self.numSorted:
+            return [sid for sid in sids
+                    if sid not in self.appended and not self._search(sid)]
+        unknown = []
+        sortedIds = self._iterSorted()
+        current = next(sortedIds, None)
+        for sid in sids:
+            while current is not None and current < sid:
+                current = next(sortedIds, None)
+            if sid != current and sid not in self.appended:
+                unknown.append(sid)
+        return unknown
+
+    def flush(self):
+        """Append the IDs added to the file, for every process to see."""
+        added = self._unknown(sorted(self.pending))
+        self.pending = set()
+        if len(added) == 0:
+            return
+        with self._lock():
+            self._refresh()
+            f = open(self.path, 'ab')
+            for offset in range(0, len(added), writeChunkSize):
+                f.write(_pack(added[offset:offset + writeChunkSize]))
+            f.close()
+            self._readAppended()
+            if len(self.appended) >= compactSize:
+                self._compact()
+
+    def _compact(self):
+        """Rewrite the file with the appended IDs sorted in."""
+        """Written aside and swapped in, so that readers of the old file keep
+        a consistent view of it. Called with the lock held."""
+        temporaryPath = "{0}.tmp".format(self.path)
+        f = open(temporaryPath, 'wb')
+        f.write(struct.pack(headerFormat, magic, 0, self.watermark))
+        count = 0
+        chunk = []
+        previous = None
+        for sid in heapq.merge(self._iterSorted(), sorted(self.appended)):
+            if sid == previous:
+                continue
+            previous = sid
+            chunk.append(sid)
+            if len(chunk) == writeChunkSize:
+                f.write(_pack(chunk))
+                count += len(chunk)
+                chunk = []
+        f.write(_pack(chunk))
+        count += len(chunk)
+        f.seek(0)
+        f.write(struct.pack(headerFormat, magic, count, self.watermark))
+        f.close()
+        os.rename(temporaryPath, self.path)
+        self._open()
+
+    def setWatermark(self, watermark):
+        """Record the time (in seconds since the epoch) the DB was read up
+        to."""
+        with self._lock():
+            self._refresh()
+            f = open(self.path, 'r+b')
+            f.seek(watermarkOffset)
+            f.write(struct.pack("<d", watermark))
+            f.close()
+        self.watermark = watermark
+
+    def close(self):
+        """Unmap the file."""
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = None
+            self.file = None
@@ -11,13 +11,46 @@ CREATE TABLE IF NOT EXISTS message (
     content_no_quote TEXT,
     content_no_quote_no_html TEXT,
     db_update_time TIMESTAMP WITH TIME ZONE DEFAULT current_timestamp,
-    PRIMARY KEY (sid)
-);
+    PRIMARY KEY (sid, post_time)
+) PARTITION BY RANGE (post_time);
+-- Partitions are created by the loader as messages arrive (see pg.py).
+-- The primary key of a partitioned table has to include post_time, so it
+-- no longer keeps sid unique: the loader does, replacing stored messages
+-- by sid wherever their post time has moved, and writes made around it
+-- must do the same. Messages without a post time can't be stored.
 CREATE INDEX ON message (topic, topic_position);
 CREATE INDEX ON message (topic, member);
 CREATE INDEX ON message (member, topic);
+CREATE INDEX ON message (member, post_time);
 CREATE INDEX ON message (post_time);
 
+CREATE TABLE IF NOT EXISTS observation (
+    entity VARCHAR(10),
+    sid INTEGER,
+    num_pages INTEGER,
+    count_read INTEGER,
+    observe_time TIMESTAMP WITH TIME ZONE DEFAULT current_timestamp
+);
+CREATE INDEX ON observation (entity, sid, observe_time);
+CREATE INDEX ON observation (observe_time);
+
+CREATE TABLE IF NOT EXISTS quote (
+    message BIGINT,
+    position INTEGER,
+    topic INTEGER,
+    member INTEGER,
+    quoted_message BIGINT,
+    quoted_topic INTEGER,
+    quoted_member INTEGER,
+    quoted_member_name VARCHAR(255),
+    db_update_time TIMESTAMP WITH TIME ZONE DEFAULT current_timestamp,
+    PRIMARY KEY (message, position)
+);
+CREATE INDEX ON quote (quoted_message);
+CREATE INDEX ON quote (quoted_member, member);
+CREATE INDEX ON quote (member, quoted_member);
+CREATE INDEX ON quote (quoted_topic);
+
 CREATE TABLE IF NOT EXISTS topic (
     sid INTEGER,
     name VARCHAR(255),
@@ -29,6 +62,7 @@ CREATE TABLE IF NOT EXISTS topic (
 );
 CREATE INDEX ON topic (name);
 CREATE INDEX ON topic (board);
+CREATE INDEX ON topic (db_update_time);
 
 CREATE TABLE IF NOT EXISTS board (
     sid INTEGER,
@@ -40,6 +74,7 @@ CREATE TABLE IF NOT EXISTS board (
     PRIMARY KEY(sid)
 );
 CREATE INDEX ON board (name);
+CREATE INDEX ON board (db_update_time);
 
 CREATE TABLE IF NOT EXISTS member (
     sid INTEGER,
@@ -57,4 +92,49 @@ CREATE TABLE IF NOT EXISTS member (
     PRIMARY KEY(sid)
 );
 CREATE INDEX ON member (name);
-CREATE INDEX ON member (bitcoin_address);
\ No newline at end of file
+CREATE INDEX ON member (bitcoin_address);
+CREATE INDEX ON member (db_update_time);
+
+CREATE TABLE IF NOT EXISTS member_activity (
+    member INTEGER,
+    num_posts INTEGER,
+    first_post_time TIMESTAMP,
+    last_post_time TIMESTAMP,
+    PRIMARY KEY (member)
+);
+
+CREATE TABLE IF NOT EXISTS member_day_activity (
+    member INTEGER,
+    day DATE,
+    num_posts INTEGER,
+    PRIMARY KEY (member, day)
+);
+
+CREATE TABLE IF NOT EXISTS board_day_activity (
+    board INTEGER,
+    day DATE,
+    num_posts INTEGER,
+    PRIMARY KEY (board, day)
+);
+
+CREATE TABLE IF NOT EXISTS retry (
+    entity VARCHAR(10),
+    sid INTEGER,
+    page INTEGER,
+    attempts INTEGER,
+    next_attempt_time TIMESTAMP WITH TIME ZONE,
+    error TEXT,
+    db_update_time TIMESTAMP WITH TIME ZONE DEFAULT current_timestamp,
+    PRIMARY KEY (entity, sid, page)
+);
+
+CREATE TABLE IF NOT EXISTS dead_letter (
+    entity VARCHAR(10),
+    sid INTEGER,
+    page INTEGER,
+    attempts INTEGER,
+    html TEXT,
+    traceback TEXT,
+    db_update_time TIMESTAMP WITH TIME ZONE DEFAULT current_timestamp,
+    PRIMARY KEY (entity, sid, page)
+);
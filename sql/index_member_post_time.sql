@@ -0,0 +1,5 @@
+-- Adds the index on member and post time of create.sql to a message table
+-- created by an earlier version, which lets the first and last post times of
+-- members be found again as their messages are replaced.
+CREATE INDEX IF NOT EXISTS message_member_post_time_idx
+    ON message (member, post_time);
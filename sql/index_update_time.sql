@@ -0,0 +1,7 @@
+-- Adds the indexes on db_update_time of create.sql to tables created by an
+-- earlier version, which let crawlers read only the IDs stored since their
+-- last start (see memoizer.remember).
+CREATE INDEX IF NOT EXISTS board_db_update_time_idx ON board (db_update_time);
+CREATE INDEX IF NOT EXISTS member_db_update_time_idx
+    ON member (db_update_time);
+CREATE INDEX IF NOT EXISTS topic_db_update_time_idx ON topic (db_update_time);
@@ -0,0 +1,65 @@
+-- Moves a message table created before partitioning to the partitioned
+-- layout of create.sql, one partition per month of posting. The old table
+-- is kept as message_unpartitioned; drop it once the copy is checked.
+-- Messages without a post time have no partition to go to, so nothing is
+-- moved while there are any; rescrape or remove them first.
+BEGIN;
+
+DO $$
+DECLARE
+    countUndated BIGINT;
+BEGIN
+    SELECT count(*) INTO countUndated
+    FROM message
+    WHERE post_time IS NULL;
+    IF countUndated > 0 THEN
+        RAISE EXCEPTION '% messages have no post time', countUndated;
+    END IF;
+END $$;
+
+ALTER TABLE message RENAME TO message_unpartitioned;
+ALTER TABLE message_unpartitioned
+    RENAME CONSTRAINT message_pkey TO message_unpartitioned_pkey;
+
+CREATE TABLE message (
+    sid BIGINT,
+    topic INTEGER,
+    topic_position INTEGER,
+    member INTEGER,
+    post_time TIMESTAMP,
+    subject TEXT,
+    link TEXT,
+    content TEXT,
+    content_no_html TEXT,
+    content_no_quote TEXT,
+    content_no_quote_no_html TEXT,
+    db_update_time TIMESTAMP WITH TIME ZONE DEFAULT current_timestamp,
+    PRIMARY KEY (sid, post_time)
+) PARTITION BY RANGE (post_time);
+CREATE INDEX ON message (topic, topic_position);
+CREATE INDEX ON message (topic, member);
+CREATE INDEX ON message (member, topic);
+CREATE INDEX ON message (member, post_time);
+CREATE INDEX ON message (post_time);
+
+DO $$
+DECLARE
+    start TIMESTAMP;
+BEGIN
+    FOR start IN
+        SELECT DISTINCT date_trunc('month', post_time)
+        FROM message_unpartitioned
+        WHERE post_time IS NOT NULL
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF message FOR VALUES FROM (%L) TO (%L)',
+            'message_' || to_char(start, 'YYYY_MM'),
+            start, start + interval '1 month');
+    END LOOP;
+END $$;
+
+INSERT INTO message
+SELECT *
+FROM message_unpartitioned;
+
+COMMIT;
@@ -0,0 +1,616 @@
+""" Module for generating synthetic forum pages for scale testing. """
+import bitcointalk
+import codecs
+from datetime import datetime
+from datetime import timedelta
+import json
+import os
+import random
+import re
+
+# Shape of the generated forum
+seed = 1
+numBoards = 10
+numTopics = 1000
+numMembers = 5000
+messagesPerTopic = 60
+messagesPerPage = 20
+topicsPerPage = 40
+postsPerRecentPage = 10
+
+# Shape of the generated messages
+bodySize = 400
+quoteRate = 0.3
+quoteDepth = 3
+guestRate = 0.05
+unicodeRate = 0.1
+signatureRate = 0.5
+
+startTime = datetime(2011, 1, 1)
+messageIdStride = 100000
+
+words = [
+    "bitcoin", "block", "chain", "miner", "wallet", "exchange", "price",
+    "hash", "difficulty", "node", "fork", "the", "a", "to", "of", "and",
+    "is", "it", "that", "for", "you", "we", "this", "will", "not", "coin",
+    "address", "transaction", "fee", "confirm", "pool", "reward", "I'm"
+]
+unicodeWords = [
+    u"\u00fcber", u"caf\u00e9", u"\u20ac100", u"\u65e5\u672c\u8a9e",
+    u"\u0431\u0438\u0442\u043a\u043e\u0439\u043d", u"na\u00efve",
+    u"\u00a0", u"\u2014", u"\u00a3", u"\u00bfqu\u00e9?"
+]
+
+pagePatterns = {
+    "board": re.compile(r"^board=(\d+)\.(\d+)$"),
+    "recent": re.compile(r"^action=recent;start=(\d+)$"),
+    "member": re.compile(r"^action=profile;u=(\d+)$"),
+    "topic": re.compile(r"^topic=(\d+)\.(\d+)$")
+}
+
+
+def _rng(*keys):
+    """Random generator that depends only on the seed and the given keys."""
+    state = seed
+    for key in keys:
+        state = (state * 1000003 + key) % 4294967291
+    return random.Random(state)
+
+
+def _escape(text):
+    """Serialize text the way lxml.html.tostring does."""
+    out = []
+    for ch in text:
+        if ch == u"&":
+            out.append("&amp;")
+        elif ch == u"<":
+            out.append("&lt;")
+        elif ch == u">":
+            out.append("&gt;")
+        elif ord(ch) > 127:
+            out.append("&#{0};".format(ord(ch)))
+        else:
+            out.append(str(ch))
+    return "".join(out)
+
+
+def _formatTime(timestamp):
+    """Format a timestamp as the forum does."""
+    return timestamp.strftime("%B %d, %Y, %I:%M:%S %p")
+
+
+def _words(rng, size):
+    """Roughly size characters of text."""
+    chosen = []
+    length = 0
+    while length < size:
+        if rng.random() < unicodeRate:
+            word = rng.choice(unicodeWords)
+        else:
+            word = unicode(rng.choice(words))
+        chosen.append(word)
+        length += len(word) + 1
+    return u" ".join(chosen)
+
+
+def _memberName(memberId):
+    """Name of a member."""
+    if memberId % 7 == 0:
+        return u"J\u00fcrgen{0}".format(memberId)
+    return u"member{0}".format(memberId)
+
+
+def _boardOf(topicId):
+    """Board a topic belongs to."""
+    return 1 + (topicId - 1) % numBoards
+
+
+def _boardName(boardId):
+    """Name of a board."""
+    return u"Board {0}".format(boardId)
+
+
+def _boardParent(boardId):
+    """Parent of a board, if any."""
+    if boardId % 3 == 0:
+        return boardId - 1
+    return None
+
+
+def _containerName(boardId):
+    """Name of the container holding a board."""
+    return u"Container {0}".format(1 + (boardId - 1) % 3)
+
+
+def _topicName(topicId):
+    """Name of a topic."""
+    rng = _rng(1, topicId)
+    return u"Topic {0}: {1}".format(topicId, _words(rng, 30))
+
+
+def _poster(topicId, position):
+    """Member who made the message at a position of a topic, 0 for guests."""
+    rng = _rng(2, topicId, position)
+    if rng.random() < guestRate:
+        return 0
+    return rng.randint(1, numMembers)
+
+
+def _messageId(topicId, position):
+    """ID of the message at a position of a topic."""
+    return long(topicId * messageIdStride + position)
+
+
+def _postTime(topicId, position):
+    """Time of the message at a position of a topic."""
+    return startTime + timedelta(
+        hours=topicId, minutes=position * 17, seconds=position % 60)
+
+
+def _numPages(count, perPage):
+    """Number of pages needed to list count items."""
+    return max(1, (count + perPage - 1) // perPage)
+
+
+def _pageLinks(url, pageNum, numPages, perPage):
+    """Page navigation the way the forum abbreviates it."""
+    shown = set([1, numPages])
+    shown.update(range(max(1, pageNum - 2), min(numPages, pageNum + 2) + 1))
+    links = []
+    previous = 0
+    for page in sorted(shown):
+        if page - previous > 1:
+            links.append("<b> ... </b>")
+        if page == pageNum:
+            links.append("[<b>{0}</b>]".format(page))
+        else:
+            links.append('<a class="navPages" href="{0}.{1}">{2}</a>'.format(
+                url, (page - 1) * perPage, page))
+        previous = page
+    return "Pages: {0} ".format(" ".join(links))
+
+
+def _quote(topicId, position, depth, rng):
+    """A quote block of an earlier message and its expected edge."""
+    """Returns html, text, quoted message ID and quoted member name."""
+    quotedPosition = rng.randint(1, position - 1)
+    quotedId = _messageId(topicId, quotedPosition)
+    quotedMember = _poster(topicId, quotedPosition)
+    if quotedMember == 0:
+        quotedName = u"Guest"
+    else:
+        quotedName = _memberName(quotedMember)
+    header = u"Quote from: {0} on {1}".format(
+        quotedName, _formatTime(_postTime(topicId, quotedPosition)))
+    innerHtml = ""
+    innerText = u""
+    if depth > 1 and quotedPosition > 1:
+        innerHtml, innerText, i, n = _quote(
+            topicId, quotedPosition, depth - 1, rng)
+    body = _words(rng, bodySize // 4)
+    innerHtml += _escape(body)
+    innerText += body
+    html = ('<div class="quoteheader"><a href="{0}?topic={1}.msg{2}#msg{2}">'
+            '{3}</a></div><div class="quote">{4}<br></div><br>').format(
+        bitcointalk.baseUrl, topicId, quotedId, _escape(header), innerHtml)
+    return html, header + innerText, quotedId, quotedName
+
+
+def _message(topicId, position):
+    """Row of a message in a topic page and its expected parse."""
+    rng = _rng(3, topicId, position)
+    messageId = _messageId(topicId, position)
+    memberId = _poster(topicId, position)
+    m = {
+        'id': messageId,
+        'topic': topicId,
+        'topic_position': position,
+        'member': memberId,
+        'post_time': _postTime(topicId, position),
+        'link': "{0}?topic={1}.msg{2}#msg{2}".format(
+            bitcointalk.baseUrl, topicId, messageId)
+    }
+    if position == 1:
+        m['subject'] = _topicName(topicId)
+    else:
+        m['subject'] = u"Re: {0}".format(_topicName(topicId))
+
+    # Body, with a quote of an earlier message up front
+    quote = None
+    html = ""
+    text = u""
+    if position > 1 and rng.random() < quoteRate:
+        quoteHtml, quoteText, quotedId, quotedName = _quote(
+            topicId, position, rng.randint(1, quoteDepth), rng)
+        html += quoteHtml
+        text += quoteText
+        quote = {
+            'message': messageId,
+            'position': 0,
+            'topic': topicId,
+            'member': memberId,
+            'quoted_message': quotedId,
+            'quoted_topic': topicId,
+            'quoted_member_name': quotedName
+        }
+    body = _words(rng, bodySize)
+    bodyHtml = _escape(body)
+    m['content'] = html + bodyHtml
+    m['content_no_html'] = text + body
+    m['content_no_quote'] = ("<br>" + bodyHtml) if quote else bodyHtml
+    m['content_no_quote_no_html'] = body
+
+    if memberId == 0:
+        posterHtml = "<b>Guest</b>"
+    else:
+        posterHtml = ('<b><a href="{0}?action=profile;u={1}" '
+                      'title="View the profile of {2}">{2}</a></b>').format(
+            bitcointalk.baseUrl, memberId, _escape(_memberName(memberId)))
+    signatureHtml = ""
+    if memberId != 0 and rng.random() < signatureRate:
+        signatureHtml = '<div class="signature">{0}</div>'.format(
+            _escape(_words(_rng(4, memberId), 80)))
+    row = """<tr class="n92cad35"><td class="l92cad35">
+<table width="100%" cellpadding="3" cellspacing="0" border="0">
+<tr><td class="windowbg">
+<table width="100%" cellpadding="5" cellspacing="0">
+<tr>
+<td valign="top" width="16%" rowspan="2" class="poster_info">
+{posterHtml}
+<div class="smalltext">Member<br></div>
+</td>
+<td valign="top" width="85%" class="td_headerandpost">
+<table width="100%" border="0"><tr>
+<td valign="middle"><div class="subject" id="subject_{id}"><a href="{link}">\
+{subject}</a></div>
+<div class="smalltext">{postTime}</div></td>
+<td align="right" valign="middle" class="td_buttons"><div>\
+<a class="message_number" href="{link}">#{position}</a></div></td>
+</tr></table>
+<hr width="100%" size="1" class="hrcolor">
+<div class="post">{content}</div>
+</td>
+</tr>
+<tr>
+<td valign="bottom" class="smalltext" width="85%">{signatureHtml}</td>
+</tr>
+</table>
+</td></tr>
+</table>
+</td></tr><tr><td class="l92cad35"></td></tr>
+""".format(
+        posterHtml=posterHtml, id=messageId, link=m['link'],
+        subject=_escape(m['subject']), postTime=_formatTime(m['post_time']),
+        position=position, content=m['content'],
+        signatureHtml=signatureHtml)
+    return row, m, quote
+
+
+def topicPage(topicId, pageNum=1):
+    """Generate a topic page. Returns its html and expected parse."""
+    boardId = _boardOf(topicId)
+    name = _topicName(topicId)
+    numPages = _numPages(messagesPerTopic, messagesPerPage)
+    data = {
+        'id': topicId,
+        'name': name,
+        'board': boardId,
+        'num_pages': numPages,
+        'count_read': _rng(5, topicId).randint(10, 100000),
+        'messages': [],
+        'quotes': []
+    }
+    rows = []
+    firstPosition = (pageNum - 1) * messagesPerPage + 1
+    lastPosition = min(messagesPerTopic, pageNum * messagesPerPage)
+    for position in range(firstPosition, lastPosition + 1):
+        row, m, quote = _message(topicId, position)
+        rows.append(row)
+        data['messages'].append(m)
+        if quote is not None:
+            data['quotes'].append(quote)
+    html = u"""<html><head><title>{name}</title></head><body>
+<div id="bodyarea" style="padding: 1ex 0px 2ex 0px;">
+<a name="top"></a>
+<div><div class="nav"><b><a href="{base}" class="nav">Bitcoin Forum</a></b>\
+ &gt; <b><a href="{base}#1" class="nav">{container}</a></b>\
+ &gt; <b><a href="{base}?board={board}.0" class="nav">{boardName}</a></b>\
+ &gt; <b><a href="{base}?topic={id}.0" class="nav">{name}</a></b></div></div>
+<table width="100%" cellpadding="0" cellspacing="0" border="0"><tr>
+<td class="middletext" valign="bottom">{pages}</td>
+</tr></table>
+<table width="100%" cellpadding="3" cellspacing="0" border="0" class="tborder">
+<tr class="catbg3"><td width="13%"> Author</td>
+<td valign="middle" width="85%" id="top_subject">
+Topic: {name} &#160;(Read {countRead} times)
+</td></tr>
+</table>
+<form action="{base}?action=quickmod2;topic={id}.0" method="post" \
+name="quickModForm" id="quickModForm">
+<table cellpadding="0" cellspacing="0" border="0" width="100%" \
+class="bordercolor">
+{rows}</table>
+</form>
+</div>
+</body></html>""".format(
+        name=name, base=bitcointalk.baseUrl, id=topicId, board=boardId,
+        container=_containerName(boardId), boardName=_boardName(boardId),
+        pages=_pageLinks(u"{0}?topic={1}".format(bitcointalk.baseUrl, topicId),
+                         pageNum, numPages, messagesPerPage),
+        countRead=data['count_read'], rows=u"".join(rows))
+    return html, data
+
+
+def boardPage(boardId, pageNum=1):
+    """Generate a board page. Returns its html and expected parse."""
+    topicIds = range(boardId, numTopics + 1, numBoards)
+    numPages = _numPages(len(topicIds), topicsPerPage)
+    topicIds = topicIds[(pageNum - 1) * topicsPerPage:pageNum * topicsPerPage]
+    parentId = _boardParent(boardId)
+    data = {
+        'id': boardId,
+        'name': _boardName(boardId),
+        'container': _containerName(boardId),
+        'parent': parentId,
+        'num_pages': numPages,
+        'topic_ids': topicIds
+    }
+    navLinks = [
+        u'<b><a href="{0}" class="nav">Bitcoin Forum</a></b>'.format(
+            bitcointalk.baseUrl),
+        u'<b><a href="{0}#1" class="nav">{1}</a></b>'.format(
+            bitcointalk.baseUrl, data['container'])
+    ]
+    if parentId is not None:
+        navLinks.append(u'<b><a href="{0}?board={1}.0" class="nav">{2}</a></b>'
+                        .format(bitcointalk.baseUrl, parentId,
+                                _boardName(parentId)))
+    navLinks.append(u'<b><a href="{0}?board={1}.0" class="nav">{2}</a></b>'
+                    .format(bitcointalk.baseUrl, boardId, data['name']))
+    rows = []
+    for topicId in topicIds:
+        lastPosition = messagesPerTopic
+        lastMember = _poster(topicId, lastPosition)
+        rows.append(u"""<tr>
+<td class="windowbg2" width="5%"></td>
+<td class="windowbg2" width="4%"></td>
+<td class="windowbg" valign="middle">
+<span id="msg_{firstId}"><a href="{base}?topic={id}.0">{name}</a></span>
+</td>
+<td class="windowbg2" width="14%">{starter}</td>
+<td class="windowbg" width="4%" align="center">{replies}</td>
+<td class="windowbg" width="4%" align="center">{views}</td>
+<td class="windowbg2 lastpostcol" width="22%">
+<a href="{base}?topic={id}.msg{lastId}#new">Last post</a>
+<span class="smalltext">{lastTime}<br>by {lastName}</span>
+</td>
+</tr>
+""".format(
+            base=bitcointalk.baseUrl, id=topicId, name=_topicName(topicId),
+            firstId=_messageId(topicId, 1),
+            starter=_memberName(_poster(topicId, 1)),
+            replies=messagesPerTopic - 1,
+            views=_rng(5, topicId).randint(10, 100000),
+            lastId=_messageId(topicId, lastPosition),
+            lastTime=_formatTime(_postTime(topicId, lastPosition)),
+            lastName=_memberName(lastMember) if lastMember else u"Guest"))
+    html = u"""<html><head><title>{name}</title></head><body>
+<div id="bodyarea" style="padding: 1ex 0px 2ex 0px;">
+<div><div class="nav">{nav}</div></div>
+<table width="100%" cellpadding="0" cellspacing="0" border="0"><tr>
+<td class="middletext" id="toppages">{pages}</td>
+</tr></table>
+<div class="tborder">
+<table border="0" width="100%" cellspacing="1" cellpadding="4" \
+class="bordercolor">
+<tr>
+<td width="9%" colspan="2" class="catbg3"></td>
+<td class="catbg3">Subject</td>
+<td class="catbg3" width="11%">Started by</td>
+<td class="catbg3" width="4%" align="center">Replies</td>
+<td class="catbg3" width="4%" align="center">Views</td>
+<td class="catbg3" width="22%">Last post</td>
+</tr>
+{rows}</table>
+</div>
+</div>
+</body></html>""".format(
+        name=data['name'], nav=u" &gt; ".join(navLinks),
+        pages=_pageLinks(u"{0}?board={1}".format(bitcointalk.baseUrl,
+                                                  boardId),
+                         pageNum, numPages, topicsPerPage),
+        rows=u"".join(rows))
+    return html, data
+
+
+def recentPage(pageNum=1):
+    """Generate a page of the latest posts. Returns its html and expected
+    parse."""
+    """The latest two messages of each topic are listed, newest topics
+    first, and each second one quotes a message elsewhere."""
+    posts = []
+    for topicId in range(numTopics, 0, -1):
+        for position in [messagesPerTopic, messagesPerTopic - 1]:
+            if position > 0:
+                posts.append((topicId, position))
+    posts = posts[(pageNum - 1) * postsPerRecentPage:
+                  pageNum * postsPerRecentPage]
+    data = []
+    blocks = []
+    for counter, (topicId, position) in enumerate(posts):
+        messageId = _messageId(topicId, position)
+        if topicId not in [pair[0] for pair in data]:
+            data.append((topicId, messageId))
+        body = _escape(_words(_rng(7, topicId, position), bodySize // 4))
+        if position < messagesPerTopic:
+            quotedId = _messageId(topicId + numTopics, 1)
+            body = ('<div class="quoteheader"><a href="{0}?topic={1}.msg{2}'
+                    '#msg{2}">Quote</a></div><div class="quote">{3}</div>'
+                    ).format(bitcointalk.baseUrl, topicId + numTopics,
+                             quotedId, body) + body
+        boardId = _boardOf(topicId)
+        poster = _poster(topicId, position)
+        blocks.append(u"""<table cellpadding="0" cellspacing="0" width="100%" class="bordercolor"><tr><td>
+<table width="100%" cellpadding="4" cellspacing="1" class="bordercolor">
+<tr class="titlebg2"><td class="middletext">
+<div style="float: left; width: 3ex;">&nbsp;{counter}&nbsp;</div>
+<div style="float: left;">&nbsp;<a href="{base}?board={board}.0">{boardName}</a> / <a href="{base}?topic={topic}.msg{id}#msg{id}">{subject}</a></div>
+<div align="right">&nbsp;on: {time}&nbsp;</div>
+</td></tr>
+<tr><td class="catbg" colspan="3">Posted by: {poster}</td></tr>
+<tr><td class="windowbg2" valign="top" colspan="3"><div class="post">{body}</div></td></tr>
+</table>
+</td></tr></table>
+<br>
+""".format(
+            counter=(pageNum - 1) * postsPerRecentPage + counter + 1,
+            base=bitcointalk.baseUrl, board=boardId,
+            boardName=_boardName(boardId), topic=topicId, id=messageId,
+            subject=_topicName(topicId),
+            time=_formatTime(_postTime(topicId, position)),
+            poster=_memberName(poster) if poster else u"Guest",
+            body=body))
+    html = u"""<html><head><title>Recent Posts</title></head><body>
+<div id="bodyarea" style="padding: 1ex 0px 2ex 0px;">
+{blocks}</div>
+</body></html>""".format(blocks=u"".join(blocks))
+    return html, data
+
+
+def profile(memberId):
+    """Generate a profile page. Returns its html and expected parse."""
+    rng = _rng(6, memberId)
+    registered = startTime - timedelta(days=rng.randint(0, 700),
+                                       seconds=rng.randint(0, 86399))
+    lastActive = startTime + timedelta(days=rng.randint(0, 1000),
+                                       seconds=rng.randint(0, 86399))
+    data = {
+        'id': memberId,
+        'name': _memberName(memberId),
+        'position': rng.choice(
+            ["Newbie", "Jr. Member", "Member", "Full Member", "Sr. Member",
+             "Hero Member", "Legendary"]),
+        'date_registered': registered,
+        'last_active': lastActive,
+        'email': "hidden",
+        'website_name': None,
+        'website_link': None,
+        'bitcoin_address': None,
+        'other_contact_info': None,
+        'signature': None
+    }
+    rows = [
+        ("Name: ", _escape(data['name'])),
+        ("Posts: ", str(rng.randint(1, 5000))),
+        ("Position: ", data['position']),
+        ("Date Registered: ", _formatTime(registered)),
+        ("Last Active: ", _formatTime(lastActive)),
+        ("Email: ", "<i>hidden</i>")
+    ]
+    if rng.random() < 0.5:
+        data['website_name'] = u"Site of {0}".format(data['name'])
+        data['website_link'] = "https://example.com/{0}".format(memberId)
+        rows.append(("Website: ", '<a href="{0}" target="_blank">{1}</a>'
+                     .format(data['website_link'],
+                             _escape(data['website_name']))))
+    if rng.random() < 0.5:
+        data['bitcoin_address'] = "1{0}".format(
+            "".join([rng.choice("123456789ABCDEFGHJKLMNPQRSTUVWXYZ")
+                     for i in range(33)]))
+        rows.append(("Bitcoin Address: ", data['bitcoin_address']))
+    rowsHtml = u"".join([
+        u"<tr>\n<td><b>{0}</b></td>\n<td>{1}</td>\n</tr>\n".format(
+            label, value) for label, value in rows])
+    if rng.random() < signatureRate:
+        data['signature'] = _escape(_words(_rng(4, memberId), 80))
+        rowsHtml += u"""<tr><td colspan="2" height="25">
+<table width="100%" cellpadding="0" cellspacing="0" border="0">
+<tr><td><b>Signature:</b></td></tr>
+<tr><td colspan="2" width="100%" class="smalltext">\
+<div class="signature">{0}</div></td></tr>
+</table>
+</td></tr>
+""".format(data['signature'])
+    html = u"""<html><head><title>View the profile of {name}</title></head>
+<body><div id="bodyarea" style="padding: 1ex 0px 2ex 0px;">
+<table border="0" cellpadding="4" cellspacing="1" align="center" \
+class="bordercolor">
+<tr><td class="windowbg" width="420">
+<table border="0" cellspacing="0" cellpadding="2" width="100%">
+{rows}</table>
+</td></tr>
+<tr><td class="windowbg2" colspan="2">
+<a href="{base}?action=profile;u={id};sa=showPosts">\
+Show the last posts of this person.</a><br>
+</td></tr>
+</table>
+</div></body></html>""".format(
+        name=_escape(data['name']), rows=rowsHtml, base=bitcointalk.baseUrl,
+        id=memberId)
+    return html, data
+
+
+def page(payload):
+    """Generate the page for a request payload, or None if there's none."""
+    """Can serve as replay_server.pageSource."""
+    for entity, pattern in pagePatterns.iteritems():
+        match = pattern.match(payload)
+        if match is None:
+            continue
+        entityId = int(match.group(1))
+        if entity == "recent":
+            return recentPage(entityId // postsPerRecentPage + 1)[0]
+        if entity == "member":
+            if entityId < 1 or entityId > numMembers:
+                return None
+            return profile(entityId)[0]
+        pageNum = int(match.group(2)) // (
+            messagesPerPage if entity == "topic" else topicsPerPage) + 1
+        if entity == "topic":
+            if entityId < 1 or entityId > numTopics:
+                return None
+            return topicPage(entityId, pageNum)[0]
+        if entityId < 1 or entityId > numBoards:
+            return None
+        return boardPage(entityId, pageNum)[0]
+    return None
+
+
+def _jsonDefault(value):
+    """Serialize timestamps in expected output."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def writeCorpus(directory, topicIds):
+    """Write topic pages of the given topics, with their boards and
+    posters, along with the expected parse of each as JSON."""
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    def write(name, html, data):
+        f = codecs.open("{0}/{1}.html".format(directory, name), 'w', 'utf-8')
+        f.write(html)
+        f.close()
+        f = open("{0}/{1}.json".format(directory, name), 'w')
+        json.dump(data, f, default=_jsonDefault, sort_keys=True)
+        f.close()
+
+    boardIds = set()
+    memberIds = set()
+    numPages = _numPages(messagesPerTopic, messagesPerPage)
+    for topicId in topicIds:
+        boardIds.add(_boardOf(topicId))
+        for pageNum in range(1, numPages + 1):
+            html, data = topicPage(topicId, pageNum)
+            write("topic_{0}.{1}".format(
+                topicId, (pageNum - 1) * messagesPerPage), html, data)
+            memberIds.update([m['member'] for m in data['messages']])
+    for boardId in boardIds:
+        html, data = boardPage(boardId)
+        write("board_{0}".format(boardId), html, data)
+    memberIds.discard(0)
+    for memberId in memberIds:
+        html, data = profile(memberId)
+        write("profile_{0}".format(memberId), html, data)
@@ -0,0 +1,111 @@
+""" Tests for the analytics module. """
+import analytics
+import bitcointalk
+import codecs
+from collections import Counter
+from datetime import datetime
+import numpy as np
+import os
+import pg
+import shutil
+import tempfile
+import unittest
+
+rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class AnalyticsTest(unittest.TestCase):
+
+    """"Testing suite for analytics module."""
+
+    def setUp(self):
+        """Setup tables and cache directory for test."""
+        # Swap and sub tables
+        self.tablesOriginal = pg.tables
+        pg.tables = {}
+        for key, table in self.tablesOriginal.iteritems():
+            pg.tables[key] = "{0}_test".format(table)
+
+        # Create test tables
+        cur = pg.cursor()
+        for key, table in pg.tables.iteritems():
+            cur.execute("""CREATE TABLE IF NOT EXISTS
+                {0} (LIKE {1} INCLUDING ALL)""".format(
+                table, self.tablesOriginal[key]))
+        cur.execute("""COMMIT""")
+
+        # Cache to a scratch directory
+        self.cacheDirOriginal = analytics.cacheDir
+        analytics.cacheDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Teardown tables and cache directory for test."""
+        cur = pg.cursor()
+        for table in pg.tables.values():
+            cur.execute("""DROP TABLE IF EXISTS
+                {0}""".format(table))
+        cur.execute("""COMMIT""")
+        pg.tables = self.tablesOriginal
+
+        shutil.rmtree(analytics.cacheDir)
+        analytics.cacheDir = self.cacheDirOriginal
+
+    def testAnalytics(self):
+        """Test caching the corpus and counting posts."""
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)
+        messages = data.pop('messages')
+        del data['quotes']
+        pg.insertTopic(data)
+        pg.insertMessages(messages)
+
+        counts = analytics.refreshAll()
+        self.assertEqual(counts, {'message': len(messages), 'topic': 1})
+        cached = analytics.load('message')
+        self.assertEqual(list(cached['sid']),
+                         sorted([m['id'] for m in messages]))
+
+        members = Counter([m['member'] for m in messages if m['member'] > 0])
+        memberIds, memberCounts = analytics.postsPerMember()
+        self.assertEqual(dict(zip(memberIds, memberCounts)), members)
+        boardIds, boardCounts = analytics.postsPerBoard()
+        self.assertEqual(list(boardIds), [data['board']])
+        self.assertEqual(list(boardCounts), [len(messages)])
+        days = Counter([m['post_time'].date() for m in messages])
+        starts, dayCounts = analytics.postsPerBucket()
+        self.assertEqual(
+            dict(zip([start.astype(datetime).date() for start in starts],
+                     dayCounts)), days)
+        postTimes = [m['post_time'] for m in sorted(
+            messages, key=lambda m: m['topic_position'])]
+        self.assertEqual(
+            list(analytics.replyIntervals()),
+            [(later - earlier).total_seconds()
+             for earlier, later in zip(postTimes[:-1], postTimes[1:])])
+        since = messages[-1]['post_time']
+        memberIds, memberCounts = analytics.postsPerMember(since=since)
+        self.assertEqual(memberCounts.sum(), len(
+            [m for m in messages if m['post_time'] >= since and
+             m['member'] > 0]))
+
+        # Nothing new since the last refresh
+        self.assertEqual(analytics.refreshAll(),
+                         {'message': 0, 'topic': 0})
+
+        # Changed rows replace their cached versions
+        messages[0]['member'] = 1
+        pg.insertMessages(messages[:1])
+        self.assertEqual(analytics.refresh('message'), 1)
+        cached = analytics.load('message')
+        self.assertEqual(len(cached['sid']), len(messages))
+        index = np.searchsorted(cached['sid'], messages[0]['id'])
+        self.assertEqual(cached['member'][index], 1)
+        self.assertEqual(analytics.refresh('message', full=True),
+                         len(messages))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+""" Tests for the bitcointalk module. """
+import bitcointalk
+import codecs
+from datetime import date
+from datetime import datetime
+from datetime import time as tm
+import lxml.html
+import os
+import unittest
+
+rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BitcointalkTest(unittest.TestCase):
+
+    """"Testing suite for bitcointalk module."""
+
+    def testRequestBoardPage(self):
+        """Method for testing requestBoardPate."""
+        html = bitcointalk.requestBoardPage(74)
+        f = codecs.open("{0}/data/test_board_74.html".format(
+            rootDir), 'w', 'utf-8')
+        f.write(html)
+        f.close()
+        title = lxml.html.fromstring(html).cssselect("title")[0].text
+        errorMsg = "Got unexpected output for webpage title: {0}".format(title)
+        self.assertEqual(title, "Legal", errorMsg)
+
+        html = bitcointalk.requestBoardPage(5, 600)
+        f = codecs.open("{0}/data/test_board_5.600.html".format(
+            rootDir), 'w', 'utf-8')
+        f.write(html)
+        f.close()
+
+    def testRequestProfile(self):
+        """Method for testing requestProfile."""
+        html = bitcointalk.requestProfile(12)
+        f = codecs.open("{0}/data/test_profile_12.html".format(
+            rootDir), 'w', 'utf-8')
+        f.write(html)
+        f.close()
+        title = lxml.html.fromstring(html).cssselect("title")[0].text
+        errorMsg = "Got unexpected output for webpage title: {0}".format(title)
+        self.assertEqual(title, "View the profile of nanaimogold", errorMsg)
+
+    def testRequestTopicPage(self):
+        """Method for testing requestTopicPage."""
+        html = bitcointalk.requestTopicPage(14)
+        f = codecs.open("{0}/data/test_topic_14.html".format(
+            rootDir), 'w', 'utf-8')
+        f.write(html)
+        f.close()
+        title = lxml.html.fromstring(html).cssselect("title")[0].text
+        errorMsg = "Got unexpected output for webpage title: {0}".format(title)
+        self.assertEqual(title, "Break on the supply's increase", errorMsg)
+
+        html = bitcointalk.requestTopicPage(602041, 12400)
+        f = codecs.open("{0}/data/test_topic_602041.12400.html".format(
+            rootDir), 'w', 'utf-8')
+        f.write(html)
+        f.close()
+
+    def testParseBoardPage(self):
+        """Method for testing parseBoardPage."""
+        f = codecs.open("{0}/example/board_74.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseBoardPage(html)
+        topicIds = data.pop("topic_ids")
+        expectedData = {
+            'id': 74,
+            'name': 'Legal',
+            'container': 'Bitcoin',
+            'parent': 1,
+            'num_pages': 23,
+        }
+        self.assertEqual(data, expectedData)
+        self.assertEqual(len(topicIds), 40)
+        self.assertEqual(topicIds[0], 96118)
+        self.assertEqual(topicIds[-1], 684343)
+
+        f = codecs.open("{0}/example/board_5.600.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseBoardPage(html)
+        topicIds = data.pop("topic_ids")
+        expectedData = {
+            'id': 5,
+            'name': 'Marketplace',
+            'container': 'Economy',
+            'parent': None,
+            'num_pages': 128,
+        }
+        self.assertEqual(data, expectedData)
+        self.assertEqual(len(topicIds), 40)
+        self.assertEqual(topicIds[0], 423880)
+        self.assertEqual(topicIds[-1], 430401)
+
+    def testParseBoardActivity(self):
+        """Method for testing parseBoardActivity."""
+        f = codecs.open("{0}/example/board_74.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        activity = bitcointalk.parseBoardActivity(html)
+        self.assertEqual(len(activity), 40)
+        self.assertEqual(activity[0], (96118, 5555254))
+        self.assertEqual(activity[-1], (684343, 7916597))
+
+        # A topic without replies is given its first message
+        f = codecs.open("{0}/example/board_5.600.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        activity = dict(bitcointalk.parseBoardActivity(html))
+        self.assertEqual(len(activity), 40)
+        self.assertEqual(activity[441391], 4849810)
+
+    def testParseProfile(self):
+        """Method for testing parseProfile."""
+        f = codecs.open("{0}/example/profile_12.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        todaysDate = date(2014, 7, 29)
+        data = bitcointalk.parseProfile(html, todaysDate)
+        expectedData = {
+            'id': 12,
+            'name': 'nanaimogold',
+            'position': 'Sr. Member',
+            'date_registered': datetime(2009, 12, 9, 19, 23, 55),
+            'last_active': datetime(2014, 7, 29, 0, 38, 1),
+            'email': 'hidden',
+            'website_name': 'Nanaimo Gold Digital Currency Exchange',
+            'website_link': 'https://www.nanaimogold.com/',
+            'bitcoin_address': None,
+            'other_contact_info': None,
+            'signature': '<a href="https://www.nanaimogold.com/" ' +
+            'target="_blank">https://www.nanaimogold.com/</a> ' +
+            '- World\'s first bitcoin exchange service'
+        }
+        self.assertEqual(data, expectedData)
+
+    def testIterTopicPage(self):
+        """Method for testing iterTopicPage."""
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        expectedData = bitcointalk.parseTopicPage(html)
+        topicIterator = bitcointalk.iterTopicPage(html)
+        data = next(topicIterator)
+        self.assertEqual(data['id'], 602041)
+        self.assertEqual(data['quotes'], [])
+        self.assertEqual(list(topicIterator), expectedData.pop('messages'))
+        self.assertEqual(data, expectedData)
+
+    def testParseTopicPage(self):
+        """Method for testing parseTopicPage."""
+        f = codecs.open("{0}/example/topic_14.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)
+        messages = data['messages']
+        del data['messages']
+        self.assertEqual(data.pop('quotes'), [])
+        expectedData = {
+            'id': 14,
+            'name': 'Break on the supply\'s increase',
+            'board': 7,
+            'count_read': 3051,
+            'num_pages': 1
+        }
+        self.assertEqual(data, expectedData)
+
+        self.assertEqual(len(messages), 2)
+
+        firstMessage = messages[0]
+        firstMessageContent = {
+            'raw': firstMessage['content'],
+            'no_html': firstMessage['content_no_html'],
+            'no_quote': firstMessage['content_no_quote'],
+            'no_quote_no_html': firstMessage['content_no_quote_no_html']
+        }
+        del firstMessage['content']
+        del firstMessage['content_no_html']
+        del firstMessage['content_no_quote']
+        del firstMessage['content_no_quote_no_html']
+
+        expectedFirstMessage = {
+            'id': long(53),
+            'member': 16,
+            'subject': 'Break on the supply\'s increase',
+            'link': 'https://bitcointalk.org/index.php?topic=14.msg53#msg53',
+            'topic': 14,
+            'topic_position': 1,
+            'post_time': datetime(2009, 12, 12, 14, 11, 37)
+        }
+        self.assertEqual(firstMessage, expectedFirstMessage)
+
+        self.assertEqual(len(firstMessageContent['raw']), 1276)
+        self.assertEqual(len(firstMessageContent['no_html']), 1208)
+        self.assertEqual(len(firstMessageContent['no_quote']), 1276)
+        self.assertEqual(len(firstMessageContent['no_quote_no_html']), 1208)
+
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)
+        self.assertEqual(data['num_pages'], 621)
+        self.assertEqual(
+            data['messages'][0]['post_time'],
+            datetime.combine(datetime.utcnow().date(), tm(21, 3, 11)))
+        self.assertEqual(len(data['quotes']), 6)
+        self.assertEqual(data['quotes'][-1], {
+            'message': long(8126666),
+            'position': 0,
+            'topic': 602041,
+            'member': data['messages'][-1]['member'],
+            'quoted_message': long(8126615),
+            'quoted_topic': 602041,
+            'quoted_member_name': 'Wreathy'
+        })
+        # print "Content of Message 1"
+        # print data['messages'][0]['content']
+        # print "Content of Message 1, No HTML"
+        # print data['messages'][0]['content_no_html']
+        # print "Content of Message 1, No Quote"
+        # print data['messages'][0]['content_no_quote']
+        # print "Content of Message 1, No Quote, No HTML"
+        # print data['messages'][0]['content_no_quote_no_html']
+
+
+if __name__ == "__main__":
+    unittest.main()
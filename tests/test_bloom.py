@@ -0,0 +1,68 @@
+""" Tests for the bloom module. """
+import bloom
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class BloomTest(unittest.TestCase):
+
+    """"Testing suite for bloom module."""
+
+    def setUp(self):
+        """Make a directory for filter files."""
+        self.scratchDir = tempfile.mkdtemp()
+        self.path = "{0}/ids.bloom".format(self.scratchDir)
+
+    def tearDown(self):
+        """Remove the filter files."""
+        shutil.rmtree(self.scratchDir)
+
+    def testAdd(self):
+        """Test adding keys, and reopening the filter file."""
+        bloomFilter = bloom.BloomFilter(self.path, 1000)
+        self.assertFalse(bloomFilter.add(42))
+        self.assertTrue(bloomFilter.add(42))
+        for key in range(1000, 2000):
+            bloomFilter.add(key)
+        bloomFilter.close()
+
+        bloomFilter = bloom.BloomFilter(self.path)
+        self.assertIn(42, bloomFilter)
+        for key in range(1000, 2000):
+            self.assertIn(key, bloomFilter)
+        self.assertEqual(bloomFilter.capacity, 1000)
+        self.assertGreaterEqual(len(bloomFilter), 990)
+        falsePositives = len([key for key in range(5000, 15000)
+                              if key in bloomFilter])
+        self.assertLess(falsePositives, 300)
+        bloomFilter.close()
+
+    def testBuild(self):
+        """Test building a filter over a file being read."""
+        bloomFilter = bloom.BloomFilter(self.path, 10)
+        bloomFilter.add(7)
+        built = bloom.build(self.path, iter(range(100)), 100)
+        self.assertIn(7, bloomFilter)
+        self.assertNotIn(7 + 10 ** 12, bloomFilter)
+        self.assertEqual(len(built), 100)
+        for key in range(100):
+            self.assertIn(key, built)
+        # Keys added through the old filter go to the one replacing it
+        self.assertFalse(bloomFilter.add(1000))
+        self.assertIn(1000, built)
+        self.assertEqual(len(built), 101)
+        self.assertEqual(sorted(os.listdir(self.scratchDir)),
+                         ["ids.bloom", "ids.bloom.lock"])
+        bloomFilter.close()
+        built.close()
+
+    def testMissing(self):
+        """Test opening a filter that doesn't exist."""
+        with self.assertRaises(Exception):
+            bloom.BloomFilter(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+""" Tests for the changes module. """
+import changes
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class ChangesTest(unittest.TestCase):
+
+    """"Testing suite for changes module."""
+
+    def setUp(self):
+        """Setup a scratch directory for test."""
+        self.scratchDir = tempfile.mkdtemp()
+        self.segmentFormatOriginal = changes.segmentFormat
+
+    def tearDown(self):
+        """Teardown the scratch directory for test."""
+        shutil.rmtree(self.scratchDir)
+        changes.segmentFormat = self.segmentFormatOriginal
+
+    def testFeed(self):
+        """Test writing and resuming a feed across segments."""
+        feed = changes.ChangeFeed(self.scratchDir)
+        self.assertEqual(feed.flush(), None)
+        feed.add('board', 1, 'insert', None, {'name': "Board"})
+        mark = feed.mark()
+        feed.add('board', 2, 'insert', None, {'name': "Gone"})
+        feed.truncate(mark)
+        self.assertEqual(feed.flush(), (1, 1))
+
+        # Each flush starts a new segment
+        changes.segmentFormat = "{0}%f".format(changes.segmentFormat)
+        for sid in range(2, 5):
+            feed.add('board', 1, 'update', {'name': sid - 1},
+                     {'name': sid})
+            feed.add('topic', sid, 'insert', None, {'board': 1})
+            self.assertEqual(feed.flush(), (2 * sid - 2, 2 * sid - 1))
+        self.assertEqual(len(changes._segments(self.scratchDir)), 4)
+
+        # Other processes pick up the sequence
+        other = changes.ChangeFeed(self.scratchDir)
+        other.add('board', 3, 'insert', None, {'name': "Other"})
+        self.assertEqual(other.flush(), (8, 8))
+
+        feed = list(changes.iterChanges(self.scratchDir))
+        self.assertEqual([change['seq'] for change in feed], range(1, 9))
+        self.assertEqual(feed[0]['new'], {'name': "Board"})
+        self.assertEqual(feed[5]['old'], {'name': 3})
+        self.assertEqual(
+            [change['seq'] for change in changes.iterChanges(
+                self.scratchDir, 5)], [6, 7, 8])
+
+        # A change only partly written is left for the next read
+        segments = changes._segments(self.scratchDir)
+        f = gzip.open(segments[-1], 'ab')
+        f.write('{"seq": 9')
+        f.close()
+        self.assertEqual(
+            [change['seq'] for change in changes.iterChanges(
+                self.scratchDir, 7)], [8])
+
+        # Segments before the one holding the next change aren't read
+        os.remove(segments[0])
+        self.assertEqual(
+            [change['seq'] for change in changes.iterChanges(
+                self.scratchDir, 4)], [5, 6, 7, 8])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+""" Tests for the export module. """
+import bitcointalk
+import codecs
+import export
+import os
+import pg
+import pyarrow.parquet as pq
+import shutil
+import tempfile
+import unittest
+
+rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ExportTest(unittest.TestCase):
+
+    """"Testing suite for export module."""
+
+    def setUp(self):
+        """Setup tables and export directory for test."""
+        # Swap and sub tables
+        self.tablesOriginal = pg.tables
+        pg.tables = {}
+        for key, table in self.tablesOriginal.iteritems():
+            pg.tables[key] = "{0}_test".format(table)
+
+        # Create test tables
+        cur = pg.cursor()
+        for key, table in pg.tables.iteritems():
+            cur.execute("""CREATE TABLE IF NOT EXISTS
+                {0} (LIKE {1} INCLUDING ALL)""".format(
+                table, self.tablesOriginal[key]))
+        cur.execute("""COMMIT""")
+
+        # Export to a scratch directory
+        self.exportDirOriginal = export.exportDir
+        self.exportSlackOriginal = export.exportSlack
+        export.exportDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Teardown tables and export directory for test."""
+        cur = pg.cursor()
+        for table in pg.tables.values():
+            cur.execute("""DROP TABLE IF EXISTS
+                {0}""".format(table))
+        cur.execute("""COMMIT""")
+        pg.tables = self.tablesOriginal
+
+        shutil.rmtree(export.exportDir)
+        export.exportDir = self.exportDirOriginal
+        export.exportSlack = self.exportSlackOriginal
+
+    def testExportAll(self):
+        """Test exporting and incrementally re-exporting the corpus."""
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)
+        messages = data.pop('messages')
+        del data['quotes']
+        pg.insertMessages(messages)
+        pg.insertTopic(data)
+
+        counts = export.exportAll()
+        self.assertEqual(counts, {
+            'board': 0, 'topic': 1, 'member': 0, 'message': len(messages)})
+        months = set([m['post_time'].strftime("%Y-%m") for m in messages])
+        exportedSids = []
+        for month in months:
+            table = pq.read_table("{0}/message/board={1}/month={2}".format(
+                export.exportDir, data['board'], month))
+            exportedSids.extend(table.column('sid').to_pylist())
+        self.assertEqual(
+            sorted(exportedSids), sorted([m['id'] for m in messages]))
+
+        # Rows stored within exportSlack of the last export are read again,
+        # in case they were committed late
+        counts = export.exportAll()
+        self.assertEqual(counts['message'], len(messages))
+
+        # Nothing new since the last export
+        export.exportSlack = 0
+        counts = export.exportAll()
+        self.assertEqual(counts, {
+            'board': 0, 'topic': 0, 'member': 0, 'message': 0})
+
+        # Re-scraped rows are picked up again
+        pg.insertMessages(messages[:2])
+        counts = export.exportAll()
+        self.assertEqual(counts['message'], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
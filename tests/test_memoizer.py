@@ -0,0 +1,354 @@
+""" Tests for the memoizer module. """
+import bitcointalk
+from datetime import datetime
+import memoizer
+import os
+import pg
+import replay_server
+import shutil
+import sidindex
+import synthetic
+import tempfile
+import unittest
+
+
+class MemoizerTest(unittest.TestCase):
+
+    """"Testing suite for memoizer module."""
+
+    def setUp(self):
+        """Setup tables and memo for test."""
+        # Swap and sub tables
+        self.tablesOriginal = pg.tables
+        pg.tables = {}
+        for key, table in self.tablesOriginal.iteritems():
+            pg.tables[key] = "{0}_test".format(table)
+
+        # Create test tables
+        cur = pg.cursor()
+        for key, table in pg.tables.iteritems():
+            cur.execute("""CREATE TABLE IF NOT EXISTS
+                {0} (LIKE {1} INCLUDING ALL)""".format(
+                table, self.tablesOriginal[key]))
+        cur.execute("""COMMIT""")
+
+        # Reset memo
+        self.memoOriginal = memoizer.memo
+        memoizer.memo = {
+            'boards': set(),
+            'members': set(),
+            'topics': set()
+        }
+
+    def tearDown(self):
+        """Teardown tables for test and restore memo."""
+        # Drop test tables
+        cur = pg.cursor()
+        for table in pg.tables.values():
+            cur.execute("""DROP TABLE IF EXISTS
+                {0}""".format(table))
+        cur.execute("""COMMIT""")
+
+        # Remove the indexes of test IDs
+        for index in memoizer.memo.values():
+            if isinstance(index, sidindex.SidIndex):
+                index.close()
+                for path in [index.path, "{0}.lock".format(index.path)]:
+                    os.remove(path)
+
+        # Stop recording test changes
+        if pg.changeFeed is not None:
+            shutil.rmtree(pg.changeFeed.directory)
+            pg.recordChanges(None)
+
+        # Unload the filter of test messages
+        if pg.messageFilter is not None:
+            pg.messageFilter.close()
+            for path in [pg.messageFilter.path,
+                         "{0}.lock".format(pg.messageFilter.path)]:
+                os.remove(path)
+            pg.messageFilter = None
+
+        # Undo swap / sub of tables
+        pg.tables = self.tablesOriginal
+
+        # Undo swap / sub of memo
+        memoizer.memo = self.memoOriginal
+
+    def testScrapeBoard(self):
+        """Test scrapeBoard function."""
+        countRequestedStart = bitcointalk.countRequested
+        datumFirst = memoizer.scrapeBoard(74)
+        datumSecond = memoizer.scrapeBoard(74)
+        countRequestedEnd = bitcointalk.countRequested
+        self.assertEqual(countRequestedEnd - countRequestedStart, 1)
+        datumExpected = {
+            'id': 74,
+            'name': 'Legal',
+            'container': 'Bitcoin',
+            'parent': 1,
+            'num_pages': 23
+        }
+        self.assertEqual(datumExpected, datumFirst)
+        self.assertEqual(datumExpected, datumSecond)
+        self.assertEqual(datumFirst, datumSecond)
+
+    def testScrapeMember(self):
+        """Test scrapeMember function."""
+        countRequestedStart = bitcointalk.countRequested
+        datumFirst = memoizer.scrapeMember(12)
+        datumSecond = memoizer.scrapeMember(12)
+        countRequestedEnd = bitcointalk.countRequested
+        self.assertEqual(countRequestedEnd - countRequestedStart, 1)
+        datumExpected = {
+            'id': 12,
+            'name': 'nanaimogold',
+            'position': 'Sr. Member',
+            'date_registered': datetime(2009, 12, 9, 19, 23, 55),
+            'last_active': datetime(2014, 6, 3, 0, 38, 1),
+            'email': 'hidden',
+            'website_name': 'Nanaimo Gold Digital Currency Exchange',
+            'website_link': 'https://www.nanaimogold.com/',
+            'bitcoin_address': None,
+            'other_contact_info': None,
+            'signature': '<a href="https://www.nanaimogold.com/" ' +
+            'target="_blank">https://www.nanaimogold.com/</a> ' +
+            '- World\'s first bitcoin exchange service'
+        }
+        self.assertEqual(datumExpected, datumFirst)
+        self.assertEqual(datumExpected, datumSecond)
+        self.assertEqual(datumFirst, datumSecond)
+
+    def testScrapeTopic(self):
+        """Test scrapeTopic function."""
+        countRequestedStart = bitcointalk.countRequested
+        datumFirst = memoizer.scrapeTopic(14)
+        datumSecond = memoizer.scrapeTopic(14)
+        countRequestedEnd = bitcointalk.countRequested
+        self.assertEqual(countRequestedEnd - countRequestedStart, 1)
+        datumExpected = {
+            'id': 14,
+            'name': 'Break on the supply\'s increase',
+            'board': 7,
+            'num_pages': 1
+        }
+        self.assertEqual(datumFirst['count_read'], datumSecond['count_read'])
+        self.assertEqual(datumFirst.pop('count_read') > 3057, True)
+        self.assertEqual(datumSecond.pop('count_read') > 3057, True)
+        self.assertEqual(datumExpected, datumFirst)
+        self.assertEqual(datumExpected, datumSecond)
+        self.assertEqual(datumFirst, datumSecond)
+
+        # Make sure we can pull in the associated messages without error
+        pg.selectMessages([53, 56])
+
+    def testScrapeMessages(self):
+        """Test scrapeMessages function."""
+        countRequestedStart = bitcointalk.countRequested
+        data = memoizer.scrapeMessages(14, 1)
+        countRequestedEnd = bitcointalk.countRequested
+        self.assertEqual(countRequestedEnd - countRequestedStart, 1)
+        self.assertEqual(len(data), 2)
+        self.assertEqual(sorted(data[0].keys()), ['id', 'member'])
+
+        # Make sure we can pull in the associated messages without error
+        pg.selectMessages([53, 56])
+
+    def testRemember(self):
+        """Test remember function."""
+        memoizer.scrapeBoard(74)
+        memoizer.scrapeMember(12)
+        memoizer.scrapeTopic(14)
+        memoizer.memo = {
+            'boards': set(),
+            'members': set(),
+            'topics': set()
+        }
+        memoizer.remember()
+        expectedMemo = {
+            'boards': set([74]),
+            'members': set([12]),
+            'topics': set([14])
+        }
+        self.assertEqual(
+            dict([(key, set(index))
+                  for key, index in memoizer.memo.iteritems()]),
+            expectedMemo)
+        for message in pg.iterMessagesByTopic(14):
+            self.assertIn(message['id'], pg.messageFilter)
+
+        # Members stored elsewhere are caught up with, and those scraped are
+        # in the index once committed
+        member = pg.selectMember(12)
+        member['id'] = 13
+        pg.insertMember(member)
+        with pg.unitOfWork():
+            memoizer.scrapeMember(12, force=True)
+        pg.flush()
+        memoizer.remember()
+        self.assertEqual(set(memoizer.memo['members']), set([12, 13]))
+        index = sidindex.SidIndex(memoizer.memo['members'].path)
+        self.assertEqual(set(index), set([12, 13]))
+        index.close()
+
+    def testCrawlTopics(self):
+        """Test crawling topics through the pipeline."""
+        server, url = replay_server.start()
+        settingsOriginal = (
+            bitcointalk.requestUrl, bitcointalk.interReqTime,
+            replay_server.pageSource, memoizer.dataDir)
+        bitcointalk.requestUrl = url
+        bitcointalk.interReqTime = 0
+        replay_server.pageSource = synthetic.page
+        memoizer.dataDir = tempfile.mkdtemp()
+        try:
+            countRequestedStart = bitcointalk.countRequested
+            countMessages = memoizer.crawlTopics([1, 2, 3], maxPages=2)
+            pg.flush()
+            self.assertEqual(countMessages, 3 * 2 * synthetic.messagesPerPage)
+            self.assertEqual(memoizer.memo['topics'], set([1, 2, 3]))
+            members = set()
+            cur = pg.cursor()
+            for topicId in [1, 2, 3]:
+                cur.execute("""SELECT topic_position, member
+                    FROM {0}
+                    WHERE topic = %s
+                    ORDER BY topic_position""".format(pg.tables['message']),
+                    (topicId,))
+                rows = cur.fetchall()
+                self.assertEqual(
+                    [position for position, memberId in rows],
+                    range(1, 2 * synthetic.messagesPerPage + 1))
+                members.update(memberId for position, memberId in rows
+                               if memberId > 0)
+            self.assertEqual(memoizer.memo['members'], members)
+            # Every page, board and member once
+            self.assertEqual(
+                bitcointalk.countRequested - countRequestedStart,
+                3 * 2 + len(memoizer.memo['boards']) + len(members))
+
+            # Pages of stored topics are scraped again
+            countMessages = memoizer.crawlTopics([1], maxPages=2)
+            self.assertEqual(countMessages, 2 * synthetic.messagesPerPage)
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(memoizer.dataDir)
+            (bitcointalk.requestUrl, bitcointalk.interReqTime,
+             replay_server.pageSource, memoizer.dataDir) = settingsOriginal
+
+    def testRetryFailed(self):
+        """Test that a failed page is queued, kept and retried alone."""
+        server, url = replay_server.start()
+        settingsOriginal = (
+            bitcointalk.requestUrl, bitcointalk.interReqTime,
+            replay_server.pageSource, memoizer.dataDir,
+            memoizer.retryBackoff, memoizer.maxAttempts)
+        broken = set(["topic=2.{0}".format(synthetic.messagesPerPage),
+                      "topic=3.0"])
+
+        def page(payload):
+            if payload in broken:
+                return "<html>Down for maintenance</html>"
+            return synthetic.page(payload)
+        bitcointalk.requestUrl = url
+        bitcointalk.interReqTime = 0
+        replay_server.pageSource = page
+        memoizer.dataDir = tempfile.mkdtemp()
+        memoizer.retryBackoff = 0
+        memoizer.maxAttempts = 2
+        try:
+            with memoizer.isolated('topic', 2) as outcome:
+                memoizer.scrapeTopic(2)
+            self.assertEqual(outcome['failed'], False)
+            self.assertEqual(len(memoizer.scrapePage(2, 1)),
+                             synthetic.messagesPerPage)
+            # The page that fails to parse costs that page alone
+            self.assertEqual(memoizer.scrapePage(2, 2), None)
+            self.assertEqual(len(memoizer.scrapePage(2, 3)),
+                             synthetic.messagesPerPage)
+            # As does a topic that can't be requested
+            missing = synthetic.numTopics + 1
+            with memoizer.isolated('topic', missing) as outcome:
+                memoizer.scrapeTopic(missing)
+            self.assertEqual(outcome['failed'], True)
+            # Failures within the pipeline are queued too
+            memoizer.crawlTopics([3], maxPages=1)
+            pg.flush()
+            self.assertEqual(
+                [(retry['entity'], retry['sid'], retry['page'])
+                 for retry in pg.selectDueRetries(10)],
+                [('messages', 2, 2), ('topic', missing, 0), ('topic', 3, 0)])
+            deadLetters = pg.selectDeadLetters()
+            self.assertEqual(
+                [(deadLetter['entity'], deadLetter['sid'])
+                 for deadLetter in deadLetters],
+                [('messages', 2), ('topic', 3)])
+            self.assertEqual(deadLetters[0]['html'],
+                             "<html>Down for maintenance</html>")
+            self.assertEqual(
+                "valid topic data" in deadLetters[0]['traceback'], True)
+
+            # Retrying the topic queues its pages past page 1, which comes
+            # with it, and they're retried too
+            broken.clear()
+            self.assertEqual(memoizer.retryFailed(), 2 + 2)
+            pg.flush()
+            cur = pg.cursor()
+            for topicId in [2, 3]:
+                cur.execute("""SELECT count(*)
+                    FROM {0}
+                    WHERE topic = %s""".format(pg.tables['message']),
+                    (topicId,))
+                self.assertEqual(cur.fetchone()[0],
+                                 synthetic.messagesPerTopic)
+            # The missing topic is given up on after maxAttempts
+            self.assertEqual(pg.selectDueRetries(10), [])
+            self.assertEqual(
+                [(deadLetter['entity'], deadLetter['sid'])
+                 for deadLetter in pg.selectDeadLetters('topic')],
+                [('topic', 3), ('topic', missing)])
+            self.assertEqual(memoizer.retryFailed(), 0)
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(memoizer.dataDir)
+            (bitcointalk.requestUrl, bitcointalk.interReqTime,
+             replay_server.pageSource, memoizer.dataDir,
+             memoizer.retryBackoff, memoizer.maxAttempts) = settingsOriginal
+
+    def testFailedCommit(self):
+        """Test that units rolled back by a failed commit are retried."""
+        cur = pg.cursor()
+        cur.execute("""ALTER TABLE {0}
+            ADD UNIQUE (name) DEFERRABLE INITIALLY DEFERRED""".format(
+            pg.tables['board']))
+        cur.execute("""COMMIT""")
+        settingsOriginal = (pg.commitUnits, memoizer.retryBackoff)
+        pg.commitUnits = 3
+        memoizer.retryBackoff = 0
+        try:
+            # The third unit's name clashes, failing the commit of all three
+            for boardId, name in [(1, 'Legal'), (2, 'Mining'), (3, 'Legal')]:
+                with memoizer.isolated('board', boardId) as outcome:
+                    pg.insertBoard({
+                        'id': boardId,
+                        'name': name,
+                        'container': 'Bitcoin',
+                        'parent': None,
+                        'num_pages': 1
+                    })
+            self.assertEqual(outcome['failed'], True)
+        finally:
+            pg.commitUnits, memoizer.retryBackoff = settingsOriginal
+        self.assertEqual(list(pg.iterSids('board')), [])
+        self.assertEqual(
+            sorted([(retry['entity'], retry['sid'], retry['page'],
+                     retry['attempts'])
+                    for retry in pg.selectDueRetries(10)]),
+            [('board', 1, 0, 0), ('board', 2, 0, 0), ('board', 3, 0, 1)])
+        self.assertEqual(memoizer.rolledBack, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
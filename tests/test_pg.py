@@ -0,0 +1,610 @@
+""" Tests for the pg module. """
+import bitcointalk
+import bloom
+import changes
+import codecs
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+import gzip
+import os
+import pg
+import shutil
+import tempfile
+import unittest
+
+rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class PgTest(unittest.TestCase):
+
+    """"Testing suite for pg module."""
+
+    def setUp(self):
+        """Setup tables for test."""
+        # Swap and sub configuration variables
+        self.tablesOriginal = pg.tables
+        pg.tables = {}
+        for key, table in self.tablesOriginal.iteritems():
+            pg.tables[key] = "{0}_test".format(table)
+
+        # Create test tables
+        cur = pg.cursor()
+        for key, table in pg.tables.iteritems():
+            cur.execute("""CREATE TABLE IF NOT EXISTS
+                {0} (LIKE {1} INCLUDING ALL)""".format(
+                table, self.tablesOriginal[key]))
+        cur.execute("""COMMIT""")
+
+    def tearDown(self):
+        """Teardown tables for test."""
+        # Drop test tables
+        cur = pg.cursor()
+        for table in pg.tables.values():
+            cur.execute("""DROP TABLE IF EXISTS
+                {0}""".format(table))
+        cur.execute("""COMMIT""")
+
+        # Undo swap / sub
+        pg.tables = self.tablesOriginal
+
+    def testBoard(self):
+        """Test insert and select board functions."""
+        f = codecs.open("{0}/example/board_74.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        datum = bitcointalk.parseBoardPage(html)
+        del datum["topic_ids"]
+        pg.insertBoard(datum)
+        # Make sure a second insert doesn't cause problems
+        pg.insertBoard(datum)
+        selectDatum = pg.selectBoard(74)
+        self.assertEqual(datum, selectDatum)
+
+    def testMember(self):
+        """Test insert and select member functions."""
+        f = codecs.open("{0}/example/profile_12.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        todaysDate = date(2014, 7, 29)
+        datum = bitcointalk.parseProfile(html, todaysDate)
+        pg.insertMember(datum)
+        # Make sure a second insert doesn't cause problems
+        pg.insertMember(datum)
+        selectDatum = pg.selectMember(12)
+        self.assertEqual(datum, selectDatum)
+
+    def testMessages(self):
+        """Test insert and select messages functions."""
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)
+        data = data['messages']
+        pg.insertMessages(data)
+        # Make sure a second insert doesn't cause problems
+        pg.insertMessages(data)
+        selectData = pg.selectMessages(
+            [
+                8125509,
+                8125667,
+                8125970,
+                8126348,
+                8126542,
+                8126615,
+                8126655,
+                8126666
+            ])
+        datum = data[0]
+        self.assertEqual(data, selectData)
+
+    def testMessagesStreamed(self):
+        """Test inserting messages from a generator as they are parsed."""
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)['messages']
+        data[0]['content'] = "Tab\there,\r\nnew line and \\N"
+        topicIterator = bitcointalk.iterTopicPage(html)
+        next(topicIterator)
+        pg.insertMessages(data[:1])
+        pg.insertMessages(message for message in topicIterator
+                          if message['id'] != data[0]['id'])
+        pg.insertMessages([])
+        self.assertEqual(
+            data, pg.selectMessages([message['id'] for message in data]))
+
+    def testMessagesFiltered(self):
+        """Test routing messages by the filter of stored IDs."""
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)['messages']
+        scratchDir = tempfile.mkdtemp()
+        pg.messageFilter = bloom.BloomFilter(
+            "{0}/message.bloom".format(scratchDir), 1000)
+        try:
+            pg.insertMessages(data[:10])
+            # Stored unchanged, changed and new messages all at once
+            data[0]['content'] = "Edited"
+            pg.insertMessages(data)
+            self.assertEqual(len(pg.messageFilter), len(data))
+            for datum in data:
+                self.assertIn(datum['id'], pg.messageFilter)
+        finally:
+            pg.messageFilter.close()
+            pg.messageFilter = None
+            shutil.rmtree(scratchDir)
+        self.assertEqual(
+            data, pg.selectMessages([datum['id'] for datum in data]))
+        memberId = data[0]['member']
+        self.assertEqual(
+            pg.selectMemberActivity(memberId)['num_posts'],
+            len([datum for datum in data if datum['member'] == memberId]))
+
+    def testMessagesChunked(self):
+        """Test selecting messages across several chunks of IDs."""
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)['messages']
+        pg.insertMessages(data)
+        selectChunkSizeOriginal = pg.selectChunkSize
+        pg.selectChunkSize = 3
+        try:
+            selectData = pg.selectMessages(
+                [datum['id'] for datum in reversed(data)])
+        finally:
+            pg.selectChunkSize = selectChunkSizeOriginal
+        self.assertEqual(data, selectData)
+
+    def testIterMessages(self):
+        """Test streaming messages by topic, member and time."""
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)['messages']
+        pg.insertMessages(data)
+
+        self.assertEqual(list(pg.iterMessagesByTopic(602041)), data)
+
+        memberId = data[0]['member']
+        memberData = [datum for datum in data if datum['member'] == memberId]
+        self.assertEqual(list(pg.iterMessagesByMember(memberId)), memberData)
+
+        startTime = data[1]['post_time']
+        stopTime = data[-1]['post_time']
+        timeData = [datum for datum in data
+                    if startTime <= datum['post_time'] < stopTime]
+        self.assertEqual(
+            list(pg.iterMessagesByTime(startTime, stopTime)), timeData)
+
+        # Interleaved streams shouldn't close each other's cursors
+        streamFirst = pg.iterMessagesByTopic(602041)
+        streamSecond = pg.iterMessagesByTopic(602041)
+        self.assertEqual(next(streamFirst), data[0])
+        self.assertEqual(list(streamSecond), data)
+        self.assertEqual(list(streamFirst), data[1:])
+
+    def testIterSids(self):
+        """Test streaming IDs of a table."""
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)['messages']
+        pg.insertMessages(data)
+        self.assertEqual(
+            sorted(pg.iterSids('message')),
+            sorted([datum['id'] for datum in data]))
+
+    def testQuotes(self):
+        """Test insert and select quote functions."""
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)
+        messageIds = [datum['id'] for datum in data['messages']]
+
+        # Quotes seen before the quoted message is stored stay unresolved
+        pg.insertQuotes(data['quotes'], messageIds)
+        self.assertEqual(
+            pg.selectQuotesOfMessage(8126615)[0]['quoted_member'], None)
+
+        pg.insertMessages(data['messages'])
+        pg.insertQuotes(data['quotes'], messageIds)
+        # Make sure a second insert doesn't cause problems
+        pg.insertQuotes(data['quotes'], messageIds)
+        quotedMember = pg.selectMessages([8126615])[0]['member']
+        expectedDatum = dict(data['quotes'][-1])
+        expectedDatum['quoted_member'] = quotedMember
+        self.assertEqual(pg.selectQuotesOfMessage(8126615), [expectedDatum])
+        self.assertEqual(
+            pg.selectQuotesOfMember(quotedMember), [expectedDatum])
+        self.assertEqual(
+            expectedDatum in pg.selectQuotesByMember(expectedDatum['member']),
+            True)
+
+    def testRollups(self):
+        """Test the activity rollups kept by insertMessages."""
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)
+        messages = data.pop('messages')
+        del data['quotes']
+        pg.insertTopic(data)
+        pg.insertMessages(messages)
+        # Re-inserted messages must not be counted twice
+        pg.insertMessages(messages[:3])
+        pg.insertMessages(messages)
+
+        countByDay = {}
+        for message in messages:
+            day = message['post_time'].date()
+            countByDay[day] = countByDay.get(day, 0) + 1
+        expectedBoardActivity = [
+            {'day': day, 'num_posts': count}
+            for day, count in sorted(countByDay.items())]
+        self.assertEqual(
+            pg.selectBoardDailyActivity(data['board']), expectedBoardActivity)
+        self.assertEqual(
+            pg.selectBoardDailyActivity(
+                data['board'], startDay=max(countByDay.keys())),
+            expectedBoardActivity[-1:])
+
+        memberId = messages[0]['member']
+        memberTimes = [message['post_time'] for message in messages
+                       if message['member'] == memberId]
+        self.assertEqual(pg.selectMemberActivity(memberId), {
+            'num_posts': len(memberTimes),
+            'first_post_time': min(memberTimes),
+            'last_post_time': max(memberTimes)
+        })
+        self.assertEqual(
+            sum([row['num_posts']
+                 for row in pg.selectMemberDailyActivity(memberId)]),
+            len(memberTimes))
+
+        # A rebuild from scratch agrees with the incremental rollups
+        memberActivity = pg.selectMemberActivity(memberId)
+        pg.rebuildRollups()
+        self.assertEqual(
+            pg.selectBoardDailyActivity(data['board']), expectedBoardActivity)
+        self.assertEqual(pg.selectMemberActivity(memberId), memberActivity)
+
+        # Posts move with their topic to another board, and re-inserted ones
+        # come off the board they're counted on
+        oldBoard = data['board']
+        data['board'] = oldBoard + 1
+        pg.insertTopic(data)
+        pg.insertMessages(messages)
+        self.assertEqual(pg.selectBoardDailyActivity(oldBoard), [])
+        self.assertEqual(
+            pg.selectBoardDailyActivity(data['board']), expectedBoardActivity)
+
+        # Messages stored before their topic move from board 0 to its board
+        cur = pg.cursor()
+        cur.execute("""DELETE FROM {0}""".format(pg.tables['topic']))
+        cur.execute("""COMMIT""")
+        pg.rebuildRollups()
+        self.assertEqual(
+            pg.selectBoardDailyActivity(0), expectedBoardActivity)
+        pg.insertTopic(data)
+        self.assertEqual(pg.selectBoardDailyActivity(0), [])
+        self.assertEqual(
+            pg.selectBoardDailyActivity(data['board']), expectedBoardActivity)
+
+        # A member's first and last post times follow posts that moved
+        memberMessages = [message for message in messages
+                          if message['member'] == memberId]
+        lastMessage = max(memberMessages,
+                          key=lambda message: message['post_time'])
+        lastMessage['post_time'] = min(memberTimes) - timedelta(days=1)
+        pg.insertMessages([lastMessage])
+        memberTimes = [message['post_time'] for message in memberMessages]
+        self.assertEqual(pg.selectMemberActivity(memberId), {
+            'num_posts': len(memberTimes),
+            'first_post_time': min(memberTimes),
+            'last_post_time': max(memberTimes)
+        })
+
+    def testPartitions(self):
+        """Test loading, pruning and archiving a partitioned message table."""
+        cur = pg.cursor()
+        cur.execute("""DROP TABLE {0}""".format(pg.tables['message']))
+        cur.execute("""CREATE TABLE {0} (LIKE {1} INCLUDING ALL)
+            PARTITION BY RANGE (post_time)""".format(
+            pg.tables['message'], self.tablesOriginal['message']))
+        cur.execute("""COMMIT""")
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        data = bitcointalk.parseTopicPage(html)['messages']
+        for i, datum in enumerate(data):
+            datum['post_time'] = datetime(2014, 5 + i % 3, 10 + i)
+        # Partitions are committed as they're created, without waiting on
+        # the writes pending to the table
+        with pg.unitOfWork():
+            pg.insertMessages(data[:1])
+            pg.insertMessages(data)
+            read = pg.readConnect().cursor()
+            read.execute("""SELECT count(*)
+                FROM pg_inherits
+                WHERE inhparent = to_regclass(%s)""", (pg.tables['message'],))
+            self.assertEqual(read.fetchone()[0], 3)
+            pg.readConnect().commit()
+        pg.insertMessages(data)
+        self.assertEqual(pg.selectMessagePartitions(), [
+            "{0}_2014_0{1}".format(pg.tables['message'], month)
+            for month in [5, 6, 7]])
+        self.assertEqual(
+            data, pg.selectMessages([datum['id'] for datum in data]))
+
+        # A post time moved by a day still replaces the stored message
+        data[0]['post_time'] += timedelta(days=1)
+        pg.insertMessages(data[:1])
+        self.assertEqual(
+            pg.selectMessages([data[0]['id']])[0]['post_time'],
+            data[0]['post_time'])
+        self.assertEqual(
+            pg.selectMemberActivity(data[0]['member'])['num_posts'],
+            len([datum for datum in data
+                 if datum['member'] == data[0]['member']]))
+
+        # As does one moved further, with or without the filter of stored
+        # IDs, and it isn't counted twice
+        scratchDir = tempfile.mkdtemp()
+        try:
+            for messageFilter in [None, bloom.BloomFilter(
+                    "{0}/message.bloom".format(scratchDir), 1000)]:
+                pg.messageFilter = messageFilter
+                if messageFilter is not None:
+                    for datum in data:
+                        messageFilter.add(datum['id'])
+                data[0]['post_time'] += pg.partitionSlack * 2
+                pg.insertMessages(data[:1])
+                self.assertEqual(
+                    pg.selectMessages([data[0]['id']])[0]['post_time'],
+                    data[0]['post_time'])
+                self.assertEqual(
+                    pg.selectMemberActivity(data[0]['member'])['num_posts'],
+                    len([datum for datum in data
+                         if datum['member'] == data[0]['member']]))
+        finally:
+            if pg.messageFilter is not None:
+                pg.messageFilter.close()
+            pg.messageFilter = None
+            shutil.rmtree(scratchDir)
+        data[0]['post_time'] = datetime(2014, 5, 10)
+        pg.insertMessages(data[:1])
+
+        # Time-bounded reads only touch the partitions in range
+        cur.execute("""EXPLAIN SELECT *
+            FROM {0}
+            WHERE post_time >= %s AND post_time < %s""".format(
+            pg.tables['message']),
+            (datetime(2014, 6, 1), datetime(2014, 7, 1)))
+        plan = "\n".join([row[0] for row in cur.fetchall()])
+        cur.execute("""COMMIT""")
+        self.assertEqual("_2014_06" in plan, True)
+        self.assertEqual("_2014_05" in plan or "_2014_07" in plan, False)
+
+        # Archiving detaches and drops the old partitions
+        archiveDir = tempfile.mkdtemp()
+        try:
+            paths = pg.archiveMessagePartitions(
+                datetime(2014, 7, 1), archiveDir)
+            self.assertEqual(len(paths), 2)
+            f = gzip.open(paths[0], 'rb')
+            self.assertEqual(
+                len(f.readlines()),
+                len([datum for datum in data
+                     if datum['post_time'].month == 5]))
+            f.close()
+        finally:
+            shutil.rmtree(archiveDir)
+        self.assertEqual(pg.selectMessagePartitions(), [
+            "{0}_2014_07".format(pg.tables['message'])])
+        self.assertEqual(
+            list(pg.iterMessagesByTime(datetime(2014, 1, 1),
+                                       datetime(2015, 1, 1))),
+            [datum for datum in data if datum['post_time'].month == 7])
+
+    def testUnitOfWork(self):
+        """Test grouping writes into units committed a few at a time."""
+        f = codecs.open("{0}/example/board_74.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        datum = bitcointalk.parseBoardPage(html)
+        del datum["topic_ids"]
+        rolledBack = []
+        commitUnitsOriginal = pg.commitUnits
+        commitSecondsOriginal = pg.commitSeconds
+        pg.commitUnits = 2
+        pg.commitSeconds = None
+        try:
+            # Units wait on one another, as seen from another connection
+            with pg.unitOfWork():
+                datum['id'] = 1
+                pg.insertBoard(datum)
+                with pg.unitOfWork():
+                    datum['id'] = 2
+                    pg.insertBoard(datum)
+            self.assertEqual(pg.countPendingUnits, 1)
+            self.assertEqual(list(pg.iterSids('board')), [])
+
+            # A failed unit is rolled back alone
+            with self.assertRaises(ZeroDivisionError):
+                with pg.unitOfWork():
+                    datum['id'] = 3
+                    pg.insertBoard(datum)
+                    pg.onRollback(lambda: rolledBack.append(3))
+                    1 / 0
+            self.assertEqual(rolledBack, [3])
+            self.assertEqual(pg.countPendingUnits, 1)
+
+            with pg.unitOfWork():
+                datum['id'] = 4
+                pg.insertBoard(datum)
+                pg.onRollback(lambda: rolledBack.append(4))
+            self.assertEqual(pg.countPendingUnits, 0)
+            self.assertEqual(sorted(pg.iterSids('board')), [1, 2, 4])
+
+            with pg.unitOfWork():
+                datum['id'] = 5
+                pg.insertBoard(datum)
+            pg.flush()
+            self.assertEqual(sorted(pg.iterSids('board')), [1, 2, 4, 5])
+            self.assertEqual(rolledBack, [3])
+
+            # Units that have waited commitSeconds are committed as the next
+            # opens, before it waits on anything
+            pg.commitSeconds = 60
+            with pg.unitOfWork():
+                datum['id'] = 6
+                pg.insertBoard(datum)
+            self.assertEqual(pg.countPendingUnits, 1)
+            pg.pendingSince -= pg.commitSeconds
+            with pg.unitOfWork():
+                self.assertEqual(
+                    sorted(pg.iterSids('board')), [1, 2, 4, 5, 6])
+                datum['id'] = 7
+                pg.insertBoard(datum)
+            self.assertEqual(pg.countPendingUnits, 1)
+            pg.flush()
+        finally:
+            pg.commitUnits = commitUnitsOriginal
+            pg.commitSeconds = commitSecondsOriginal
+
+    def testRecordChanges(self):
+        """Test recording the rows written that are new or changed."""
+        f = codecs.open("{0}/example/profile_12.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        member = bitcointalk.parseProfile(html, date(2014, 7, 29))
+        f = codecs.open("{0}/example/topic_602041.12400.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        messages = bitcointalk.parseTopicPage(html)['messages'][:3]
+        scratchDir = tempfile.mkdtemp()
+        pg.recordChanges(changes.ChangeFeed(scratchDir))
+        try:
+            self.assertEqual(pg.listenChanges(0), [])
+            pg.insertMember(member)
+            pg.insertMember(member)
+            member['signature'] = "Changed"
+            pg.insertMember(member)
+            pg.insertMessages(messages)
+            messages[0]['content'] = "Edited"
+            pg.insertMessages(messages)
+            # Changes rolled back are left out
+            with self.assertRaises(ZeroDivisionError):
+                with pg.unitOfWork():
+                    pg.insertMember(dict(member, id=13))
+                    1 / 0
+            notified = []
+            while len(notified) < 4:
+                notified.extend(pg.listenChanges(5))
+            self.assertEqual(notified, [(1, 1), (2, 2), (3, 5), (6, 6)])
+
+            feed = list(changes.iterChanges(scratchDir))
+            self.assertEqual([change['seq'] for change in feed], range(1, 7))
+            self.assertEqual(
+                [(change['table'], change['sid'], change['operation'])
+                 for change in feed],
+                [('member', 12, 'insert'), ('member', 12, 'update')] +
+                [('message', message['id'], 'insert')
+                 for message in messages] +
+                [('message', messages[0]['id'], 'update')])
+            self.assertEqual(feed[0]['new']['name'], member['name'])
+            self.assertEqual(feed[1]['old'].keys(), ['signature'])
+            self.assertEqual(feed[1]['new'], {'signature': "Changed"})
+            self.assertEqual(feed[5]['new'], {'content': "Edited"})
+            self.assertEqual(
+                [change['seq'] for change in changes.iterChanges(
+                    scratchDir, 4)], [5, 6])
+        finally:
+            pg.recordChanges(None)
+            shutil.rmtree(scratchDir)
+
+    def testListenChangesFirst(self):
+        """Test listening for changes before any other use of the DB."""
+        settingsOriginal = (pg.pg2, pg.pg2ext, pg.dbcParams, pg.listenConn)
+        # As in a fresh process that only listens
+        pg.pg2 = None
+        pg.pg2ext = None
+        pg.dbcParams = None
+        pg.listenConn = None
+        try:
+            self.assertEqual(pg.listenChanges(0), [])
+        finally:
+            if pg.listenConn is not None:
+                pg.listenConn.close()
+            (pg.pg2, pg.pg2ext, pg.dbcParams,
+             pg.listenConn) = settingsOriginal
+
+    def testRetry(self):
+        """Test queueing failed pages and keeping dead letters."""
+        self.assertEqual(pg.insertRetry('messages', 1, 2, "Error", 0, 60), 1)
+        # Each further failure doubles the wait
+        self.assertEqual(pg.insertRetry('messages', 1, 2, "Error", 0, 60), 2)
+        self.assertEqual(pg.insertRetry('messages', 1, 3, "Error", 60, 600),
+                         1)
+        self.assertEqual(pg.insertRetry('messages', 1, 3, "Error", 60, 600),
+                         2)
+        cur = pg.cursor()
+        cur.execute("""SELECT round(extract(epoch FROM
+                next_attempt_time - db_update_time))
+            FROM {0}
+            WHERE page = 3""".format(pg.tables['retry']))
+        self.assertEqual(cur.fetchone()[0], 120)
+        pg.queueRetries('messages', 1, [2, 4])
+        due = pg.selectDueRetries(10)
+        self.assertEqual([(retry['page'], retry['attempts']) for retry in due],
+                         [(2, 2), (4, 0)])
+        pg.deleteRetry('messages', 1, 2)
+        self.assertEqual(len(pg.selectDueRetries(10)), 1)
+
+        pg.insertDeadLetter('topic', 5, 0, 1, "<html></html>", "Error")
+        # HTML kept is held on to when a later failure has none
+        pg.insertDeadLetter('topic', 5, 0, 8, None, "Timeout")
+        pg.insertDeadLetter('member', 6, 0, 8, None, "Timeout")
+        deadLetters = pg.selectDeadLetters('topic')
+        self.assertEqual(len(deadLetters), 1)
+        self.assertEqual(deadLetters[0]['attempts'], 8)
+        self.assertEqual(deadLetters[0]['html'], "<html></html>")
+        self.assertEqual(deadLetters[0]['traceback'], "Timeout")
+        self.assertEqual(len(pg.selectDeadLetters()), 2)
+
+    def testTopic(self):
+        """Test insert and select topic functions."""
+        f = codecs.open("{0}/example/topic_14.html".format(
+            rootDir), 'r', 'utf-8')
+        html = f.read()
+        f.close()
+        datum = bitcointalk.parseTopicPage(html)
+        del datum['messages']
+        del datum['quotes']
+        pg.insertTopic(datum)
+        # Make sure a second insert doesn't cause problems
+        pg.insertTopic(datum)
+        selectDatum = pg.selectTopic(14)
+        self.assertEqual(datum, selectDatum)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+""" Tests for the pipeline module. """
+import pipeline
+import threading
+import time
+import unittest
+
+
+class PipelineTest(unittest.TestCase):
+
+    """"Testing suite for pipeline module."""
+
+    def testRun(self):
+        """Test passing items through stages."""
+        def double(item):
+            return item * 2
+
+        def drop(item):
+            if item % 4 == 0:
+                return None
+            return item + 1
+        results = []
+        lock = threading.Lock()
+
+        def collect(item):
+            with lock:
+                results.append(item)
+        work = pipeline.Pipeline([
+            pipeline.Stage('double', double, 3),
+            pipeline.Stage('drop', drop, 2),
+            pipeline.Stage('collect', collect)
+        ])
+        work.run(range(10))
+        self.assertEqual(sorted(results), [3, 7, 11, 15, 19])
+        stats = work.stats()
+        self.assertEqual([s['processed'] for s in stats], [10, 10, 5])
+        self.assertEqual(work.failures, [])
+
+    def testFailure(self):
+        """Test that a failing item is dropped on its own."""
+        def check(item):
+            if item == 3:
+                raise Exception("Bad item")
+            return item
+        results = []
+        work = pipeline.Pipeline([
+            pipeline.Stage('check', check),
+            pipeline.Stage('collect', results.append)
+        ])
+        work.run(range(5))
+        self.assertEqual(results, [0, 1, 2, 4])
+        self.assertEqual(len(work.failures), 1)
+        self.assertEqual(work.failures[0][:2], ('check', 3))
+        self.assertEqual(work.stats()[0]['failed'], 1)
+
+    def testBackpressure(self):
+        """Test that a slow stage holds back the ones before it."""
+        def slow(item):
+            time.sleep(0.01)
+        work = pipeline.Pipeline([
+            pipeline.Stage('fast', lambda item: item),
+            pipeline.Stage('slow', slow, queueSize=2)
+        ])
+        work.run(range(20))
+        stats = work.stats()
+        self.assertEqual(stats[1]['processed'], 20)
+        self.assertEqual(stats[1]['max_depth'] <= 2, True)
+        self.assertEqual(stats[0]['blocked_seconds'] > 0, True)
+
+    def testFollowUp(self):
+        """Test stages adding work as they go."""
+        results = []
+
+        def expand(item):
+            if item < 3:
+                work.put(item + 1)
+                work.put(item + 1)
+            return item
+        work = pipeline.Pipeline([
+            pipeline.Stage('expand', expand, 2, queueSize=1),
+            pipeline.Stage('collect', results.append, queueSize=1)
+        ])
+        work.run([0])
+        self.assertEqual(sorted(results), [0, 1, 1, 2, 2, 2, 2,
+                                           3, 3, 3, 3, 3, 3, 3, 3])
+
+    def testIdle(self):
+        """Test that a stage waiting on the ones before it idles."""
+        def slow(item):
+            time.sleep(0.05)
+            return item
+        results = []
+        idled = []
+
+        def idle():
+            idled.append(results[:])
+            raise Exception("Idling costs nothing")
+        waitSecondsOriginal = pipeline.waitSeconds
+        pipeline.waitSeconds = 0.01
+        try:
+            work = pipeline.Pipeline([
+                pipeline.Stage('slow', slow),
+                pipeline.Stage('collect', results.append, idle=idle)
+            ])
+            work.run(range(3))
+        finally:
+            pipeline.waitSeconds = waitSecondsOriginal
+        self.assertEqual(results, [0, 1, 2])
+        self.assertEqual(len(idled) > 0, True)
+        self.assertEqual(work.failures, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+""" Tests for the records module. """
+from datetime import datetime
+import records
+import unittest
+
+
+class RecordsTest(unittest.TestCase):
+
+    """"Testing suite for records module."""
+
+    def testDictView(self):
+        """Test that records read and write like dicts."""
+        message = records.Message(id=53L, topic=14, member=3)
+        message['subject'] = 'Re: Break on the supply\'s increase'
+        self.assertEqual(message['id'], 53L)
+        self.assertEqual(message.get('post_time'), None)
+        self.assertEqual('post_time' in message, False)
+        self.assertEqual(sorted(message.keys()),
+                         ['id', 'member', 'subject', 'topic'])
+        self.assertRaises(KeyError, message.__getitem__, 'post_time')
+        self.assertRaises(KeyError, message.__getitem__, 'keys')
+        self.assertRaises(KeyError, message.__setitem__, 'board', 7)
+        self.assertEqual(message.pop('member'), 3)
+        self.assertEqual(message.pop('member', None), None)
+        del message['subject']
+        self.assertRaises(KeyError, message.__delitem__, 'subject')
+        self.assertEqual(message, {'id': 53L, 'topic': 14})
+        self.assertEqual({'id': 53L, 'topic': 14}, message)
+        self.assertNotEqual(message, {'id': 53L})
+        self.assertEqual(dict(message), {'id': 53L, 'topic': 14})
+
+    def testRow(self):
+        """Test that records give up their columns as row tuples."""
+        postTime = datetime(2009, 11, 22, 18, 53, 53)
+        topic = records.Topic(
+            id=14, name='Break', board=7, num_pages=1, count_read=3058,
+            messages=[records.Message(id=53L, topic=14, post_time=postTime)])
+        self.assertEqual(topic.row(), (14, 'Break', 7, 1, 3058))
+        self.assertEqual(topic['messages'][0].row(('id', 'post_time')),
+                         (53L, postTime))
+        self.assertEqual(topic['messages'][0].row()[2], None)
+        self.assertRaises(AttributeError, setattr, topic, 'extra', 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+""" Tests for the replay_server module. """
+import bitcointalk
+import replay_server
+import unittest
+
+
+class ReplayServerTest(unittest.TestCase):
+
+    """"Testing suite for replay_server module."""
+
+    def setUp(self):
+        """Start a server for the test."""
+        self.server, url = replay_server.start()
+        self.requestUrlOriginal = bitcointalk.requestUrl
+        self.interReqTimeOriginal = bitcointalk.interReqTime
+        bitcointalk.requestUrl = url
+        bitcointalk.interReqTime = 0
+
+    def tearDown(self):
+        """Stop the server and restore settings."""
+        self.server.shutdown()
+        self.server.server_close()
+        bitcointalk.requestUrl = self.requestUrlOriginal
+        bitcointalk.interReqTime = self.interReqTimeOriginal
+        replay_server.errorRate = 0.0
+
+    def testExamples(self):
+        """Test that example pages are served as saved."""
+        html = bitcointalk.requestTopicPage(14)
+        self.assertEqual(html, replay_server._readExample("topic_14.html"))
+        data = bitcointalk.parseProfile(
+            bitcointalk.requestProfile(12))
+        self.assertEqual(data['name'], 'nanaimogold')
+
+    def testGenerated(self):
+        """Test that other IDs are served from rewritten examples."""
+        data = bitcointalk.parseTopicPage(
+            bitcointalk.requestTopicPage(1234, 40))
+        self.assertEqual(data['id'], 1234)
+        self.assertEqual(len(data['messages']), 8)
+        messageIds = [m['id'] for m in data['messages']]
+        self.assertEqual(len(set(messageIds)), 8)
+        self.assertEqual(messageIds[0] // 100000, 1234)
+        data = bitcointalk.parseBoardPage(
+            bitcointalk.requestBoardPage(9))
+        self.assertEqual(data['id'], 9)
+        data = bitcointalk.parseProfile(
+            bitcointalk.requestProfile(77))
+        self.assertEqual(data['id'], 77)
+
+    def testErrors(self):
+        """Test injected errors."""
+        replay_server.errorRate = 1.0
+        self.assertRaises(
+            Exception, bitcointalk.requestProfile, 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+""" Tests for the scheduler module. """
+import bitcointalk
+from datetime import datetime
+from datetime import timedelta
+import memoizer
+import pg
+import replay_server
+import scheduler
+import shutil
+import synthetic
+import tempfile
+import unittest
+
+
+class SchedulerTest(unittest.TestCase):
+
+    """"Testing suite for scheduler module."""
+
+    def setUp(self):
+        """Setup tables for test."""
+        # Swap and sub tables
+        self.tablesOriginal = pg.tables
+        pg.tables = {}
+        for key, table in self.tablesOriginal.iteritems():
+            pg.tables[key] = "{0}_test".format(table)
+
+        # Create test tables
+        cur = pg.cursor()
+        for key, table in pg.tables.iteritems():
+            cur.execute("""CREATE TABLE IF NOT EXISTS
+                {0} (LIKE {1} INCLUDING ALL)""".format(
+                table, self.tablesOriginal[key]))
+        cur.execute("""COMMIT""")
+
+    def tearDown(self):
+        """Teardown tables for test."""
+        cur = pg.cursor()
+        for table in pg.tables.values():
+            cur.execute("""DROP TABLE IF EXISTS
+                {0}""".format(table))
+        cur.execute("""COMMIT""")
+        pg.tables = self.tablesOriginal
+
+    def _observe(self, topicId, numPages, countRead, observeTime):
+        """Record a topic observation at a given time."""
+        cur = pg.cursor()
+        cur.execute("""INSERT INTO {0}
+            (entity, sid, num_pages, count_read, observe_time)
+            VALUES ('topic', %s, %s, %s,
+                %s::timestamp AT TIME ZONE 'UTC')""".format(
+            pg.tables['observation']),
+            (topicId, numPages, countRead, observeTime))
+        cur.execute("""COMMIT""")
+
+    def testScore(self):
+        """Test the priority function."""
+        now = datetime(2014, 8, 1)
+        dead = {
+            'num_pages': 1,
+            'count_read': 100,
+            'db_update_time': now - timedelta(hours=10),
+            'previous_num_pages': 1,
+            'previous_count_read': 100,
+            'previous_observe_time': now - timedelta(hours=20)
+        }
+        hot = dict(dead)
+        hot['num_pages'] = 11
+        self.assertEqual(scheduler.score('topic', dead, now), 10.0)
+        self.assertEqual(scheduler.score('topic', hot, now) > 10.0, True)
+        self.assertEqual(
+            scheduler.score('topic', dead, now - timedelta(hours=10)), 0)
+
+    def testPrioritize(self):
+        """Test ordering stored topics by priority."""
+        for topicId in [1, 2]:
+            datum = {
+                'id': topicId,
+                'name': 'Topic',
+                'board': 1,
+                'num_pages': 1,
+                'count_read': 10
+            }
+            pg.insertTopic(datum)
+            # Topic 2 grows between scrapes
+            if topicId == 2:
+                datum['num_pages'] = 5
+            pg.insertTopic(datum)
+        cur = pg.cursor()
+        cur.execute("""UPDATE {0}
+            SET observe_time = observe_time - interval '1 hour'
+            WHERE observe_time < (SELECT max(observe_time) FROM {0})
+            OR sid = 1""".format(pg.tables['observation']))
+        cur.execute("""COMMIT""")
+        now = datetime.utcnow() + timedelta(hours=1)
+        work = scheduler.prioritize(['topic'], 10, now)
+        self.assertEqual([entityId for p, e, entityId, n in work], [2, 1])
+        self.assertEqual(work[0][3], 5)
+        self.assertEqual(len(scheduler.prioritize(['topic'], 1, now)), 1)
+
+    def testPrioritizeMembers(self):
+        """Test that only profiles due a refresh are picked."""
+        now = datetime(2014, 8, 1)
+        lastActive = now - timedelta(days=3)
+        cur = pg.cursor()
+        hours = [timedelta(hours=hour) for hour in [8, 5, 2]]
+        for memberId, position, scraped, posted in [
+                # Posted over a few hours since the profile was scraped
+                (1, 'Legendary', timedelta(days=2), hours),
+                # Quiet
+                (2, 'Legendary', timedelta(days=2), [timedelta(days=3)]),
+                # Past the time to live of its position
+                (3, 'Newbie', timedelta(days=20), [timedelta(days=3)]),
+                # Posted, but still posting
+                (4, 'Legendary', timedelta(days=2),
+                 hours + [timedelta(minutes=10)]),
+                # Past the default time to live
+                (5, 'Staff', timedelta(days=100), None)]:
+            cur.execute("""INSERT INTO {0}
+                (sid, position, last_active, db_update_time)
+                VALUES (%s, %s, %s,
+                    %s::timestamp AT TIME ZONE 'UTC')""".format(
+                pg.tables['member']),
+                (memberId, position, lastActive, now - scraped))
+            if posted is not None:
+                cur.execute("""INSERT INTO {0}
+                    (member, num_posts, first_post_time, last_post_time)
+                    VALUES (%s, %s, %s, %s)""".format(
+                    pg.tables['member_activity']),
+                    (memberId, len(posted), now - max(posted),
+                     now - min(posted)))
+        cur.execute("""COMMIT""")
+        stale = dict((member['sid'], member['changed'])
+                     for member in pg.iterStaleMembers(
+                         scheduler.memberTtlDays,
+                         scheduler.defaultMemberTtlDays,
+                         scheduler.memberSettleHours, now))
+        self.assertEqual(stale, {1: True, 3: False, 5: False})
+        work = scheduler.prioritize(['member'], 10, now)
+        self.assertEqual([entityId for p, e, entityId, n in work], [5, 3, 1])
+        self.assertEqual(work[2][0], 0.2 * 5.0 * 48)
+
+    def testSimulate(self):
+        """Test that a replay favours the growing topic."""
+        start = datetime(2014, 8, 1)
+        for topicId in range(1, 6):
+            self._observe(topicId, 1, 10, start - timedelta(hours=2))
+        self._observe(5, 2, 20, start - timedelta(hours=1))
+        for hour in range(24):
+            self._observe(
+                5, 3 + hour, 30 + hour, start + timedelta(hours=hour))
+        stop = start + timedelta(hours=24)
+        prioritizedStats = scheduler.simulate(start, stop, 2, True)
+        sequentialStats = scheduler.simulate(start, stop, 2, False)
+        self.assertEqual(
+            prioritizedStats['pages_gained'] >
+            sequentialStats['pages_gained'], True)
+        self.assertEqual(
+            prioritizedStats['pages_stale'] <
+            sequentialStats['pages_stale'], True)
+
+    def testDiscover(self):
+        """Test polling the latest posts for new and changed topics."""
+        server, url = replay_server.start()
+        settingsOriginal = (
+            bitcointalk.requestUrl, bitcointalk.interReqTime,
+            replay_server.pageSource, memoizer.dataDir, memoizer.memo,
+            scheduler.maxRecentPages)
+        bitcointalk.requestUrl = url
+        bitcointalk.interReqTime = 0
+        replay_server.pageSource = synthetic.page
+        memoizer.dataDir = tempfile.mkdtemp()
+        memoizer.memo = {
+            'boards': set(),
+            'members': set(),
+            'topics': set()
+        }
+        scheduler.maxRecentPages = 1
+        scheduler.lastPollTime = None
+        try:
+            # Two of the three pages of the latest topic are stored
+            memoizer.scrapeTopic(synthetic.numTopics)
+            memoizer.scrapeMessages(synthetic.numTopics, 2)
+            lastIds = [topicId for topicId, messageId in
+                       synthetic.recentPage(1)[1]]
+            scheduler.run(1000, entities=())
+            lastMessages = pg.selectLastMessages(lastIds)
+            for topicId in lastIds:
+                self.assertEqual(
+                    lastMessages[topicId]['topic_position'],
+                    synthetic.messagesPerTopic)
+            self.assertEqual(scheduler.discovered, [])
+            self.assertEqual(scheduler.changed, [])
+
+            # Polls come every pollSeconds, and cost a request when quiet
+            self.assertEqual(scheduler.run(1000, entities=()), 0)
+            scheduler.lastPollTime = None
+            self.assertEqual(scheduler.run(1000, entities=()), 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(memoizer.dataDir)
+            (bitcointalk.requestUrl, bitcointalk.interReqTime,
+             replay_server.pageSource, memoizer.dataDir, memoizer.memo,
+             scheduler.maxRecentPages) = settingsOriginal
+            scheduler.lastPollTime = None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+""" Tests for the sidindex module. """
+import os
+import shutil
+import sidindex
+import tempfile
+import unittest
+
+
+class SidIndexTest(unittest.TestCase):
+
+    """"Testing suite for sidindex module."""
+
+    def setUp(self):
+        """Make a directory for index files."""
+        self.scratchDir = tempfile.mkdtemp()
+        self.path = "{0}/ids.idx".format(self.scratchDir)
+        self.compactSizeOriginal = sidindex.compactSize
+
+    def tearDown(self):
+        """Remove the index files."""
+        sidindex.compactSize = self.compactSizeOriginal
+        shutil.rmtree(self.scratchDir)
+
+    def testAdd(self):
+        """Test adding IDs, and seeing them from another index."""
+        index = sidindex.SidIndex(self.path)
+        other = sidindex.SidIndex(self.path)
+        index.add(5)
+        index.add(3)
+        self.assertIn(5, index)
+        self.assertNotIn(5, other)
+        index.discard(3)
+        index.flush()
+        self.assertIn(5, other)
+        self.assertNotIn(3, other)
+        self.assertEqual(list(other), [5])
+        index.close()
+        other.close()
+
+    def testCompact(self):
+        """Test merging appended IDs into the sorted ones."""
+        sidindex.compactSize = 4
+        index = sidindex.SidIndex(self.path)
+        other = sidindex.SidIndex(self.path)
+        for sids in [[9, 1], [4, 1], [7], [2]]:
+            for sid in sids:
+                index.add(sid)
+            index.flush()
+        self.assertEqual(index.numSorted, 4)
+        self.assertEqual(index.appended, set([2]))
+        self.assertEqual(list(index), [1, 4, 7, 9, 2])
+        self.assertEqual(sorted(other), [1, 2, 4, 7, 9])
+        for sid in range(10):
+            self.assertEqual(sid in other, sid in [1, 2, 4, 7, 9])
+        self.assertEqual(sorted(os.listdir(self.scratchDir)),
+                         ["ids.idx", "ids.idx.lock"])
+        index.close()
+        other.close()
+
+    def testWatermark(self):
+        """Test keeping the time read up to across opens."""
+        index = sidindex.SidIndex(self.path)
+        self.assertEqual(index.watermark, 0)
+        index.setWatermark(1400000000.5)
+        index.close()
+        index = sidindex.SidIndex(self.path)
+        self.assertEqual(index.watermark, 1400000000.5)
+        index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+""" Tests for the synthetic module. """
+import bitcointalk
+import synthetic
+import unittest
+
+
+class SyntheticTest(unittest.TestCase):
+
+    """"Testing suite for synthetic module."""
+
+    def setUp(self):
+        """Save the corpus settings."""
+        self.settingsOriginal = (
+            synthetic.messagesPerTopic, synthetic.quoteDepth,
+            synthetic.bodySize)
+
+    def tearDown(self):
+        """Restore the corpus settings."""
+        (synthetic.messagesPerTopic, synthetic.quoteDepth,
+         synthetic.bodySize) = self.settingsOriginal
+
+    def testTopicPage(self):
+        """Test that parsed topic pages match the expected output."""
+        for topicId in [1, 7, 999]:
+            for pageNum in [1, 3]:
+                html, expected = synthetic.topicPage(topicId, pageNum)
+                self.assertEqual(bitcointalk.parseTopicPage(html), expected)
+
+    def testLargeTopicPage(self):
+        """Test a full-topic page with deep quote chains."""
+        synthetic.messagesPerTopic = 2000
+        synthetic.quoteDepth = 20
+        synthetic.bodySize = 2000
+        html, expected = synthetic.topicPage(42, 50)
+        self.assertEqual(bitcointalk.parseTopicPage(html), expected)
+        self.assertEqual(expected['num_pages'], 100)
+
+    def testBoardPage(self):
+        """Test that parsed board pages match the expected output."""
+        for boardId in [1, 3, 10]:
+            for pageNum in [1, 2]:
+                html, expected = synthetic.boardPage(boardId, pageNum)
+                self.assertEqual(bitcointalk.parseBoardPage(html), expected)
+
+    def testBoardActivity(self):
+        """Test that the last posts parsed from board pages are the last
+        messages of each topic."""
+        html, expected = synthetic.boardPage(3, 2)
+        self.assertEqual(
+            bitcointalk.parseBoardActivity(html),
+            [(topicId, synthetic._messageId(
+                topicId, synthetic.messagesPerTopic))
+             for topicId in expected['topic_ids']])
+
+    def testRecentPage(self):
+        """Test that parsed pages of the latest posts match the expected
+        output."""
+        for pageNum in [1, 2, 50]:
+            html, expected = synthetic.recentPage(pageNum)
+            self.assertEqual(bitcointalk.parseRecentPosts(html), expected)
+            self.assertEqual(len(expected), synthetic.postsPerRecentPage // 2)
+
+    def testProfile(self):
+        """Test that parsed profiles match the expected output."""
+        for memberId in range(1, 30):
+            html, expected = synthetic.profile(memberId)
+            self.assertEqual(bitcointalk.parseProfile(html), expected)
+
+    def testPage(self):
+        """Test serving pages by request payload."""
+        self.assertEqual(
+            synthetic.page("topic=5.20"), synthetic.topicPage(5, 2)[0])
+        self.assertEqual(
+            synthetic.page("board=2.40"), synthetic.boardPage(2, 2)[0])
+        self.assertEqual(
+            synthetic.page("action=profile;u=3"), synthetic.profile(3)[0])
+        self.assertEqual(
+            synthetic.page("action=recent;start=10"),
+            synthetic.recentPage(2)[0])
+        self.assertEqual(synthetic.page("topic=0.0"), None)
+
+
+if __name__ == "__main__":
+    unittest.main()